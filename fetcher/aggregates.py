@@ -0,0 +1,20 @@
+from django.db.models import Aggregate, FloatField
+
+
+class Percentile(Aggregate):
+    """Continuous percentile of an expression, interpolated between values.
+
+    Only supported on PostgreSQL.
+    """
+    function = "PERCENTILE_CONT"
+    name = "Percentile"
+    template = "%(function)s(%(percentile)s) WITHIN GROUP (ORDER BY %(expressions)s)"
+
+    def __init__(self, expression, percentile, **extra):
+        if not 0 <= percentile <= 1:
+            raise ValueError("percentile must be between 0 and 1")
+        super().__init__(expression, percentile=float(percentile), **extra)
+
+    def _resolve_output_field(self):
+        output_field = super()._resolve_output_field()
+        return output_field if output_field is not None else FloatField()
@@ -0,0 +1,157 @@
+import gc
+import platform
+import resource
+import threading
+import time
+
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from transformer.benchmarks import git_revision
+
+from .fakes import FakeSourceServer, SyntheticRepository
+from .fetchers import ArchivesSpaceDataFetcher, CartographerDataFetcher
+from .models import FetchRun
+
+FETCHERS = [
+    (ArchivesSpaceDataFetcher, FetchRun.ARCHIVESSPACE_OBJECT_TYPE_CHOICES),
+    (CartographerDataFetcher, FetchRun.CARTOGRAPHER_OBJECT_TYPE_CHOICES),
+]
+# Metrics compared with baselines, and whether higher values are better.
+METRICS = {
+    "records_per_second": True,
+    "http_calls_per_record": False,
+    "queries_per_record": False,
+    "peak_rss_kb": False,
+}
+
+
+class QueryCounter:
+    """Counts database queries made from any thread while in use as a context manager.
+
+    Each thread has its own database connection, so the counter is added to
+    the current connection and to connections opened by other threads.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, sender=None, connection=connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def __enter__(self):
+        connection_created.connect(self.install)
+        self.install()
+        return self
+
+    def __exit__(self, *args):
+        connection_created.disconnect(self.install)
+        if self in connection.execute_wrappers:
+            connection.execute_wrappers.remove(self)
+
+
+def benchmark_fetch(fetcher, object_type, server):
+    """Fetches updated records of an object type from a FakeSourceServer.
+
+    Peak RSS is the peak for the process at the end of the run, so it
+    includes memory used by previous runs in the same process.
+    """
+    requests_before = server.request_count()
+    gc.collect()
+    with QueryCounter() as queries:
+        start = time.perf_counter()
+        processed = fetcher().fetch("updated", object_type)
+        elapsed = time.perf_counter() - start
+    run = FetchRun.objects.filter(source=fetcher.source, object_type=object_type, object_status="updated").latest("start_time")
+    http_calls = server.request_count() - requests_before
+    return {
+        "records": processed,
+        "errors": run.error_count,
+        "seconds": round(elapsed, 6),
+        "records_per_second": round(processed / elapsed, 3) if elapsed else None,
+        "http_calls": http_calls,
+        "http_calls_per_record": round(http_calls / processed, 3) if processed else None,
+        "queries": queries.count,
+        "queries_per_record": round(queries.count / processed, 3) if processed else None,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def run_pipeline_benchmark(size, depth=3, breadth=5, latency=0, object_types=None):
+    """Benchmarks fetch runs for each object type against a synthetic local source.
+
+    Fetched records are merged, transformed and saved to the configured
+    database, so this should not be run against a production database.
+
+    Args:
+        size (int): number of records of each object type.
+        depth (int): maximum number of levels of archival objects below a resource.
+        breadth (int): number of children of each archival object with children.
+        latency (float): seconds the source waits before responding to each request.
+        object_types (list): optional list of object types to benchmark.
+
+    Returns:
+        dict: machine-readable results.
+    """
+    repository = SyntheticRepository(size=size, depth=depth, breadth=breadth)
+    server = FakeSourceServer(("127.0.0.1", 0), repository, latency).start()
+    results = {}
+    try:
+        with override_settings(**server.source_settings(), NOTIFY_EMAIL=False, NOTIFY_TEAMS=False):
+            for fetcher, object_type_choices in FETCHERS:
+                for object_type, _ in object_type_choices:
+                    if object_types and object_type not in object_types:
+                        continue
+                    results[object_type] = benchmark_fetch(fetcher, object_type, server)
+    finally:
+        server.stop()
+    return {
+        "metadata": {
+            "size": size,
+            "depth": depth,
+            "breadth": breadth,
+            "latency": latency,
+            "python": platform.python_version(),
+            "revision": git_revision(),
+            "timestamp": timezone.now().isoformat(),
+        },
+        "object_types": results,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def compare_to_baseline(results, baseline, threshold):
+    """Compares pipeline benchmark results with a baseline.
+
+    Args:
+        results (dict): results of run_pipeline_benchmark.
+        baseline (dict): baseline results of run_pipeline_benchmark.
+        threshold (float): fraction by which a metric may be worse than the
+            baseline before it is considered a regression.
+
+    Returns:
+        list: descriptions of metrics which regressed.
+    """
+    regressions = []
+    for object_type, metrics in sorted(results["object_types"].items()):
+        baseline_metrics = baseline.get("object_types", {}).get(object_type)
+        if not baseline_metrics:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            value, expected = metrics.get(metric), baseline_metrics.get(metric)
+            if value is None or not expected:
+                continue
+            change = (value - expected) / expected
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append("{} {}: {} compared to baseline of {} ({:+.1%})".format(
+                    object_type, metric, value, expected, change))
+    return regressions
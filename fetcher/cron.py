@@ -1,9 +1,13 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from subprocess import CalledProcessError, check_output
 
+from django.conf import settings
+from django.utils import timezone
 from django_cron import CronJobBase, Schedule
 
-from .fetchers import ArchivesSpaceDataFetcher, CartographerDataFetcher
+from .fetchers import (ArchivesSpaceDataFetcher,
+                       ArchivesSpaceDeleteFeedConsumer,
+                       CartographerDataFetcher)
 from .models import FetchRun
 
 
@@ -29,7 +33,10 @@ class BaseCron(CronJobBase):
         source = [s[1] for s in FetchRun.SOURCE_CHOICES if s[0] == self.fetcher.source][0]
         print("Export of {} {} records from {} started at {}".format(
             self.object_status, self.object_type, source, start))
-        out = self.fetcher().fetch(self.object_status, self.object_type)
+        out = self.fetcher().fetch(
+            self.object_status, self.object_type,
+            profile=self.code in settings.FETCH_PROFILE_JOBS,
+            trace=self.code in settings.FETCH_TRACE_JOBS)
         end = datetime.now()
         fetch_run = FetchRun.objects.filter(
             status=FetchRun.FINISHED,
@@ -41,15 +48,29 @@ class BaseCron(CronJobBase):
             print("{} errors".format(fetch_run.error_count))
             for e in fetch_run.errors:
                 print("    {}".format(e.message))
+        for stage, timing in fetch_run.stats.get("stages", {}).items():
+            if not stage.startswith("http"):
+                print("    {}: {} in {}s, p95 {}s".format(stage, timing["count"], timing["total"], timing["p95"]))
         print("Export of {} {} records from {} complete at {}\n".format(
             self.object_status, self.object_type, source, end))
 
 
-class DeletedArchivesSpacePeople(BaseCron):
-    code = "fetcher.deleted_archivesspace_people"
-    object_status = "deleted"
-    object_type = "agent_person"
-    fetcher = ArchivesSpaceDataFetcher
+class DeletedArchivesSpaceRecords(BaseCron):
+    """Reads the ArchivesSpace delete-feed once for all object types."""
+    code = "fetcher.deleted_archivesspace_records"
+
+    def do(self):
+        if self.is_running():
+            return
+        start = datetime.now()
+        print("Export of deleted records from ArchivesSpace started at {}".format(start))
+        runs = ArchivesSpaceDeleteFeedConsumer().consume()
+        end = datetime.now()
+        for object_type, fetch_run in runs.items():
+            print("{} deleted {} records processed".format(fetch_run.processed, object_type))
+            for e in fetch_run.errors:
+                print("    {}".format(e.message))
+        print("Export of deleted records from ArchivesSpace complete at {}\n".format(end))
 
 
 class UpdatedArchivesSpacePeople(BaseCron):
@@ -59,13 +80,6 @@ class UpdatedArchivesSpacePeople(BaseCron):
     fetcher = ArchivesSpaceDataFetcher
 
 
-class DeletedArchivesSpaceOrganizations(BaseCron):
-    code = "fetcher.deleted_archivesspace_organizations"
-    object_status = "deleted"
-    object_type = "agent_corporate_entity"
-    fetcher = ArchivesSpaceDataFetcher
-
-
 class UpdatedArchivesSpaceOrganizations(BaseCron):
     code = "fetcher.updated_archivesspace_organizations"
     object_status = "updated"
@@ -73,13 +87,6 @@ class UpdatedArchivesSpaceOrganizations(BaseCron):
     fetcher = ArchivesSpaceDataFetcher
 
 
-class DeletedArchivesSpaceFamilies(BaseCron):
-    code = "fetcher.deleted_archivesspace_families"
-    object_status = "deleted"
-    object_type = "agent_family"
-    fetcher = ArchivesSpaceDataFetcher
-
-
 class UpdatedArchivesSpaceFamilies(BaseCron):
     code = "fetcher.updated_archivesspace_families"
     object_status = "updated"
@@ -87,13 +94,6 @@ class UpdatedArchivesSpaceFamilies(BaseCron):
     fetcher = ArchivesSpaceDataFetcher
 
 
-class DeletedArchivesSpaceSubjects(BaseCron):
-    code = "fetcher.deleted_archivesspace_subjects"
-    object_status = "deleted"
-    object_type = "subject"
-    fetcher = ArchivesSpaceDataFetcher
-
-
 class UpdatedArchivesSpaceSubjects(BaseCron):
     code = "fetcher.updated_archivesspace_subjects"
     object_status = "updated"
@@ -101,13 +101,6 @@ class UpdatedArchivesSpaceSubjects(BaseCron):
     fetcher = ArchivesSpaceDataFetcher
 
 
-class DeletedArchivesSpaceResources(BaseCron):
-    code = "fetcher.deleted_archivesspace_resources"
-    object_status = "deleted"
-    object_type = "resource"
-    fetcher = ArchivesSpaceDataFetcher
-
-
 class UpdatedArchivesSpaceResources(BaseCron):
     code = "fetcher.updated_archivesspace_resources"
     object_status = "updated"
@@ -115,13 +108,6 @@ class UpdatedArchivesSpaceResources(BaseCron):
     fetcher = ArchivesSpaceDataFetcher
 
 
-class DeletedArchivesSpaceArchivalObjects(BaseCron):
-    code = "fetcher.deleted_archivesspace_archival_objects"
-    object_status = "deleted"
-    object_type = "archival_object"
-    fetcher = ArchivesSpaceDataFetcher
-
-
 class UpdatedArchivesSpaceArchivalObjects(BaseCron):
     code = "fetcher.updated_archivesspace_archival_objects"
     object_status = "updated"
@@ -137,20 +123,28 @@ class UpdatedCartographerArrangementMapComponents(BaseCron):
 
 
 class CleanUpCompleted(CronJobBase):
+    """Deletes finished FetchRuns without errors older than FETCH_RUN_RETENTION_DAYS.
+
+    The latest of these runs for each object type and status is always kept. Runs within the retention
+    window are kept so that FetchRun statistics can show trends.
+    """
     code = "fetcher.cleanup_completed"
     RUN_EVERY_MINS = 0
     schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
 
     def do(self):
         try:
+            cutoff = timezone.now() - timedelta(days=settings.FETCH_RUN_RETENTION_DAYS)
             for obj_type, _ in FetchRun.OBJECT_TYPE_CHOICES:
                 for obj_status, _ in FetchRun.OBJECT_STATUS_CHOICES:
-                    delete_ids = FetchRun.objects.filter(
+                    finished = FetchRun.objects.filter(
                         object_type=obj_type,
                         object_status=obj_status,
                         status=FetchRun.FINISHED,
-                        fetchrunerror__isnull=True).order_by("-end_time")[1:].values_list("id", flat=True)
-                    FetchRun.objects.filter(pk__in=list(delete_ids)).delete()
+                        fetchrunerror__isnull=True)
+                    latest = list(finished.order_by("-end_time").values_list("id", flat=True)[:1])
+                    delete_ids = list(finished.filter(end_time__lt=cutoff).exclude(pk__in=latest).values_list("id", flat=True))
+                    FetchRun.objects.filter(pk__in=delete_ids).delete()
                     print("{} {} FetchRun objects deleted".format(len(delete_ids), obj_type))
         except Exception as e:
             print("Error cleaning  up completed FetchRun objects: {}".format(e))
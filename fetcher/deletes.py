@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import Counter
+
+import requests
+from django.conf import settings
+from django.db import transaction
+
+from transformer.models import DataObject, DataObjectChange
+
+from .helpers import identifier_from_uri
+
+# Responses with these status codes are retried, as are connection errors and timeouts.
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class DeleteError(Exception):
+    pass
+
+
+class DeletePropagator:
+    """Propagates deletions of source records to the index and to DataObjects.
+
+    URIs are buffered as they are discovered and sent in chunks. Only
+    identifiers which belong to an existing DataObject are sent, since others
+    were never exported. Once the index has accepted a chunk, the matching
+    DataObjects are deleted and the deletions recorded as DataObjectChanges.
+
+    `add` and `flush` are called from the event loop, and `send` from
+    executor threads.
+    """
+
+    def __init__(self, chunk_size=None, retries=None, backoff=None):
+        self.chunk_size = chunk_size or settings.DELETE_CHUNK_SIZE
+        self.retries = settings.DELETE_RETRIES if retries is None else retries
+        self.backoff = settings.DELETE_BACKOFF if backoff is None else backoff
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.seen = set()
+        self.counts = Counter()
+
+    def add(self, uri):
+        """Buffers a URI, returning a chunk of URIs to send once the buffer is full."""
+        with self.lock:
+            if uri in self.seen:
+                return None
+            self.seen.add(uri)
+            self.buffer.append(uri)
+            if len(self.buffer) < self.chunk_size:
+                return None
+            chunk, self.buffer = self.buffer, []
+            return chunk
+
+    def flush(self):
+        """Returns any buffered URIs which have not been sent."""
+        with self.lock:
+            chunk, self.buffer = self.buffer, []
+            return chunk
+
+    def increment(self, counter, count=1):
+        with self.lock:
+            self.counts[counter] += count
+
+    def send(self, uris):
+        """Deletes a chunk of URIs from the index and from DataObjects.
+
+        Returns:
+            list: identifiers of deleted DataObjects.
+        """
+        if not uris:
+            return []
+        self.increment("discovered", len(uris))
+        es_ids = [identifier_from_uri(uri) for uri in uris]
+        existing = list(DataObject.objects.filter(es_id__in=es_ids).values_list("es_id", "object_type"))
+        self.increment("not_exported", len(es_ids) - len(existing))
+        if not existing:
+            return []
+        identifiers = [es_id for es_id, _ in existing]
+        try:
+            self.post(identifiers)
+        except DeleteError:
+            self.increment("failed", len(identifiers))
+            raise
+        self.increment("sent", len(identifiers))
+        with transaction.atomic():
+            deleted = DataObject.objects.filter(es_id__in=identifiers).delete()[0]
+            DataObjectChange.record(DataObjectChange.DELETED, existing)
+        self.increment("deleted", deleted)
+        return identifiers
+
+    def post(self, identifiers):
+        """Sends identifiers to INDEX_DELETE_URL, retrying with exponential backoff."""
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.increment("retries")
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            self.increment("requests")
+            try:
+                resp = requests.post(settings.INDEX_DELETE_URL, json={"identifiers": identifiers})
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = e
+                continue
+            if resp.status_code in RETRY_STATUS_CODES:
+                error = "{} response".format(resp.status_code)
+                continue
+            try:
+                resp.raise_for_status()
+            except requests.exceptions.HTTPError as e:
+                try:
+                    detail = resp.json()["detail"]
+                except (KeyError, TypeError, ValueError):
+                    detail = e
+                raise DeleteError("Error sending delete request: {}".format(detail))
+            return resp
+        raise DeleteError("Error sending delete request after {} attempts: {}".format(self.retries + 1, error))
+
+    def summary(self):
+        with self.lock:
+            return {counter: self.counts[counter] for counter in [
+                "discovered", "not_exported", "sent", "deleted", "failed", "requests", "retries"]}
@@ -0,0 +1,505 @@
+"""Fake ArchivesSpace and Cartographer servers for load testing.
+
+A SyntheticRepository generates records from the merger fixtures, with
+archival objects arranged in trees of a configurable depth and breadth below
+resources. A FakeSourceServer serves the repository over HTTP, implementing
+the ArchivesSpace and Cartographer endpoints which Pisces uses, so that fetch
+runs can be load tested without access to either service.
+"""
+
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from django.conf import settings
+
+from .instrumentation import endpoint_family
+
+FIXTURE_DIR = os.path.join(settings.BASE_DIR, "fixtures", "merger")
+ASPACE_OBJECT_TYPES = {
+    "resource": "/repositories/{repo}/resources",
+    "archival_object": "/repositories/{repo}/archival_objects",
+    "subject": "/subjects",
+    "agent_person": "/agents/people",
+    "agent_corporate_entity": "/agents/corporate_entities",
+    "agent_family": "/agents/families",
+}
+CARTOGRAPHER_ENDPOINT = "/api/components/"
+
+
+class SyntheticRepository:
+    """Generates ArchivesSpace and Cartographer records from fixtures.
+
+    Records are generated when they are requested, so large repositories do
+    not need to be held in memory.
+
+    Args:
+        size (int): number of records of each object type.
+        depth (int): maximum number of levels of archival objects below a resource.
+        breadth (int): number of children of each archival object with children.
+        deleted (int): number of deleted records of each object type listed in delete feeds.
+        repo (int): ArchivesSpace repository identifier.
+        waypoint_size (int): number of children in each page of a resource tree.
+    """
+
+    def __init__(self, size=100, depth=3, breadth=5, deleted=0, repo=2, waypoint_size=200):
+        self.size = size
+        self.depth = depth
+        self.breadth = breadth
+        self.deleted = deleted
+        self.repo = repo
+        self.waypoint_size = waypoint_size
+        self.tree_size = sum(breadth ** level for level in range(1, depth + 1))
+        self.templates = {}
+
+    def get_templates(self, fixture_type):
+        if fixture_type not in self.templates:
+            directory = os.path.join(FIXTURE_DIR, fixture_type)
+            templates = []
+            for filename in sorted(os.listdir(directory)):
+                with open(os.path.join(directory, filename)) as f:
+                    templates.append(f.read())
+            self.templates[fixture_type] = templates
+        return self.templates[fixture_type]
+
+    def template(self, fixture_type, identifier):
+        """Returns a new copy of a fixture, so records can be changed without affecting others."""
+        templates = self.get_templates(fixture_type)
+        return json.loads(templates[identifier % len(templates)])
+
+    def endpoint(self, object_type):
+        return ASPACE_OBJECT_TYPES[object_type].format(repo=self.repo)
+
+    def uri(self, object_type, identifier):
+        return "{}/{}".format(self.endpoint(object_type), identifier)
+
+    def ids(self, object_type):
+        return list(range(1, self.size + 1))
+
+    def parse_uri(self, uri):
+        """Returns the object type and identifier of an ArchivesSpace URI, or (None, None)."""
+        endpoint, _, identifier = uri.rstrip("/").rpartition("/")
+        for object_type in ASPACE_OBJECT_TYPES:
+            if self.endpoint(object_type) == endpoint and identifier.isdigit():
+                return object_type, int(identifier)
+        return None, None
+
+    def record(self, object_type, identifier):
+        """Returns an ArchivesSpace record, or None if it does not exist."""
+        if not 1 <= identifier <= self.size:
+            return None
+        if object_type == "archival_object":
+            return self.archival_object(identifier)
+        if object_type == "resource":
+            return self.resource(identifier)
+        template = self.template(object_type, identifier)
+        return dict(
+            template,
+            uri=self.uri(object_type, identifier),
+            title="{} {}".format(template.get("title"), identifier),
+            publish=True)
+
+    def resource(self, identifier):
+        template = self.template("resource", identifier)
+        uri = self.uri("resource", identifier)
+        return dict(
+            template,
+            uri=uri,
+            title="{} {}".format(template.get("title"), identifier),
+            id_0="{}{}".format(template.get("id_0") or "FA", identifier),
+            ead_id="{}{}".format(template.get("ead_id") or "FA", identifier),
+            tree={"ref": "{}/tree".format(uri)},
+            publish=True,
+            repository={"ref": "/repositories/{}".format(self.repo)})
+
+    # Archival objects are numbered consecutively in breadth-first order within
+    # each resource tree, so that the children of the node at index i of a tree
+    # are at indexes (i + 1) * breadth to (i + 2) * breadth - 1.
+
+    def tree_position(self, identifier):
+        """Returns the resource identifier and tree index of an archival object."""
+        return (identifier - 1) // self.tree_size + 1, (identifier - 1) % self.tree_size
+
+    def tree_count(self, resource_id):
+        """Returns the number of archival objects in a resource's tree."""
+        return max(min(self.tree_size, self.size - (resource_id - 1) * self.tree_size), 0)
+
+    def archival_object_id(self, resource_id, index):
+        return (resource_id - 1) * self.tree_size + index + 1
+
+    def parent_index(self, index):
+        return index // self.breadth - 1 if index >= self.breadth else None
+
+    def child_indexes(self, resource_id, index=None):
+        start = 0 if index is None else (index + 1) * self.breadth
+        return list(range(start, min(start + self.breadth, self.tree_count(resource_id))))
+
+    def descendant_count(self, resource_id, index):
+        """Counts the descendants of an archival object, one level of the tree at a time."""
+        count = self.tree_count(resource_id)
+        total = 0
+        first, last = index, index
+        while True:
+            first, last = (first + 1) * self.breadth, min((last + 2) * self.breadth, count) - 1
+            if first > last:
+                return total
+            total += last - first + 1
+
+    def archival_object(self, identifier, resolve=True):
+        resource_id, index = self.tree_position(identifier)
+        template = self.template("archival_object", identifier)
+        parent_index = self.parent_index(index)
+        ancestors = []
+        ancestor_index = parent_index
+        while ancestor_index is not None:
+            ancestor_id = self.archival_object_id(resource_id, ancestor_index)
+            ancestor = {"ref": self.uri("archival_object", ancestor_id), "level": "series" if ancestor_index < self.breadth else "file"}
+            if resolve:
+                ancestor["_resolved"] = self.archival_object(ancestor_id, resolve=False)
+            ancestors.append(ancestor)
+            ancestor_index = self.parent_index(ancestor_index)
+        resource = {"ref": self.uri("resource", resource_id), "level": "collection"}
+        if resolve:
+            resource["_resolved"] = self.resource(resource_id)
+        ancestors.append(resource)
+        record = dict(
+            template,
+            uri=self.uri("archival_object", identifier),
+            title="{} {}".format(template.get("title"), identifier),
+            ref_id="synthetic{}".format(identifier),
+            level="series" if index < self.breadth else "file",
+            position=index % self.breadth,
+            publish=True,
+            has_unpublished_ancestor=False,
+            resource={"ref": resource["ref"]},
+            repository={"ref": "/repositories/{}".format(self.repo)},
+            ancestors=ancestors)
+        record.pop("parent", None)
+        if parent_index is not None:
+            record["parent"] = {"ref": ancestors[0]["ref"]}
+        return record
+
+    def tree_node(self, resource_id, index=None):
+        """Returns a resource tree starting at the root, or at an archival object if index is given."""
+        children = self.child_indexes(resource_id, index)
+        node = {
+            "child_count": len(children),
+            "waypoints": math.ceil(len(children) / self.waypoint_size),
+            "waypoint_size": self.waypoint_size,
+            "precomputed_waypoints": {},
+        }
+        if index is None:
+            node.update(uri=self.uri("resource", resource_id), jsonmodel_type="resource")
+        else:
+            node.update(
+                uri=self.uri("archival_object", self.archival_object_id(resource_id, index)),
+                jsonmodel_type="archival_object",
+                position=index % self.breadth)
+        return node
+
+    def waypoint(self, resource_id, offset, index=None):
+        """Returns a page of the children of a resource or archival object."""
+        children = self.child_indexes(resource_id, index)
+        page = children[offset * self.waypoint_size:(offset + 1) * self.waypoint_size]
+        return [{
+            "uri": self.uri("archival_object", self.archival_object_id(resource_id, child)),
+            "position": child % self.breadth,
+            "child_count": len(self.child_indexes(resource_id, child)),
+            "level": "series" if child < self.breadth else "file",
+            "jsonmodel_type": "archival_object",
+        } for child in page]
+
+    def objects_within(self, uris):
+        """Returns the number of archival objects which have one of uris as an ancestor."""
+        count = 0
+        for uri in uris:
+            object_type, identifier = self.parse_uri(uri)
+            if object_type == "archival_object" and 1 <= identifier <= self.size:
+                count += self.descendant_count(*self.tree_position(identifier))
+            elif object_type == "resource" and 1 <= identifier <= self.size:
+                count += self.tree_count(identifier)
+        return count
+
+    def deleted_uris(self):
+        """Returns the URIs of deleted records of each object type."""
+        return [
+            self.uri(object_type, identifier)
+            for identifier in range(self.size + 1, self.size + self.deleted + 1)
+            for object_type in ASPACE_OBJECT_TYPES]
+
+    # Each Cartographer component refers to the resource with the same
+    # identifier, and components are arranged in maps with one top-level
+    # component followed by breadth child components.
+
+    def component(self, identifier):
+        """Returns a Cartographer ArrangementMapComponent, or None if it does not exist."""
+        if not 1 <= identifier <= self.size:
+            return None
+        template = self.template("arrangement_map_component", identifier)
+        order = (identifier - 1) % (self.breadth + 1)
+        ancestors = []
+        if order:
+            parent = identifier - order
+            ancestors.append({
+                "title": "Component {}".format(parent),
+                "ref": "{}{}/".format(CARTOGRAPHER_ENDPOINT, parent),
+                "archivesspace_uri": self.uri("resource", parent),
+                "level": "collection",
+            })
+        return dict(
+            template,
+            id=identifier,
+            ref="{}{}/".format(CARTOGRAPHER_ENDPOINT, identifier),
+            title="Component {}".format(identifier),
+            map=(identifier - 1) // (self.breadth + 1) + 1,
+            parent=identifier - order if order else None,
+            order=order,
+            archivesspace_uri=self.uri("resource", identifier),
+            publish=True,
+            ancestors=ancestors,
+            children=[])
+
+    def deleted_components(self):
+        return [{
+            "ref": "{}{}/".format(CARTOGRAPHER_ENDPOINT, identifier),
+            "archivesspace_uri": self.uri("resource", identifier),
+        } for identifier in range(self.size + 1, self.size + self.deleted + 1)]
+
+
+class FakeSourceHandler(BaseHTTPRequestHandler):
+    """Routes requests to ArchivesSpace and Cartographer endpoints."""
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, so avoid waiting for delayed ACKs.
+    disable_nagle_algorithm = True
+    ROUTES = [
+        ("POST", r"/users/(?P<username>[^/]+)/login", "login"),
+        ("GET", r"/api/components/", "components"),
+        ("GET", r"/api/components/(?P<identifier>\d+)/", "component"),
+        ("GET", r"/api/components/(?P<identifier>\d+)/objects_before/", "component_objects_before"),
+        ("GET", r"/api/find-by-uri/", "find_by_uri"),
+        ("GET", r"/api/delete-feed/", "component_delete_feed"),
+        ("GET", r"(/repositories/\d+)?/search", "search"),
+        ("GET", r"/delete-feed", "delete_feed"),
+        ("GET", r"/repositories/\d+/resources/(?P<identifier>\d+)/tree/root", "tree_root"),
+        ("GET", r"/repositories/\d+/resources/(?P<identifier>\d+)/tree/node", "tree_node"),
+        ("GET", r"/repositories/\d+/resources/(?P<identifier>\d+)/tree/waypoint", "tree_waypoint"),
+        ("GET", r"(?P<endpoint>/repositories/\d+/(resources|archival_objects)|/subjects|/agents/\w+)", "listing"),
+        ("GET", r"(?P<endpoint>/repositories/\d+/(resources|archival_objects)|/subjects|/agents/\w+)/(?P<identifier>\d+)", "record"),
+        ("GET", r".*/health/?", "health"),
+        ("HEAD", r"/pdfs/[^/]+", "asset"),
+        ("POST", r"/index/delete/", "index_delete"),
+    ]
+    ROUTES = [(method, re.compile(pattern + "$"), name) for method, pattern, name in ROUTES]
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_HEAD(self):
+        self.dispatch("HEAD")
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self.dispatch("POST")
+
+    def dispatch(self, method):
+        url = urlparse(self.path)
+        self.server.record_request(method, url.path)
+        self.server.wait()
+        self.params = parse_qs(url.query)
+        self.repository = self.server.repository
+        for route_method, pattern, name in self.ROUTES:
+            match = pattern.match(url.path)
+            if route_method == method and match:
+                try:
+                    status, data = getattr(self, name)(**{k: v for k, v in match.groupdict().items() if v})
+                except (KeyError, ValueError) as e:
+                    status, data = 400, {"error": str(e)}
+                break
+        else:
+            status, data = 404, {"error": "Not found"}
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if method != "HEAD":
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+    def param(self, name, default=None):
+        values = self.params.get(name, self.params.get("{}[]".format(name)))
+        return values[0] if values else default
+
+    def not_found(self):
+        return 404, {"error": "Record not found"}
+
+    def login(self, username):
+        return 200, {"session": "fake-session-{}".format(username), "user": {"username": username}}
+
+    def health(self):
+        return 200, {"pong": True}
+
+    def asset(self):
+        return 404, {}
+
+    def index_delete(self):
+        return 200, {"detail": "Objects deleted"}
+
+    def listing(self, endpoint):
+        object_type, _ = self.repository.parse_uri("{}/0".format(endpoint))
+        if object_type is None:
+            return self.not_found()
+        if self.param("all_ids"):
+            return 200, self.repository.ids(object_type)
+        id_set = self.params.get("id_set", []) + self.params.get("id_set[]", [])
+        records = [self.repository.record(object_type, int(i)) for i in id_set]
+        return 200, [r for r in records if r]
+
+    def record(self, endpoint, identifier):
+        object_type, identifier = self.repository.parse_uri("{}/{}".format(endpoint, identifier))
+        record = self.repository.record(object_type, identifier) if object_type else None
+        return (200, record) if record else self.not_found()
+
+    def tree_index(self, node_uri, resource_id):
+        object_type, identifier = self.repository.parse_uri(node_uri)
+        if object_type != "archival_object" or not 1 <= identifier <= self.repository.size:
+            return None
+        node_resource_id, index = self.repository.tree_position(identifier)
+        return index if node_resource_id == resource_id else None
+
+    def tree_root(self, identifier):
+        return 200, self.repository.tree_node(int(identifier))
+
+    def tree_node(self, identifier):
+        index = self.tree_index(self.param("node_uri", ""), int(identifier))
+        if index is None:
+            return self.not_found()
+        return 200, self.repository.tree_node(int(identifier), index)
+
+    def tree_waypoint(self, identifier):
+        index = None
+        if self.param("parent_node"):
+            index = self.tree_index(self.param("parent_node"), int(identifier))
+            if index is None:
+                return self.not_found()
+        return 200, self.repository.waypoint(int(identifier), int(self.param("offset", 0)), index)
+
+    def search(self):
+        query = self.param("q", "")
+        match = re.match(r"\{!terms f=ancestors\}(?P<uris>\S+)", query)
+        uris = match.group("uris").split(",") if match else []
+        total = self.repository.objects_within(uris)
+        return 200, {"total_hits": total, "first_page": 1, "last_page": 1, "this_page": 1, "results": []}
+
+    def paged(self, results):
+        page = int(self.param("page", 1))
+        page_size = int(self.param("page_size", 10))
+        last_page = max(math.ceil(len(results) / page_size), 1)
+        return 200, {
+            "first_page": 1,
+            "last_page": last_page,
+            "this_page": page,
+            "total": len(results),
+            "results": results[(page - 1) * page_size:page * page_size],
+        }
+
+    def delete_feed(self):
+        return self.paged(self.repository.deleted_uris())
+
+    def components(self):
+        results = [{"id": i, "ref": "{}{}/".format(CARTOGRAPHER_ENDPOINT, i)} for i in range(1, self.repository.size + 1)]
+        return 200, {"count": len(results), "next": None, "previous": None, "results": results}
+
+    def component(self, identifier):
+        component = self.repository.component(int(identifier))
+        return (200, component) if component else self.not_found()
+
+    def component_objects_before(self, identifier):
+        component = self.repository.component(int(identifier))
+        return (200, {"count": component["order"]}) if component else self.not_found()
+
+    def find_by_uri(self):
+        object_type, identifier = self.repository.parse_uri(self.param("uri", ""))
+        component = self.repository.component(identifier) if object_type == "resource" else None
+        results = [component] if component else []
+        return 200, {"count": len(results), "next": None, "previous": None, "results": results}
+
+    def component_delete_feed(self):
+        results = self.repository.deleted_components()
+        return 200, {"count": len(results), "next": None, "previous": None, "results": results}
+
+
+class FakeSourceServer(ThreadingHTTPServer):
+    """Serves a SyntheticRepository as both ArchivesSpace and Cartographer.
+
+    Args:
+        address (tuple): host and port to listen on. Use port 0 to pick a free port.
+        repository (SyntheticRepository): records to serve.
+        latency (float): seconds to wait before responding to each request.
+        jitter (float): maximum number of seconds added at random to latency.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, repository, latency=0, jitter=0):
+        super().__init__(address, FakeSourceHandler)
+        self.repository = repository
+        self.latency = latency
+        self.jitter = jitter
+        self.lock = threading.Lock()
+        self.requests = Counter()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def wait(self):
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+
+    def record_request(self, method, path):
+        with self.lock:
+            self.requests["{} {}".format(method, endpoint_family(path))] += 1
+
+    def request_count(self):
+        with self.lock:
+            return sum(self.requests.values())
+
+    def source_settings(self):
+        """Returns settings which point Pisces to this server for all upstream requests."""
+        return {
+            "ASSET_BASEURL": self.url,
+            "INDEX_DELETE_URL": "{}/index/delete/".format(self.url),
+            "ARCHIVESSPACE": {
+                **settings.ARCHIVESSPACE,
+                "baseurl": self.url,
+                "repo": self.repository.repo,
+                "resource_id_0_prefixes": [],
+                "finding_aid_status_restrict": [],
+            },
+            "CARTOGRAPHER": {
+                **settings.CARTOGRAPHER,
+                "cartographer_use": True,
+                "baseurl": self.url,
+                "health_check_path": "/status/health/",
+            },
+        }
+
+    def start(self):
+        """Serves requests in a background thread."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -1,5 +1,7 @@
 import asyncio
+from collections import Counter
 from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 
 from asgiref.sync import sync_to_async
 from django.conf import settings
@@ -8,26 +10,39 @@ from django.utils import timezone
 from merger.mergers import (AgentMerger, ArchivalObjectMerger,
                             ArrangementMapMerger, ResourceMerger,
                             SubjectMerger)
+from pisces.metrics import (MERGE_SECONDS, RECORDS_PROCESSED,
+                            TRANSFORM_SECONDS, response_hook)
+from transformer.assets import prefetch_online_assets
 from transformer.transformers import Transformer
 
-from .helpers import (ancestors_published, handle_deleted_uris,
-                      instantiate_aspace, instantiate_electronbond,
-                      last_run_time, list_chunks, object_published,
-                      send_error_notification, valid_finding_aid_status,
-                      valid_id0)
-from .models import FetchRun, FetchRunError
+from .deletes import DeletePropagator
+from .helpers import (ancestors_published, instantiate_aspace,
+                      instantiate_electronbond, last_run_time, list_chunks,
+                      object_published, send_error_notification,
+                      valid_finding_aid_status, valid_id0)
+from .instrumentation import MemoryMonitor, RunStats
+from .models import FeedCheckpoint, FetchRun, FetchRunError
+from .profiling import RunProfiler
+from .tracing import Tracer, activate, span
 
 
 class FetcherError(Exception):
     pass
 
 
-def run_transformer(merged_object_type, merged):
-    Transformer().run(merged_object_type, merged)
+def run_transformer(merged_object_type, merged, stats):
+    with stats("transform"), TRANSFORM_SECONDS.labels(merged_object_type).time():
+        Transformer(timer=stats).run(merged_object_type, merged)
 
 
-def run_merger(merger, object_type, fetched):
-    return merger(clients).merge(object_type, fetched)
+def run_merger(merger, object_type, fetched, stats):
+    with stats("merge"), MERGE_SECONDS.labels(object_type).time():
+        merger = merger(clients)
+        try:
+            return merger.merge(object_type, fetched)
+        finally:
+            if merger.calls is not None:
+                stats.add_merge_calls(merger.calls)
 
 
 class BaseDataFetcher:
@@ -37,12 +52,28 @@ class BaseDataFetcher:
     attribute to be set on inheriting fetchers.
     """
 
-    def fetch(self, object_status, object_type):
+    def fetch(self, object_status, object_type, profile=False, trace=False):
+        """Fetches, merges and transforms objects.
+
+        Args:
+            object_status (str): updated or deleted, see FetchRun.OBJECT_STATUS_CHOICES
+            object_type (str): an object type, see FetchRun.OBJECT_TYPE_CHOICES
+            profile (bool): profiles the run with cProfile and saves the
+                results in FETCH_PROFILE_DIR.
+            trace (bool): records trace spans for each record and saves them
+                in FETCH_TRACE_DIR.
+        """
         self.object_status = object_status
         self.object_type = object_type
         self.last_run = last_run_time(self.source, object_status, object_type)
         global clients
         self.processed = 0
+        self.stats = RunStats()
+        self.profiler = RunProfiler() if profile else None
+        self.tracer = Tracer() if trace else None
+        self.memory = MemoryMonitor(settings.FETCH_MEMORY_CEILING_MB)
+        self.deletes = DeletePropagator()
+        activate(self.tracer)
         self.current_run = FetchRun.objects.create(
             status=FetchRun.STARTED,
             source=self.source,
@@ -51,28 +82,69 @@ class BaseDataFetcher:
         self.merger = self.get_merger(object_type)
 
         try:
-            clients = self.instantiate_clients()
-            fetched = getattr(
-                self, "get_{}".format(self.object_status))()
-            asyncio.get_event_loop().run_until_complete(
-                self.process_fetched(fetched))
+            with self.profiler.profile() if self.profiler else nullcontext():
+                clients = self.instantiate_clients()
+                self.instrument_clients(clients)
+                with self.stats("enumerate"):
+                    fetched = getattr(
+                        self, "get_{}".format(self.object_status))()
+                self.stats.set("ids", len(fetched))
+                asyncio.get_event_loop().run_until_complete(
+                    self.process_fetched(fetched))
         except Exception as e:
-            self.current_run.status = FetchRun.ERRORED
-            self.current_run.end_time = timezone.now()
-            self.current_run.save()
+            self.finish_run(FetchRun.ERRORED)
             FetchRunError.objects.create(
                 run=self.current_run,
                 message="Error fetching data: {}".format(e),
             )
             raise FetcherError(e)
 
-        self.current_run.status = FetchRun.FINISHED
-        self.current_run.end_time = timezone.now()
-        self.current_run.save()
+        self.finish_run(FetchRun.FINISHED)
         if self.current_run.error_count > 0:
             send_error_notification(self.current_run)
         return self.processed
 
+    def finish_run(self, status):
+        self.current_run.status = status
+        self.current_run.end_time = timezone.now()
+        self.current_run.processed = self.processed
+        if self.profiler:
+            self.save_profile()
+        if self.tracer:
+            self.save_trace()
+            activate(None)
+        self.memory.sample()
+        self.stats.set("memory", self.memory.summary())
+        self.stats.set("deletes", self.deletes.summary())
+        self.current_run.stats = self.stats.summary()
+        self.current_run.save()
+
+    def save_profile(self):
+        """Saves profile data for the run and records its location and hotspots."""
+        path = self.profiler.save(
+            settings.FETCH_PROFILE_DIR,
+            "fetchrun-{}-{}-{}.prof".format(self.current_run.pk, self.object_status, self.object_type))
+        hotspots = self.profiler.hotspots(settings.FETCH_PROFILE_TOP_N)
+        self.stats.set("profile", {"path": path, "hotspots": hotspots})
+        print("Profile saved to {}".format(path))
+        for hotspot in hotspots:
+            print("    {tottime:>10.3f}s {cumtime:>10.3f}s {calls:>10} {function}".format(**hotspot))
+
+    def save_trace(self):
+        """Saves trace spans for the run and records its location and the slowest records."""
+        path = self.tracer.save(
+            settings.FETCH_TRACE_DIR,
+            "fetchrun-{}-{}-{}.trace.json".format(self.current_run.pk, self.object_status, self.object_type))
+        slowest = self.tracer.slowest(settings.FETCH_TRACE_SLOWEST)
+        self.stats.set("trace", {"path": path, "slowest": slowest})
+        print("Trace saved to {}".format(path))
+        for record in slowest:
+            print("    {seconds:>10.3f}s {uri}".format(**record))
+
+    def in_executor(self, func):
+        """Returns func, profiled if this run is being profiled."""
+        return self.profiler.wrap(func) if self.profiler else func
+
     def instantiate_clients(self):
         clients = {
             "aspace": instantiate_aspace(settings.ARCHIVESSPACE)
@@ -81,52 +153,120 @@ class BaseDataFetcher:
             clients["cartographer"] = instantiate_electronbond(settings.CARTOGRAPHER)
         return clients
 
+    def instrument_clients(self, clients):
+        """Counts requests made by each client's session."""
+        for service, client in [("archivesspace", clients["aspace"].client), ("cartographer", clients.get("cartographer"))]:
+            session = getattr(client, "session", None)
+            if session is not None:
+                self.stats.instrument_session(session)
+                if self.tracer:
+                    self.tracer.instrument_session(session)
+                session.hooks["response"].append(response_hook(service))
+
     async def process_fetched(self, fetched):
-        tasks = []
-        to_delete = []
         loop = asyncio.get_event_loop()
         executor = ThreadPoolExecutor()
         if self.object_status == "updated":
             if self.source == FetchRun.ARCHIVESSPACE:
-                semaphore = asyncio.BoundedSemaphore(settings.CHUNK_SIZE / self.page_size)
-                for id_chunk in list_chunks(fetched, self.page_size):
-                    task = asyncio.ensure_future(self.handle_page(id_chunk, loop, executor, semaphore, to_delete))
-                    tasks.append(task)
+                await self.run_bounded(
+                    (self.handle_page(id_chunk, loop, executor) for id_chunk in list_chunks(fetched, self.page_size)),
+                    max(settings.FETCH_MAX_IN_FLIGHT // self.page_size, 1))
             else:
-                semaphore = asyncio.BoundedSemaphore(settings.CHUNK_SIZE)
-                for obj in fetched:
-                    task = asyncio.ensure_future(self.handle_item(obj, loop, executor, semaphore, to_delete))
-                    tasks.append(task)
+                await self.run_bounded(
+                    (self.handle_item(obj, loop, executor) for obj in fetched),
+                    settings.FETCH_MAX_IN_FLIGHT)
         else:
-            to_delete = fetched
+            for uri in fetched:
+                await self.queue_delete(uri, loop, executor)
             self.processed = len(fetched)
-        tasks.append(asyncio.ensure_future(handle_deleted_uris(to_delete, self.source, self.object_type, self.current_run)))
-        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.send_deletes(self.deletes.flush(), loop, executor)
+
+    async def queue_delete(self, uri, loop, executor):
+        """Buffers a URI for deletion, sending a chunk once DELETE_CHUNK_SIZE URIs are buffered."""
+        chunk = self.deletes.add(uri)
+        if chunk:
+            await self.send_deletes(chunk, loop, executor)
+
+    async def send_deletes(self, chunk, loop, executor):
+        """Deletes a chunk of URIs, recording any errors."""
+        if not chunk:
+            return
+        try:
+            with self.stats("delete"):
+                await loop.run_in_executor(executor, self.in_executor(self.deletes.send), chunk)
+        except Exception as e:
+            print(e)
+            await sync_to_async(FetchRunError.objects.create, thread_sensitive=True)(run=self.current_run, message=str(e))
+
+    async def run_bounded(self, coroutines, max_tasks):
+        """Runs coroutines as tasks, with no more than max_tasks pending at once.
 
-    async def handle_page(self, id_list, loop, executor, semaphore, to_delete):
-        async with semaphore:
+        Coroutines are consumed as earlier tasks complete, so records are only
+        fetched when there is room for them. When memory use is over
+        FETCH_MEMORY_CEILING_MB, no more tasks are started until all pending
+        tasks have completed, after which tasks are started as before until
+        the Python heap has grown again (see MemoryMonitor).
+        """
+        pending = set()
+        for coroutine in coroutines:
+            if pending and self.memory.over_ceiling():
+                with self.memory.throttle():
+                    while pending:
+                        await self.wait_for_tasks(pending)
+            while len(pending) >= max_tasks:
+                await self.wait_for_tasks(pending)
+            pending.add(asyncio.ensure_future(coroutine))
+        while pending:
+            await self.wait_for_tasks(pending)
+
+    async def wait_for_tasks(self, pending):
+        """Waits for at least one pending task to complete, recording any errors."""
+        done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            pending.discard(task)
+            if task.exception():
+                print(task.exception())
+                await sync_to_async(FetchRunError.objects.create, thread_sensitive=True)(
+                    run=self.current_run, message="Error fetching data: {}".format(task.exception()))
+        self.memory.sample()
+
+    async def handle_page(self, id_list, loop, executor):
+        with self.stats("fetch"), span("get_page", ids=len(id_list)):
             page = await self.get_page(id_list)
-            for obj in page:
-                await self.handle_data(obj, loop, executor, semaphore, to_delete)
-                self.processed += 1
+        await loop.run_in_executor(executor, self.in_executor(prefetch_online_assets), page)
+        # Records are removed from the page as they are handled so they can be released.
+        page.reverse()
+        while page:
+            await self.handle_data(page.pop(), loop, executor)
+            self.processed += 1
 
-    async def handle_item(self, identifier, loop, executor, semaphore, to_delete):
-        async with semaphore:
+    async def handle_item(self, identifier, loop, executor):
+        with self.stats("fetch"), span("get_item", uri=identifier):
             item = await self.get_item(identifier)
-            await self.handle_data(item, loop, executor, semaphore, to_delete)
-            self.processed += 1
+        await self.handle_data(item, loop, executor)
+        self.processed += 1
 
-    async def handle_data(self, data, loop, executor, semaphore, to_delete):
+    async def handle_data(self, data, loop, executor):
         try:
-            if self.is_exportable(data):
-                merged, merged_object_type = await loop.run_in_executor(executor, run_merger, self.merger, self.object_type, data)
-                await loop.run_in_executor(executor, run_transformer, merged_object_type, merged)
-            else:
-                to_delete.append(data.get("uri", data.get("archivesspace_uri")))
+            with span("record", uri=data.get("uri", data.get("archivesspace_uri")), overlapping=True):
+                if self.is_exportable(data):
+                    merged, merged_object_type = await loop.run_in_executor(
+                        executor, self.in_executor(run_merger), self.merger, self.object_type, data, self.stats)
+                    await loop.run_in_executor(executor, self.in_executor(run_transformer), merged_object_type, merged, self.stats)
+                    self.record_outcome("exported")
+                else:
+                    await self.queue_delete(data.get("uri", data.get("archivesspace_uri")), loop, executor)
+                    self.record_outcome("skipped")
         except Exception as e:
             print(e)
+            self.record_outcome("errors")
             await sync_to_async(FetchRunError.objects.create, thread_sensitive=True)(run=self.current_run, message=str(e))
 
+    def record_outcome(self, outcome):
+        self.stats.increment(outcome)
+        RECORDS_PROCESSED.labels(
+            dict(FetchRun.SOURCE_CHOICES)[self.source], self.object_type, outcome).inc()
+
     def is_exportable(self, obj):
         """Determines whether the object can be exported.
 
@@ -164,12 +304,26 @@ class ArchivesSpaceDataFetcher(BaseDataFetcher):
 
     def get_deleted(self):
         data = []
+        routes = self.get_routes()
         for d in clients["aspace"].client.get_paged(
                 "delete-feed", params={"modified_since": self.last_run}):
-            if self.get_endpoint(self.object_type) in d:
+            if self.route(d, routes) == self.object_type:
                 data.append(d)
         return data
 
+    def get_routes(self):
+        """Returns a list of (URI prefix, object type) tuples."""
+        return [
+            ("{}/".format(self.get_endpoint(object_type)), object_type)
+            for object_type, _ in FetchRun.ARCHIVESSPACE_OBJECT_TYPE_CHOICES]
+
+    def route(self, uri, routes):
+        """Returns the object type of a URI, or None if it matches no route."""
+        for prefix, object_type in routes:
+            if uri.startswith(prefix):
+                return object_type
+        return None
+
     def get_endpoint(self, object_type):
         repo_baseurl = "/repositories/{}".format(settings.ARCHIVESSPACE["repo"])
         endpoint = None
@@ -219,3 +373,112 @@ class CartographerDataFetcher(BaseDataFetcher):
 
     async def get_item(self, obj_ref):
         return clients["cartographer"].get(obj_ref).json()
+
+
+class ArchivesSpaceDeleteFeedConsumer:
+    """Reads the ArchivesSpace delete-feed once for all object types.
+
+    The feed is streamed page by page, and each URI is routed by endpoint
+    prefix to a DeletePropagator for its object type, so deletions are sent
+    while the feed is still being read. Each object type gets a FetchRun as
+    before, with its own delete timings and counts alongside figures for the
+    feed as a whole. The feed is read from the start of the last cycle which
+    finished without errors, which is stored as a FeedCheckpoint.
+
+    Subjects are included, so unlike the per-type cron jobs this replaces,
+    deleted subjects are now propagated on schedule.
+    """
+    feed = "archivesspace_delete_feed"
+    source = FetchRun.ARCHIVESSPACE
+
+    def consume(self):
+        """Consumes deleted URIs added to the feed since the checkpoint.
+
+        Returns:
+            dict: FetchRuns for each object type.
+        """
+        start = timezone.now()
+        self.since = self.get_checkpoint()
+        self.fetcher = ArchivesSpaceDataFetcher()
+        self.feed_stats = RunStats()
+        self.stats = {}
+        self.runs = {}
+        self.deletes = {}
+        for object_type, _ in FetchRun.ARCHIVESSPACE_OBJECT_TYPE_CHOICES:
+            self.stats[object_type] = RunStats()
+            self.runs[object_type] = FetchRun.objects.create(
+                status=FetchRun.STARTED,
+                source=self.source,
+                object_type=object_type,
+                object_status="deleted")
+            self.deletes[object_type] = DeletePropagator()
+        self.processed = Counter()
+
+        try:
+            client = instantiate_aspace(settings.ARCHIVESSPACE).client
+            if getattr(client, "session", None) is not None:
+                self.feed_stats.instrument_session(client.session)
+            routes = self.fetcher.get_routes()
+            with self.feed_stats("enumerate"):
+                for uri in client.get_paged("delete-feed", params={"modified_since": self.since}):
+                    object_type = self.fetcher.route(uri, routes)
+                    if not object_type:
+                        self.feed_stats.increment("ignored")
+                        continue
+                    self.processed[object_type] += 1
+                    self.send(object_type, self.deletes[object_type].add(uri))
+            for object_type, propagator in self.deletes.items():
+                self.send(object_type, propagator.flush())
+        except Exception as e:
+            for run in self.runs.values():
+                self.finish_run(run, FetchRun.ERRORED)
+                FetchRunError.objects.create(run=run, message="Error fetching data: {}".format(e))
+            raise FetcherError(e)
+
+        for run in self.runs.values():
+            self.finish_run(run, FetchRun.FINISHED)
+        if not any(run.error_count for run in self.runs.values()):
+            FeedCheckpoint.objects.update_or_create(feed=self.feed, defaults={"position": start})
+        for run in self.runs.values():
+            if run.error_count > 0:
+                send_error_notification(run)
+        return self.runs
+
+    def get_checkpoint(self):
+        """Returns the feed position as a timestamp.
+
+        Before the first cycle, the earliest of the last deleted FetchRuns is
+        used, so that no object type misses deletions made since its own last
+        run. Object types which have never been fetched, such as subjects, are
+        ignored so that they do not cause the whole feed to be read.
+        """
+        checkpoint = FeedCheckpoint.objects.filter(feed=self.feed).first()
+        if checkpoint:
+            return int(checkpoint.position.timestamp())
+        last_runs = [
+            last_run_time(self.source, "deleted", object_type)
+            for object_type, _ in FetchRun.ARCHIVESSPACE_OBJECT_TYPE_CHOICES]
+        return min([last_run for last_run in last_runs if last_run], default=0)
+
+    def send(self, object_type, chunk):
+        """Deletes a chunk of URIs, recording any errors against the object type's FetchRun."""
+        if not chunk:
+            return
+        try:
+            with self.stats[object_type]("delete"):
+                self.deletes[object_type].send(chunk)
+        except Exception as e:
+            print(e)
+            FetchRunError.objects.create(run=self.runs[object_type], message=str(e))
+
+    def finish_run(self, run, status):
+        run.status = status
+        run.end_time = timezone.now()
+        run.processed = self.processed[run.object_type]
+        self.feed_stats.set("since", self.since)
+        self.feed_stats.set("records", sum(self.processed.values()))
+        run.stats = {
+            **self.stats[run.object_type].summary(),
+            "feed": self.feed_stats.summary(),
+            "deletes": self.deletes[run.object_type].summary()}
+        run.save()
@@ -1,4 +1,5 @@
 import json
+from itertools import islice
 
 import requests
 import shortuuid
@@ -20,6 +21,19 @@ def list_chunks(lst, n):
         yield lst[i:i + n]
 
 
+def iter_chunks(iterable, n):
+    """Yield successive n-sized lists from any iterable, consuming it lazily.
+    Args:
+        iterable (iterable): iterable to chunkify
+        n (integer): size of chunk to produce
+    """
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, n))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, n))
+
+
 def last_run_time(source, object_status, object_type):
     """Returns a date object for a successful fetch.
 
@@ -95,22 +109,6 @@ def identifier_from_uri(uri):
     return shortuuid.uuid(name=uri)
 
 
-async def handle_deleted_uris(uri_list, source, object_type, current_run):
-    """Delivers POST request to indexing service with list of ids to be deleted."""
-    updated = None
-    es_ids = [identifier_from_uri(uri) for uri in list(set(uri_list))]
-    if es_ids:
-        try:
-            resp = requests.post(settings.INDEX_DELETE_URL, json={"identifiers": es_ids})
-            resp.raise_for_status()
-            updated = es_ids
-        except requests.exceptions.HTTPError:
-            raise Exception("Error sending delete request: {}".format(resp.json()["detail"]))
-        except Exception as e:
-            raise Exception("Error sending delete request: {}".format(e))
-    return updated
-
-
 def send_email_message(title, body):
     """Send email with errors encountered during a fetch run."""
     try:
@@ -0,0 +1,299 @@
+import gc
+import math
+import random
+import re
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import requests
+
+IDENTIFIER_PATTERN = re.compile(r"/\d+(?=/|$)")
+PERCENTILES = (50, 95, 99)
+SAMPLE_SIZE = 1024
+HEAP_GROWTH = 1.25
+call_counters = threading.local()
+
+
+def endpoint_family(url):
+    """Returns the path of a URL with numeric identifiers replaced by `:id`.
+
+    For example, `/repositories/2/archival_objects/1234` becomes
+    `/repositories/:id/archival_objects/:id`.
+    """
+    return IDENTIFIER_PATTERN.sub("/:id", urlparse(url).path) or "/"
+
+
+class CallBudgetExceeded(AssertionError):
+    pass
+
+
+def request_family(response):
+    return "{} {}".format(response.request.method, endpoint_family(response.url))
+
+
+def record_call(response, *args, **kwargs):
+    """Response hook which adds a request to the call counters active in the current thread."""
+    for counts in getattr(call_counters, "active", []):
+        counts[request_family(response)] += 1
+    return response
+
+
+def count_session_calls(session):
+    """Adds a response hook to a requests Session so its requests are seen by count_calls."""
+    if isinstance(session, requests.Session) and record_call not in session.hooks["response"]:
+        session.hooks["response"].append(record_call)
+
+
+@contextmanager
+def count_calls():
+    """Counts requests made in the current thread by sessions passed to count_session_calls.
+
+    Yields:
+        Counter: numbers of requests keyed by endpoint family, which is
+            updated until the block exits.
+    """
+    counts = Counter()
+    active = call_counters.__dict__.setdefault("active", [])
+    active.append(counts)
+    try:
+        yield counts
+    finally:
+        active.remove(counts)
+
+
+@contextmanager
+def call_budget(budget):
+    """Raises CallBudgetExceeded if the block makes more requests than a budget allows.
+
+    Args:
+        budget (int or dict): the maximum number of requests, or a dict of
+            maximum numbers of requests keyed by endpoint family. Requests to
+            endpoint families not in the dict are not allowed.
+    """
+    with count_calls() as counts:
+        yield counts
+    if isinstance(budget, int):
+        exceeded = sum(counts.values()) > budget
+    else:
+        exceeded = any(count > budget.get(family, 0) for family, count in counts.items())
+    if exceeded:
+        raise CallBudgetExceeded("{} requests made with a budget of {}: {}".format(
+            sum(counts.values()), budget, dict(counts)))
+
+
+def current_rss_kb():
+    """Returns the resident set size of this process in KiB, or None if it cannot be read."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() // 1024
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+class MemoryMonitor:
+    """Samples memory usage during a fetch run and checks it against a ceiling.
+
+    Resident set size can only be sampled on Linux. Python heap usage is
+    sampled as the number of blocks allocated by the interpreter, and in bytes
+    if tracemalloc is tracing, for example when PYTHONTRACEMALLOC is set.
+
+    Freed memory is rarely returned to the operating system, so resident set
+    size usually stays over the ceiling once it has been reached. After a
+    throttle has released records, the number of allocated blocks is taken
+    as a low watermark, and `over_ceiling` only returns True again once the
+    heap has grown by HEAP_GROWTH above it.
+
+    Args:
+        ceiling_mb (int): resident set size in MiB above which `over_ceiling`
+            returns True, or None for no ceiling.
+    """
+
+    def __init__(self, ceiling_mb=None):
+        self.ceiling_kb = ceiling_mb * 1024 if ceiling_mb else None
+        self.ceiling_mb = ceiling_mb
+        self.samples = 0
+        self.peak_rss_kb = None
+        self.peak_allocated_blocks = 0
+        self.peak_heap_bytes = None
+        self.throttled = 0
+        self.throttled_seconds = 0
+        self.resume_blocks = None
+
+    def sample(self):
+        """Records current memory usage and returns the resident set size in KiB."""
+        rss = current_rss_kb()
+        self.samples += 1
+        if rss is not None:
+            self.peak_rss_kb = max(self.peak_rss_kb or 0, rss)
+        self.peak_allocated_blocks = max(self.peak_allocated_blocks, sys.getallocatedblocks())
+        if tracemalloc.is_tracing():
+            self.peak_heap_bytes = max(self.peak_heap_bytes or 0, tracemalloc.get_traced_memory()[1])
+        return rss
+
+    def over_ceiling(self):
+        rss = self.sample()
+        if not (self.ceiling_kb and rss is not None and rss >= self.ceiling_kb):
+            self.resume_blocks = None
+            return False
+        return self.resume_blocks is None or sys.getallocatedblocks() >= self.resume_blocks * HEAP_GROWTH
+
+    @contextmanager
+    def throttle(self):
+        """Times a period during which intake is paused.
+
+        Garbage is collected once the block exits, and the heap size after
+        collection is kept as the watermark for `over_ceiling`.
+        """
+        self.throttled += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            gc.collect()
+            self.resume_blocks = sys.getallocatedblocks()
+            self.throttled_seconds += time.perf_counter() - start
+
+    def summary(self):
+        return {
+            "samples": self.samples,
+            "peak_rss_kb": self.peak_rss_kb,
+            "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "peak_allocated_blocks": self.peak_allocated_blocks,
+            "peak_heap_bytes": self.peak_heap_bytes,
+            "ceiling_mb": self.ceiling_mb,
+            "throttled": self.throttled,
+            "throttled_seconds": round(self.throttled_seconds, 6),
+        }
+
+
+def percentile(sorted_values, pct):
+    """Returns the nearest-rank percentile of a sorted list of values."""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(pct / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+
+class Distribution:
+    """Summarizes a stream of values in constant memory.
+
+    Count, total and maximum are exact. Percentiles are estimated from a
+    uniform reservoir sample of at most `size` values, so they are exact
+    until more than `size` values have been added.
+    """
+
+    def __init__(self, size=SAMPLE_SIZE):
+        self.size = size
+        self.count = 0
+        self.total = 0
+        self.max = None
+        self.samples = []
+        self.random = random.Random()
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.max = value if self.max is None else max(self.max, value)
+        if len(self.samples) < self.size:
+            self.samples.append(value)
+        else:
+            index = self.random.randrange(self.count)
+            if index < self.size:
+                self.samples[index] = value
+
+    def percentile(self, pct):
+        return percentile(sorted(self.samples), pct)
+
+
+class RunStats:
+    """Collects stage timings and counters for a FetchRun.
+
+    Methods can be called from the event loop and from executor threads.
+    Instances can be passed to a Transformer as its `timer`. Timings and
+    merge call counts are kept as Distributions, so memory use does not grow
+    with the number of records in a run.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timings = defaultdict(Distribution)
+        self.counters = Counter()
+        self.requests = defaultdict(Counter)
+        self.merge_calls = Distribution()
+        self.merge_endpoints = Counter()
+        self.values = {}
+
+    @contextmanager
+    def __call__(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_timing(stage, time.perf_counter() - start)
+
+    def add_timing(self, stage, seconds):
+        with self.lock:
+            self.timings[stage].add(seconds)
+
+    def increment(self, counter, count=1):
+        with self.lock:
+            self.counters[counter] += count
+
+    def set(self, key, value):
+        with self.lock:
+            self.values[key] = value
+
+    def add_merge_calls(self, counts):
+        """Records the requests made to merge a record, keyed by endpoint family."""
+        with self.lock:
+            self.merge_calls.add(sum(counts.values()))
+            self.merge_endpoints.update(counts)
+
+    def record_response(self, response, *args, **kwargs):
+        """Response hook which counts requests by endpoint family and status code."""
+        family = request_family(response)
+        with self.lock:
+            self.requests[family][str(response.status_code)] += 1
+            self.timings["http {}".format(family)].add(response.elapsed.total_seconds())
+        return response
+
+    def instrument_session(self, session):
+        """Adds a response hook to a requests Session."""
+        if self.record_response not in session.hooks["response"]:
+            session.hooks["response"].append(self.record_response)
+
+    def summary(self):
+        """Returns collected statistics as a dict which can be serialized as JSON."""
+        with self.lock:
+            stages = {}
+            for stage, timings in self.timings.items():
+                samples = sorted(timings.samples)
+                stages[stage] = {
+                    "count": timings.count,
+                    "total": round(timings.total, 6),
+                    "mean": round(timings.total / timings.count, 6),
+                    "max": round(timings.max, 6),
+                }
+                for pct in PERCENTILES:
+                    stages[stage]["p{}".format(pct)] = round(percentile(samples, pct), 6)
+            merge_calls = self.merge_calls
+            return {
+                **self.values,
+                "counters": dict(self.counters),
+                "stages": stages,
+                "requests": {family: dict(statuses) for family, statuses in self.requests.items()},
+                "merge_calls": {
+                    "records": merge_calls.count,
+                    "total": merge_calls.total,
+                    "mean": round(merge_calls.total / merge_calls.count, 3) if merge_calls.count else None,
+                    "max": merge_calls.max,
+                    "p95": merge_calls.percentile(95),
+                    "endpoints": dict(self.merge_endpoints),
+                },
+            }
@@ -0,0 +1,63 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from fetcher.benchmarks import compare_to_baseline, run_pipeline_benchmark
+from fetcher.models import FetchRun
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks fetch runs for each object type against a synthetic local source. "
+        "Records are saved to the configured database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--size", type=int, default=500,
+            help="Number of records of each object type.")
+        parser.add_argument(
+            "--depth", type=int, default=3,
+            help="Maximum number of levels of archival objects below a resource.")
+        parser.add_argument(
+            "--breadth", type=int, default=5,
+            help="Number of children of each archival object with children.")
+        parser.add_argument(
+            "--latency", type=float, default=0,
+            help="Seconds the source waits before responding to each request.")
+        parser.add_argument(
+            "--object-type", action="append", dest="object_types", choices=[t[0] for t in FetchRun.OBJECT_TYPE_CHOICES],
+            help="Object type to benchmark. Can be repeated, defaults to all object types.")
+        parser.add_argument(
+            "--output", help="Path of a file to write JSON results to, defaults to stdout.")
+        parser.add_argument(
+            "--baseline", help="Path of a JSON baseline to compare results with.")
+        parser.add_argument(
+            "--update-baseline", action="store_true",
+            help="Write results to the baseline instead of comparing them.")
+        parser.add_argument(
+            "--threshold", type=float, default=0.2,
+            help="Fraction by which a metric may be worse than the baseline before the benchmark fails.")
+
+    def handle(self, *args, **options):
+        results = run_pipeline_benchmark(
+            options["size"], options["depth"], options["breadth"], options["latency"], options["object_types"])
+        output = json.dumps(results, indent=2, sort_keys=True)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+        if not options["baseline"]:
+            return
+        if options["update_baseline"]:
+            with open(options["baseline"], "w") as f:
+                f.write(output)
+            self.stdout.write("Baseline written to {}".format(options["baseline"]))
+            return
+        with open(options["baseline"]) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, options["threshold"])
+        if regressions:
+            raise CommandError("Performance regressed beyond a threshold of {:.0%}:\n{}".format(
+                options["threshold"], "\n".join(regressions)))
+        self.stdout.write("No regressions beyond a threshold of {:.0%}".format(options["threshold"]))
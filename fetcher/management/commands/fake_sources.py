@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from fetcher.fakes import FakeSourceServer, SyntheticRepository
+
+
+class Command(BaseCommand):
+    help = "Serves synthetic ArchivesSpace and Cartographer data for load testing."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1", help="Host to listen on.")
+        parser.add_argument("--port", type=int, default=8089, help="Port to listen on.")
+        parser.add_argument(
+            "--size", type=int, default=1000,
+            help="Number of records of each object type.")
+        parser.add_argument(
+            "--depth", type=int, default=3,
+            help="Maximum number of levels of archival objects below a resource.")
+        parser.add_argument(
+            "--breadth", type=int, default=5,
+            help="Number of children of each archival object with children.")
+        parser.add_argument(
+            "--deleted", type=int, default=0,
+            help="Number of deleted records of each object type listed in delete feeds.")
+        parser.add_argument(
+            "--latency", type=float, default=0,
+            help="Seconds to wait before responding to each request.")
+        parser.add_argument(
+            "--jitter", type=float, default=0,
+            help="Maximum number of seconds added at random to latency.")
+
+    def handle(self, *args, **options):
+        repository = SyntheticRepository(
+            size=options["size"], depth=options["depth"], breadth=options["breadth"], deleted=options["deleted"])
+        server = FakeSourceServer((options["host"], options["port"]), repository, options["latency"], options["jitter"])
+        self.stdout.write(
+            "Serving {} records of each object type at {}. Set AS_BASEURL and CARTOGRAPHER_BASEURL "
+            "to this URL and CARTOGRAPHER_HEALTH_CHECK_PATH to /status/health/.".format(options["size"], server.url))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
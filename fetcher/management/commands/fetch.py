@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from fetcher.fetchers import (ArchivesSpaceDataFetcher,
+                              CartographerDataFetcher, FetcherError)
+from fetcher.models import FetchRun
+
+FETCHERS = {
+    "archivesspace": (ArchivesSpaceDataFetcher, FetchRun.ARCHIVESSPACE_OBJECT_TYPE_CHOICES),
+    "cartographer": (CartographerDataFetcher, FetchRun.CARTOGRAPHER_OBJECT_TYPE_CHOICES),
+}
+
+
+class Command(BaseCommand):
+    help = "Fetches, merges and transforms updated or deleted objects from a source."
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", choices=FETCHERS.keys())
+        parser.add_argument("object_status", choices=[s[0] for s in FetchRun.OBJECT_STATUS_CHOICES])
+        parser.add_argument("object_type", choices=[t[0] for t in FetchRun.OBJECT_TYPE_CHOICES])
+        parser.add_argument(
+            "--profile", action="store_true",
+            help="Profile the run with cProfile and save the results in FETCH_PROFILE_DIR.")
+        parser.add_argument(
+            "--trace", action="store_true",
+            help="Record trace spans for each record and save them in FETCH_TRACE_DIR.")
+
+    def handle(self, *args, **options):
+        fetcher, object_type_choices = FETCHERS[options["source"]]
+        if options["object_type"] not in [t[0] for t in object_type_choices]:
+            raise CommandError("{} objects cannot be fetched from {}".format(options["object_type"], options["source"]))
+        try:
+            processed = fetcher().fetch(
+                options["object_status"], options["object_type"], profile=options["profile"], trace=options["trace"])
+        except FetcherError as e:
+            raise CommandError(e)
+        self.stdout.write("{} {} {} records processed".format(processed, options["object_status"], options["object_type"]))
@@ -0,0 +1,21 @@
+# Generated by Django 4.0.9 on 2026-10-19 19:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fetcher', '0008_alter_user_first_name'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fetchrun',
+            index=models.Index(fields=['source', 'object_type', 'object_status', 'status', '-start_time'], name='fetchrun_last_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fetchrun',
+            index=models.Index(fields=['object_type', 'object_status', 'status', '-end_time'], name='fetchrun_last_end_idx'),
+        ),
+    ]
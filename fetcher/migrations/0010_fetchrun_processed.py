@@ -0,0 +1,18 @@
+# Generated by Django 4.0.9 on 2026-10-19 19:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fetcher', '0009_fetchrun_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fetchrun',
+            name='processed',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
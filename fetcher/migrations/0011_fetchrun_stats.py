@@ -0,0 +1,18 @@
+# Generated by Django 4.0.9 on 2026-10-19 19:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fetcher', '0010_fetchrun_processed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fetchrun',
+            name='stats',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
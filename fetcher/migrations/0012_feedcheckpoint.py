@@ -0,0 +1,22 @@
+# Generated by Django 4.0.9 on 2026-10-19 20:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fetcher', '0011_fetchrun_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('feed', models.CharField(max_length=100, unique=True)),
+                ('position', models.DateTimeField()),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
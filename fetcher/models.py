@@ -40,14 +40,29 @@ class FetchRun(models.Model):
     source = models.CharField(max_length=100, choices=SOURCE_CHOICES)
     object_type = models.CharField(max_length=100, choices=OBJECT_TYPE_CHOICES)
     object_status = models.CharField(max_length=100, choices=OBJECT_STATUS_CHOICES)
+    processed = models.PositiveIntegerField(default=0)
+    stats = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["source", "object_type", "object_status", "status", "-start_time"],
+                name="fetchrun_last_start_idx"),
+            models.Index(
+                fields=["object_type", "object_status", "status", "-end_time"],
+                name="fetchrun_last_end_idx"),
+        ]
 
     @property
     def errors(self):
-        return FetchRunError.objects.filter(run=self)
+        return self.fetchrunerror_set.all()
 
     @property
     def error_count(self):
-        return len(FetchRunError.objects.filter(run=self))
+        """Uses the num_errors annotation if present, otherwise counts errors in the database."""
+        if hasattr(self, "num_errors"):
+            return self.num_errors
+        return self.fetchrunerror_set.count()
 
     @property
     def elapsed(self):
@@ -63,3 +78,10 @@ class FetchRunError(models.Model):
 
     class Meta:
         ordering = ('datetime', )
+
+
+class FeedCheckpoint(models.Model):
+    """The time up to which a source feed has been consumed."""
+    feed = models.CharField(max_length=100, unique=True)
+    position = models.DateTimeField()
+    updated = models.DateTimeField(auto_now=True)
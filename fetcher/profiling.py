@@ -0,0 +1,97 @@
+import cProfile
+import functools
+import io
+import os
+import pstats
+import threading
+from contextlib import contextmanager
+
+
+class RunProfiler:
+    """Profiles a fetch run across the event loop and executor threads.
+
+    cProfile only observes the thread in which it is enabled, so each thread
+    gets its own profile, which is enabled while profiled code runs in that
+    thread. Profiles from all threads are combined when saved or summarized.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.profiles = []
+
+    def get_profile(self):
+        profile = getattr(self.local, "profile", None)
+        if profile is None:
+            profile = cProfile.Profile()
+            self.local.profile = profile
+            with self.lock:
+                self.profiles.append(profile)
+        return profile
+
+    @contextmanager
+    def profile(self):
+        """Profiles the current thread for the duration of the block."""
+        profile = self.get_profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12 and later allow only one active profiler at a time.
+            yield
+            return
+        try:
+            yield
+        finally:
+            profile.disable()
+
+    def wrap(self, func):
+        """Returns a version of func which is profiled in whichever thread it runs."""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.profile():
+                return func(*args, **kwargs)
+        return wrapper
+
+    def get_stats(self):
+        with self.lock:
+            profiles = list(self.profiles)
+        stats = None
+        for profile in profiles:
+            try:
+                if stats is None:
+                    stats = pstats.Stats(profile, stream=io.StringIO())
+                else:
+                    stats.add(profile)
+            except TypeError:
+                # Profiles which were never enabled have no data.
+                continue
+        return stats
+
+    def save(self, directory, filename):
+        """Saves combined profile data which can be loaded with pstats or snakeviz."""
+        stats = self.get_stats()
+        if stats is None:
+            return None
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, filename)
+        stats.dump_stats(path)
+        return path
+
+    def hotspots(self, top_n):
+        """Returns the top_n functions by internal time.
+
+        Returns:
+            list: dicts with function, calls, tottime and cumtime keys.
+        """
+        stats = self.get_stats()
+        if stats is None:
+            return []
+        results = []
+        for (filename, line, name), (_, calls, tottime, cumtime, _) in stats.stats.items():
+            results.append({
+                "function": "{}:{}({})".format(filename, line, name),
+                "calls": calls,
+                "tottime": round(tottime, 6),
+                "cumtime": round(cumtime, 6),
+            })
+        return sorted(results, key=lambda r: r["tottime"], reverse=True)[:top_n]
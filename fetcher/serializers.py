@@ -17,7 +17,8 @@ class FetchRunSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = FetchRun
         fields = ('url', 'status', 'source', 'object_type', 'object_status',
-                  'error_count', 'errors', 'start_time', 'end_time', 'elapsed')
+                  'processed', 'error_count', 'errors', 'start_time', 'end_time',
+                  'elapsed', 'stats')
 
     def get_source(self, obj):
         return obj.SOURCE_CHOICES[int(obj.source)][1]
@@ -33,7 +34,7 @@ class FetchRunListSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = FetchRun
         fields = ('url', 'status', 'source', 'object_type', 'object_status',
-                  'error_count', 'start_time')
+                  'processed', 'error_count', 'start_time')
 
     def get_source(self, obj):
         return obj.SOURCE_CHOICES[int(obj.source)][1]
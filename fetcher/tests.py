@@ -1,32 +1,48 @@
 import asyncio
+import json
+import pstats
 import random
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from tempfile import TemporaryDirectory
+from unittest import skipUnless
 from unittest.mock import Mock, patch
 
 import pytz
+import requests
 import vcr
 from django.conf import settings
+from django.db import connection
 from django.test import TestCase, override_settings
+from django.urls import reverse
 from django.utils import timezone
 from requests import Response
 from requests.exceptions import HTTPError
 from rest_framework.test import APIRequestFactory
 
-from .cron import (CleanUpCompleted, DeletedArchivesSpaceArchivalObjects,
-                   DeletedArchivesSpaceFamilies,
-                   DeletedArchivesSpaceOrganizations,
-                   DeletedArchivesSpacePeople, DeletedArchivesSpaceResources,
-                   DeletedArchivesSpaceSubjects,
+from merger.mergers import ArchivalObjectMerger
+from pisces.metrics import metrics_view, response_hook
+from transformer.models import DataObject, DataObjectChange
+
+from .benchmarks import QueryCounter, compare_to_baseline
+from .cron import (CleanUpCompleted, DeletedArchivesSpaceRecords,
                    UpdatedArchivesSpaceArchivalObjects,
                    UpdatedArchivesSpaceFamilies,
                    UpdatedArchivesSpaceOrganizations,
                    UpdatedArchivesSpacePeople, UpdatedArchivesSpaceResources,
                    UpdatedArchivesSpaceSubjects,
                    UpdatedCartographerArrangementMapComponents)
-from .fetchers import ArchivesSpaceDataFetcher, CartographerDataFetcher
-from .helpers import (handle_deleted_uris, last_run_time,
+from .deletes import DeleteError, DeletePropagator
+from .fakes import FakeSourceServer, SyntheticRepository
+from .fetchers import (ArchivesSpaceDataFetcher,
+                       ArchivesSpaceDeleteFeedConsumer,
+                       CartographerDataFetcher)
+from .helpers import (identifier_from_uri, last_run_time,
                       send_error_notification)
-from .models import FetchRun, FetchRunError
+from .instrumentation import HEAP_GROWTH, Distribution, MemoryMonitor, RunStats
+from .models import FeedCheckpoint, FetchRun, FetchRunError
+from .profiling import RunProfiler
+from .tracing import Tracer, activate, span, traced
 from .views import FetchRunViewSet
 
 archivesspace_vcr = vcr.VCR(
@@ -79,6 +95,10 @@ class FetcherTest(TestCase):
                     with fetcher_vcr.use_cassette("{}-{}-{}.json".format(cassette_prefix, status, object_type)):
                         processed = fetcher().fetch(status, object_type)
                         self.assertTrue(isinstance(processed, int))
+                        run = FetchRun.objects.filter(object_type=object_type, object_status=status).latest("start_time")
+                        self.assertEqual(run.processed, processed)
+                        self.assertTrue(isinstance(run.stats["ids"], int))
+                        self.assertIn("enumerate", run.stats["stages"])
             self.assertTrue(len(FetchRun.objects.all()), len(object_type_choices) * 2)
 
     def test_action_views(self):
@@ -92,6 +112,332 @@ class FetcherTest(TestCase):
                 response.status_code, 200,
                 "View error:  {}".format(response.data))
 
+    def test_view_query_counts(self):
+        for run in FetchRun.objects.all():
+            for n in range(random.randint(0, 3)):
+                FetchRunError.objects.create(run=run, message="Error {}".format(n))
+        for action in ["list", "archivesspace", "resources"]:
+            view = FetchRunViewSet.as_view({"get": action})
+            with self.assertNumQueries(2):
+                response = view(self.factory.get(reverse("fetchrun-list")))
+            self.assertEqual(response.status_code, 200)
+        for result in FetchRunViewSet.as_view({"get": "list"})(self.factory.get(reverse("fetchrun-list"))).data["results"]:
+            run = FetchRun.objects.get(pk=result["url"].rstrip("/").split("/")[-1])
+            self.assertEqual(result["error_count"], len(run.errors))
+
+        run = random.choice(FetchRun.objects.all())
+        view = FetchRunViewSet.as_view({"get": "retrieve"})
+        with self.assertNumQueries(2):
+            response = view(self.factory.get(reverse("fetchrun-detail", args=[run.pk])), pk=run.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["error_count"], len(response.data["errors"]))
+
+    def test_stats(self):
+        now = timezone.now()
+        FetchRun.objects.update(start_time=now - timedelta(hours=2), end_time=now - timedelta(hours=1), processed=10)
+        run = FetchRun.objects.filter(object_type="resource", object_status="updated").first()
+        for n in range(5):
+            FetchRunError.objects.create(run=run, message="Error {}".format(n))
+        view = FetchRunViewSet.as_view({"get": "stats"})
+        response = view(self.factory.get(reverse("fetchrun-stats"), {"bucket": "hour"}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sum(row["runs"] for row in response.data["results"]), FetchRun.objects.count())
+        for row in response.data["results"]:
+            self.assertEqual(row["mean_elapsed"], 3600)
+            self.assertEqual(row["processed"], 10 * row["runs"])
+            if connection.vendor == "postgresql":
+                self.assertEqual(row["p95_elapsed"], 3600)
+        resource_row = [r for r in response.data["results"] if r["object_type"] == "resource"][0]
+        self.assertEqual(resource_row["errors"], 5)
+        self.assertEqual(resource_row["error_rate"], 5 / resource_row["processed"])
+
+        response = view(self.factory.get(reverse("fetchrun-stats"), {"object_type": "subject", "source": FetchRun.ARCHIVESSPACE}))
+        self.assertEqual(
+            [(row["object_type"], row["source"]) for row in response.data["results"]],
+            [("subject", "ArchivesSpace")])
+        response = view(self.factory.get(reverse("fetchrun-stats"), {"end": (now - timedelta(days=1)).timestamp()}))
+        self.assertEqual(response.data["results"], [])
+        response = view(self.factory.get(reverse("fetchrun-stats"), {"bucket": "fortnight"}))
+        self.assertEqual(response.status_code, 400)
+
+    def test_stats_after_cleanup(self):
+        """Ensures that runs within FETCH_RUN_RETENTION_DAYS survive cleanup, so statistics show trends."""
+        now = timezone.now()
+        FetchRun.objects.all().delete()
+        for days_ago in [40, 3, 2, 1]:
+            run = FetchRun.objects.create(
+                status=FetchRun.FINISHED, source=FetchRun.ARCHIVESSPACE,
+                object_type="resource", object_status="updated", processed=10)
+            FetchRun.objects.filter(pk=run.pk).update(
+                start_time=now - timedelta(days=days_ago, hours=1), end_time=now - timedelta(days=days_ago))
+        with self.settings(FETCH_RUN_RETENTION_DAYS=30):
+            CleanUpCompleted().do()
+        self.assertEqual(FetchRun.objects.count(), 3, "Expected only the run older than the retention window to be deleted.")
+
+        view = FetchRunViewSet.as_view({"get": "stats"})
+        response = view(self.factory.get(reverse("fetchrun-stats"), {"bucket": "day"}))
+        self.assertEqual(len(response.data["results"]), 3)
+        self.assertTrue(all(row["runs"] == 1 and row["processed"] == 10 for row in response.data["results"]))
+
+        with self.settings(FETCH_RUN_RETENTION_DAYS=0):
+            CleanUpCompleted().do()
+        self.assertEqual(FetchRun.objects.count(), 1, "Expected the latest run to be kept.")
+
+    def test_run_stats(self):
+        stats = RunStats()
+        for seconds in [0.1, 0.2, 0.3, 0.4, 1.0]:
+            stats.add_timing("merge", seconds)
+        with stats("transform"):
+            pass
+        stats.increment("skipped", 2)
+        stats.set("ids", 5)
+        for url, status in [
+                ("https://aspace.example.com/repositories/2/archival_objects/123?resolve[]=ancestors", 200),
+                ("https://aspace.example.com/repositories/2/archival_objects/456", 404),
+                ("https://cartographer.example.com/api/components/7/", 200)]:
+            response = Mock(url=url, status_code=status)
+            response.request.method = "GET"
+            response.elapsed = timedelta(seconds=0.5)
+            stats.record_response(response)
+        summary = stats.summary()
+        self.assertEqual(summary["ids"], 5)
+        self.assertEqual(summary["counters"], {"skipped": 2})
+        self.assertEqual(summary["stages"]["merge"]["count"], 5)
+        self.assertEqual(summary["stages"]["merge"]["p50"], 0.3)
+        self.assertEqual(summary["stages"]["merge"]["p95"], 1.0)
+        self.assertEqual(summary["stages"]["transform"]["count"], 1)
+        self.assertEqual(
+            summary["requests"],
+            {"GET /repositories/:id/archival_objects/:id": {"200": 1, "404": 1},
+             "GET /api/components/:id/": {"200": 1}})
+        self.assertEqual(summary["stages"]["http GET /api/components/:id/"]["total"], 0.5)
+
+        distribution = Distribution(size=100)
+        for value in range(1, 10001):
+            distribution.add(value)
+        self.assertEqual(len(distribution.samples), 100)
+        self.assertEqual((distribution.count, distribution.total, distribution.max), (10000, 50005000, 10000))
+        self.assertLess(abs(distribution.percentile(50) - 5000), 2000)
+
+    def test_metrics(self):
+        response = Mock(url="https://aspace.example.com/repositories/2/resources/1", status_code=200)
+        response.request.method = "GET"
+        response.elapsed = timedelta(seconds=0.25)
+        response_hook("archivesspace")(response)
+        response = metrics_view(self.factory.get(reverse("metrics")))
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode("utf-8")
+        self.assertIn(
+            'pisces_upstream_requests_total{endpoint="GET /repositories/:id/resources/:id",service="archivesspace",status="200"}',
+            content)
+        for object_type, _ in DataObject.TYPE_CHOICES:
+            self.assertIn('pisces_dataobject_backlog{{object_type="{}",state="unindexed"}} 0.0'.format(object_type), content)
+
+    def test_run_profiler(self):
+        def busy(n):
+            return sum(i * i for i in range(n))
+
+        profiler = RunProfiler()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(profiler.wrap(busy), [10000] * 4))
+        with profiler.profile():
+            busy(10000)
+        self.assertTrue(1 < len(profiler.profiles) <= 3)
+        hotspots = profiler.hotspots(5)
+        self.assertTrue(len(hotspots) <= 5)
+        self.assertTrue(any("busy" in h["function"] or "genexpr" in h["function"] for h in hotspots))
+        with TemporaryDirectory() as tmp:
+            path = profiler.save(tmp, "test.prof")
+            self.assertTrue(pstats.Stats(path).total_calls > 0)
+        self.assertEqual(RunProfiler().save(tmp, "empty.prof"), None)
+
+    @patch("fetcher.fetchers.ArchivesSpaceDataFetcher.get_updated")
+    @patch("fetcher.fetchers.ArchivesSpaceDataFetcher.instantiate_clients")
+    def test_profiled_fetch(self, mock_clients, mock_updated):
+        mock_clients.return_value = {"aspace": Mock(client=None)}
+        mock_updated.return_value = []
+        with TemporaryDirectory() as tmp:
+            with self.settings(FETCH_PROFILE_DIR=tmp, FETCH_PROFILE_TOP_N=3):
+                ArchivesSpaceDataFetcher().fetch("updated", "resource", profile=True)
+            run = FetchRun.objects.latest("start_time")
+            self.assertTrue(run.stats["profile"]["path"].startswith(tmp))
+            self.assertTrue(pstats.Stats(run.stats["profile"]["path"]).total_calls > 0)
+            self.assertTrue(0 < len(run.stats["profile"]["hotspots"]) <= 3)
+
+    def test_tracer(self):
+        @traced
+        def nested():
+            with span("inner"):
+                return "done"
+
+        def merge(uri):
+            with span("merge", uri=uri):
+                return nested()
+
+        self.assertEqual(nested(), "done")
+        tracer = Tracer()
+        activate(tracer)
+        try:
+            with span("record", uri="/repositories/2/resources/1", overlapping=True):
+                with ThreadPoolExecutor(max_workers=1) as executor:
+                    executor.submit(merge, "/repositories/2/resources/1").result()
+            with self.assertRaises(ValueError):
+                with span("record", uri="/repositories/2/resources/2", overlapping=True):
+                    raise ValueError("failed")
+        finally:
+            activate(None)
+        self.assertEqual(span("untraced").__class__.__name__, "nullcontext")
+        names = {s["name"]: s for s in tracer.spans}
+        self.assertEqual(names["inner"]["uri"], "/repositories/2/resources/1")
+        self.assertEqual(names["FetcherTest.test_tracer.<locals>.nested"]["uri"], "/repositories/2/resources/1")
+        self.assertNotEqual(names["inner"]["tid"], names["record"]["tid"])
+        self.assertEqual(tracer.spans[-1]["args"]["error"], "failed")
+        slowest = tracer.slowest(1)
+        self.assertEqual(len(slowest), 1)
+        self.assertEqual(slowest[0]["uri"], "/repositories/2/resources/1")
+        self.assertEqual(
+            {s["name"] for s in slowest[0]["spans"]}, {"merge", "inner", "FetcherTest.test_tracer.<locals>.nested"})
+        with TemporaryDirectory() as tmp:
+            with open(tracer.save(tmp, "test.trace.json")) as f:
+                events = json.load(f)["traceEvents"]
+        self.assertEqual(sorted(e["ph"] for e in events if e["name"] == "record"), ["b", "b", "e", "e"])
+        self.assertTrue(all(e["dur"] >= 0 for e in events if e["ph"] == "X"))
+        self.assertTrue(any(e["ph"] == "M" for e in events))
+
+    @patch("transformer.transformers.Transformer.run")
+    @patch("merger.mergers.BaseMerger.merge")
+    @patch("fetcher.fetchers.ArchivesSpaceDataFetcher.is_exportable")
+    @patch("fetcher.fetchers.ArchivesSpaceDataFetcher.get_page")
+    @patch("fetcher.fetchers.ArchivesSpaceDataFetcher.get_updated")
+    @patch("fetcher.fetchers.ArchivesSpaceDataFetcher.instantiate_clients")
+    def test_traced_fetch(self, mock_clients, mock_updated, mock_page, mock_exportable, mock_merge, mock_transform):
+        mock_clients.return_value = {"aspace": Mock(client=None)}
+        mock_updated.return_value = [1, 2]
+        uris = ["/repositories/2/resources/1", "/repositories/2/resources/2"]
+        mock_page.side_effect = lambda ids: [{"uri": uri} for uri in uris]
+        mock_exportable.return_value = True
+        mock_merge.return_value = {}, "collection"
+        with TemporaryDirectory() as tmp:
+            with self.settings(FETCH_TRACE_DIR=tmp, FETCH_TRACE_SLOWEST=1):
+                ArchivesSpaceDataFetcher().fetch("updated", "resource", trace=True)
+            run = FetchRun.objects.latest("start_time")
+            self.assertTrue(run.stats["trace"]["path"].startswith(tmp))
+            with open(run.stats["trace"]["path"]) as f:
+                events = json.load(f)["traceEvents"]
+        self.assertEqual(len(run.stats["trace"]["slowest"]), 1)
+        self.assertIn(run.stats["trace"]["slowest"][0]["uri"], uris)
+        self.assertEqual(len([e for e in events if e["name"] == "get_page"]), 1)
+        self.assertEqual(len([e for e in events if e["name"] == "record" and e["ph"] == "b"]), 2)
+        self.assertEqual(span("untraced").__class__.__name__, "nullcontext")
+
+    def test_fake_sources(self):
+        repository = SyntheticRepository(size=40, depth=3, breadth=3, deleted=2)
+        server = FakeSourceServer(("127.0.0.1", 0), repository).start()
+        self.addCleanup(server.stop)
+
+        class Client:
+            def get(self, path, params=None):
+                return requests.get("{}/{}".format(server.url, path.lstrip("/")), params=params)
+
+        self.assertEqual(
+            requests.post("{}/users/admin/login".format(server.url)).json()["session"], "fake-session-admin")
+        ids = requests.get("{}/subjects".format(server.url), params={"all_ids": True}).json()
+        self.assertEqual(ids, list(range(1, 41)))
+        records = Client().get("/repositories/2/archival_objects", params={"id_set": [1, 13, 40]}).json()
+        self.assertEqual([r["uri"] for r in records], ["/repositories/2/archival_objects/{}".format(i) for i in [1, 13, 40]])
+        self.assertEqual([len(r["ancestors"]) for r in records], [1, 3, 1])
+        self.assertEqual(records[2]["resource"]["ref"], "/repositories/2/resources/2")
+        self.assertEqual(records[1]["ancestors"][-1]["_resolved"]["uri"], "/repositories/2/resources/1")
+
+        merger = ArchivalObjectMerger({"aspace": Mock(client=Client())})
+        preorder = []
+
+        def walk(resource_id, index=None):
+            for child in repository.child_indexes(resource_id, index):
+                preorder.append(repository.archival_object_id(resource_id, child))
+                walk(resource_id, child)
+
+        walk(1)
+        for position, identifier in enumerate(preorder[:15], start=1):
+            record = Client().get(repository.uri("archival_object", identifier)).json()
+            self.assertEqual(merger.get_position(record), position)
+        self.assertTrue(merger.aspace_helper.has_children("/repositories/2/archival_objects/1"))
+        self.assertFalse(merger.aspace_helper.has_children("/repositories/2/archival_objects/13"))
+
+        deleted = Client().get("/delete-feed", params={"page": 1, "page_size": 100}).json()
+        self.assertEqual(deleted["total"], 12)
+        self.assertIn("/repositories/2/resources/41", deleted["results"])
+        component = Client().get("/api/find-by-uri/", params={"uri": "/repositories/2/resources/3"}).json()["results"][0]
+        self.assertEqual(component["ancestors"][0]["archivesspace_uri"], "/repositories/2/resources/1")
+        self.assertEqual(Client().get("{}objects_before/".format(component["ref"])).json()["count"], 2)
+        self.assertEqual(Client().get("/api/delete-feed/").json()["count"], 2)
+        self.assertEqual(Client().get("/status/health/").status_code, 200)
+        self.assertEqual(Client().get("/repositories/2/resources/41").status_code, 404)
+        self.assertEqual(server.requests["GET /repositories/:id/resources/:id/tree/root"], 15)
+
+    def test_pipeline_benchmark(self):
+        baseline = {"object_types": {"resource": {
+            "records_per_second": 100, "http_calls_per_record": 2, "queries_per_record": 4, "peak_rss_kb": 0}}}
+        results = {"object_types": {
+            "resource": {"records_per_second": 85, "http_calls_per_record": 3, "queries_per_record": 4.5, "peak_rss_kb": 1000},
+            "subject": {"records_per_second": 1}}}
+        regressions = compare_to_baseline(results, baseline, 0.2)
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith("resource http_calls_per_record: 3"))
+        self.assertEqual(len(compare_to_baseline(results, baseline, 0.1)), 3)
+        self.assertEqual(compare_to_baseline(results, {}, 0), [])
+
+        with QueryCounter() as queries:
+            FetchRun.objects.count()
+            list(FetchRun.objects.all()[:1])
+        FetchRun.objects.count()
+        self.assertEqual(queries.count, 2)
+
+    @patch("transformer.transformers.Transformer.run")
+    @patch("merger.mergers.BaseMerger.merge")
+    @patch("fetcher.fetchers.CartographerDataFetcher.get_updated")
+    @patch("fetcher.fetchers.CartographerDataFetcher.instantiate_clients")
+    def test_bounded_fetch(self, mock_clients, mock_updated, mock_merge, mock_transform):
+        mock_clients.return_value = {"aspace": Mock(client=None)}
+        mock_updated.return_value = ["/api/components/{}/".format(i) for i in range(10)]
+        mock_merge.return_value = {}, "resource"
+        in_flight = {"current": 0, "max": 0, "max_after_throttle": 0}
+
+        async def get_item(fetcher, identifier):
+            in_flight["current"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["current"])
+            if fetcher.memory.throttled:
+                in_flight["max_after_throttle"] = max(in_flight["max_after_throttle"], in_flight["current"])
+            await asyncio.sleep(0.01)
+            in_flight["current"] -= 1
+            return {"ref": identifier, "archivesspace_uri": "/repositories/2/resources/1", "publish": True}
+
+        with patch.object(CartographerDataFetcher, "get_item", get_item):
+            for max_in_flight, ceiling, expected_max in [(3, None, 3), (3, 1, 3)]:
+                in_flight.update(max=0, max_after_throttle=0)
+                with self.settings(FETCH_MAX_IN_FLIGHT=max_in_flight, FETCH_MEMORY_CEILING_MB=ceiling):
+                    processed = CartographerDataFetcher().fetch("updated", "arrangement_map_component")
+                self.assertEqual(processed, 10)
+                self.assertEqual(in_flight["max"], expected_max)
+                memory = FetchRun.objects.latest("start_time").stats["memory"]
+                self.assertTrue(memory["samples"] >= 10)
+                self.assertTrue(memory["peak_allocated_blocks"] > 0)
+                self.assertEqual(memory["throttled"] > 0, bool(ceiling))
+                if ceiling:
+                    self.assertEqual(
+                        in_flight["max_after_throttle"], max_in_flight,
+                        "Expected concurrency to recover once the throttle released records.")
+
+        monitor = MemoryMonitor(ceiling_mb=1)
+        with patch("fetcher.instrumentation.sys.getallocatedblocks") as mock_blocks:
+            mock_blocks.return_value = 1000
+            self.assertTrue(monitor.over_ceiling())
+            with monitor.throttle():
+                pass
+            self.assertFalse(monitor.over_ceiling())
+            mock_blocks.return_value = 1000 * HEAP_GROWTH
+            self.assertTrue(monitor.over_ceiling())
+
     def test_update_time(self):
         initial_count = len(FetchRun.objects.all())
         view = FetchRunViewSet.as_view({"post": "update_time"})
@@ -126,18 +472,13 @@ class FetcherTest(TestCase):
     @patch("fetcher.helpers.identifier_from_uri")
     def test_cron(self, mock_id, mock_merger, mock_transformer):
         for fetcher_vcr, cassette, cron in [
-                (archivesspace_vcr, "ArchivesSpace-deleted-agent_corporate_entity.json", DeletedArchivesSpaceOrganizations),
                 (archivesspace_vcr, "ArchivesSpace-updated-agent_corporate_entity.json", UpdatedArchivesSpaceOrganizations),
-                (archivesspace_vcr, "ArchivesSpace-deleted-agent_family.json", DeletedArchivesSpaceFamilies),
                 (archivesspace_vcr, "ArchivesSpace-updated-agent_family.json", UpdatedArchivesSpaceFamilies),
-                (archivesspace_vcr, "ArchivesSpace-deleted-agent_person.json", DeletedArchivesSpacePeople),
                 (archivesspace_vcr, "ArchivesSpace-updated-agent_person.json", UpdatedArchivesSpacePeople),
-                (archivesspace_vcr, "ArchivesSpace-deleted-subject.json", DeletedArchivesSpaceSubjects),
                 (archivesspace_vcr, "ArchivesSpace-updated-subject.json", UpdatedArchivesSpaceSubjects),
-                (archivesspace_vcr, "ArchivesSpace-deleted-resource.json", DeletedArchivesSpaceResources),
                 (archivesspace_vcr, "ArchivesSpace-updated-resource.json", UpdatedArchivesSpaceResources),
-                (archivesspace_vcr, "ArchivesSpace-deleted-archival_object.json", DeletedArchivesSpaceArchivalObjects),
                 (archivesspace_vcr, "ArchivesSpace-updated-archival_object.json", UpdatedArchivesSpaceArchivalObjects),
+                (archivesspace_vcr, "ArchivesSpace-deleted-resource.json", DeletedArchivesSpaceRecords),
                 (cartographer_vcr, "Cartographer-updated-arrangement_map_component.json", UpdatedCartographerArrangementMapComponents)]:
             with fetcher_vcr.use_cassette(cassette):
                 mock_id.return_value = None
@@ -167,6 +508,36 @@ class FetcherTest(TestCase):
             mock_email.assert_called_once_with(expected_title, expected_text)
             mock_teams.assert_called_once_with(expected_title, expected_text)
 
+    @skipUnless(connection.vendor == "postgresql", "Query plans are only checked on PostgreSQL")
+    def test_query_plans(self):
+        """Ensures that the planner picks the intended indexes for last run and cleanup queries.
+
+        Runs are created for every source, object type and status, so that
+        sequential scans are costed realistically.
+        """
+        FetchRun.objects.bulk_create([
+            FetchRun(
+                status=[FetchRun.FINISHED, FetchRun.ERRORED][i % 10 == 0],
+                source=source, object_type=object_type, object_status=object_status,
+                end_time=timezone.now() - timedelta(minutes=i))
+            for source, _ in FetchRun.SOURCE_CHOICES
+            for object_type, _ in FetchRun.OBJECT_TYPE_CHOICES
+            for object_status, _ in FetchRun.OBJECT_STATUS_CHOICES
+            for i in range(500)], batch_size=2000)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE fetcher_fetchrun")
+        for queryset, index in [
+                (FetchRun.objects.filter(
+                    status=FetchRun.FINISHED, source=FetchRun.ARCHIVESSPACE,
+                    object_type="resource", object_status="updated").order_by("-start_time")[:1],
+                 "fetchrun_last_start_idx"),
+                (FetchRun.objects.filter(
+                    status=FetchRun.FINISHED, object_type="resource",
+                    object_status="updated").order_by("-end_time")[:1],
+                 "fetchrun_last_end_idx")]:
+            plan = queryset.explain()
+            self.assertIn(index, plan, "{} was not used: {}".format(index, plan))
+
     def test_cleanup(self):
         for source_id, source in FetchRun.SOURCE_CHOICES:
             for obj_type, _ in getattr(FetchRun, "{}_OBJECT_TYPE_CHOICES".format(source.upper())):
@@ -180,37 +551,147 @@ class FetcherTest(TestCase):
                             source=source_id, object_type=obj_type,
                             object_status=obj_status, status=FetchRun.FINISHED)), 1)
 
-    @patch("fetcher.helpers.requests.post")
-    def test_handle_deleted_uris(self, mock_post):
+    @patch("fetcher.deletes.time.sleep")
+    @patch("fetcher.deletes.requests.post")
+    def test_delete_propagator(self, mock_post, mock_sleep):
         """Tests POST requests sent to delete objects"""
-        source = random.choice(FetchRun.SOURCE_CHOICES)[0]
-        object_type = random.choice(FetchRun.OBJECT_TYPE_CHOICES)[0]
-        current_run = FetchRun.objects.create(
-            object_type=object_type,
-            source=source,
-            status=random.choice(FetchRun.STATUS_CHOICES)[0],
-            object_status=random.choice(FetchRun.OBJECT_STATUS_CHOICES)[0]
-        )
-        loop = asyncio.get_event_loop()
-        uris = []
-        for x in range(random.randint(2, 10)):
-            uris.append("/repositories/2/resources/{}".format(random.randint(1, 1000)))
-        deleted = loop.run_until_complete(handle_deleted_uris(uris, source, object_type, current_run))
-        self.assertEqual(len(deleted), len(uris))
-        self.assertEqual(mock_post.call_count, 1)
-        identifiers = mock_post.call_args[1]["json"]["identifiers"]
-        self.assertTrue(isinstance(identifiers, list))
-        for es_id in identifiers:
-            self.assertEqual(len(es_id), 22, "Expected es_id to be 22 characters long.")
-            self.assertTrue(isinstance(es_id, str))
-
-        error_resp = Mock(spec=Response)
+        uris = ["/repositories/2/resources/{}".format(x) for x in range(1, 8)]
+        for uri in uris[:5]:
+            DataObject.objects.create(es_id=identifier_from_uri(uri), object_type="collection", data={})
+        propagator = DeletePropagator(chunk_size=2, retries=2, backoff=0)
+        chunks = [chunk for chunk in (propagator.add(uri) for uri in uris + uris[:2]) if chunk]
+        self.assertEqual(chunks, [uris[0:2], uris[2:4], uris[4:6]], "Expected duplicate URIs to be buffered once")
+        self.assertEqual(propagator.flush(), uris[6:])
+        self.assertEqual(propagator.flush(), [])
+        deleted = []
+        for chunk in chunks + [uris[6:]]:
+            deleted += propagator.send(chunk)
+        self.assertEqual(len(deleted), 5)
+        self.assertEqual(mock_post.call_count, 3, "Expected chunks containing unexported identifiers to be filtered")
+        for call in mock_post.call_args_list:
+            identifiers = call[1]["json"]["identifiers"]
+            self.assertTrue(isinstance(identifiers, list))
+            self.assertTrue(0 < len(identifiers) <= 2)
+            for es_id in identifiers:
+                self.assertEqual(len(es_id), 22, "Expected es_id to be 22 characters long.")
+                self.assertTrue(isinstance(es_id, str))
+        self.assertFalse(DataObject.objects.filter(es_id__in=deleted).exists())
+        self.assertEqual(
+            DataObjectChange.objects.filter(es_id__in=deleted, action=DataObjectChange.DELETED).count(), 5)
+        self.assertEqual(propagator.summary(), {
+            "discovered": 7, "not_exported": 2, "sent": 5, "deleted": 5, "failed": 0, "requests": 3, "retries": 0})
+
+        DataObject.objects.create(es_id=identifier_from_uri(uris[0]), object_type="collection", data={})
+        unavailable_resp = Mock(spec=Response, status_code=503)
+        error_resp = Mock(spec=Response, status_code=400)
         error_resp.raise_for_status.side_effect = HTTPError("blergh")
         error_resp.json.return_value = {"detail": "foo"}
-        mock_post.return_value = error_resp
-        with self.assertRaises(Exception) as context:
-            loop.run_until_complete(handle_deleted_uris(uris, source, object_type, current_run))
-            self.assertEqual(context.exception, "foo")
+        mock_post.reset_mock()
+        mock_post.side_effect = [Mock(spec=Response, status_code=429), unavailable_resp, Mock(spec=Response, status_code=200)]
+        propagator = DeletePropagator(retries=2, backoff=0)
+        self.assertEqual(propagator.send(uris[:1]), [identifier_from_uri(uris[0])])
+        self.assertEqual(mock_post.call_count, 3)
+        self.assertEqual(propagator.summary()["retries"], 2)
+        self.assertEqual(propagator.summary()["deleted"], 1)
+
+        DataObject.objects.create(es_id=identifier_from_uri(uris[0]), object_type="collection", data={})
+        mock_post.reset_mock()
+        mock_post.side_effect = [unavailable_resp, error_resp]
+        propagator = DeletePropagator(retries=2, backoff=0)
+        with self.assertRaises(DeleteError) as context:
+            propagator.send(uris[:1])
+        self.assertEqual(str(context.exception), "Error sending delete request: foo")
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertTrue(DataObject.objects.filter(es_id=identifier_from_uri(uris[0])).exists())
+        self.assertEqual(propagator.summary()["failed"], 1)
+
+        mock_post.reset_mock()
+        mock_post.side_effect = requests.exceptions.ConnectionError("refused")
+        propagator = DeletePropagator(retries=2, backoff=1)
+        with self.assertRaises(DeleteError):
+            propagator.send(uris[:1])
+        self.assertEqual(mock_post.call_count, 3)
+        self.assertEqual([call[0][0] for call in mock_sleep.call_args_list[-2:]], [1, 2])
+        self.assertEqual(propagator.summary()["retries"], 2)
+
+    @patch("fetcher.fetchers.instantiate_aspace")
+    def test_delete_feed_consumer(self, mock_aspace):
+        repository = SyntheticRepository(size=5, deleted=3)
+        server = FakeSourceServer(("127.0.0.1", 0), repository).start()
+        self.addCleanup(server.stop)
+
+        class Client:
+            def get_paged(self, path, params=None):
+                page = 1
+                while True:
+                    data = requests.get(
+                        "{}/{}".format(server.url, path), params={**params, "page": page, "page_size": 10}).json()
+                    yield from data["results"]
+                    if page >= data["last_page"]:
+                        return
+                    page += 1
+
+        mock_aspace.return_value = Mock(client=Client())
+        resources = [repository.uri("resource", i) for i in range(6, 9)]
+        subject = repository.uri("subject", 6)
+        consumer = ArchivesSpaceDeleteFeedConsumer()
+        fetcher = ArchivesSpaceDataFetcher()
+        self.assertEqual(fetcher.route("/repositories/2/digital_objects/1", fetcher.get_routes()), None)
+        self.assertEqual(fetcher.route(resources[0], fetcher.get_routes()), "resource")
+        self.assertEqual(fetcher.route("/agents/people/1", fetcher.get_routes()), "agent_person")
+
+        with override_settings(**server.source_settings(), NOTIFY_EMAIL=False, NOTIFY_TEAMS=False):
+            for uri in resources + [subject]:
+                DataObject.objects.create(es_id=identifier_from_uri(uri), object_type="collection", data={})
+            runs = consumer.consume()
+            self.assertEqual(server.requests["GET /delete-feed"], 2, "Expected the feed to be read once")
+            self.assertEqual(server.requests["POST /index/delete/"], 2)
+            self.assertEqual(len(runs), len(FetchRun.ARCHIVESSPACE_OBJECT_TYPE_CHOICES))
+            for object_type, run in runs.items():
+                self.assertEqual(run.status, FetchRun.FINISHED)
+                self.assertEqual(run.object_status, "deleted")
+                self.assertEqual(run.processed, 3)
+                self.assertEqual(run.error_count, 0)
+            self.assertEqual(runs["resource"].stats["deletes"]["deleted"], 3)
+            self.assertEqual(runs["subject"].stats["deletes"]["deleted"], 1)
+            self.assertEqual(runs["agent_family"].stats["deletes"]["sent"], 0)
+            for run in runs.values():
+                self.assertEqual(run.stats["stages"]["delete"]["count"], 1, "Expected stats for each object type")
+            self.assertEqual(runs["agent_family"].stats["feed"]["records"], 3 * len(runs))
+            self.assertFalse(DataObject.objects.exists())
+            checkpoint = FeedCheckpoint.objects.get(feed=consumer.feed)
+
+            DataObject.objects.create(es_id=identifier_from_uri(subject), object_type="term", data={})
+            with patch("fetcher.deletes.requests.post") as mock_post:
+                mock_post.return_value = Mock(spec=Response, status_code=400)
+                mock_post.return_value.raise_for_status.side_effect = HTTPError("blergh")
+                runs = consumer.consume()
+            self.assertEqual(runs["subject"].stats["feed"]["since"], int(checkpoint.position.timestamp()))
+            self.assertEqual(runs["subject"].error_count, 1)
+            self.assertEqual(runs["resource"].error_count, 0)
+            self.assertEqual(
+                FeedCheckpoint.objects.get(feed=consumer.feed).position, checkpoint.position,
+                "Expected checkpoint not to advance when deletes fail")
+
+        FeedCheckpoint.objects.all().delete()
+        FetchRun.objects.all().delete()
+        self.assertEqual(consumer.get_checkpoint(), 0)
+        # Staggered as the per-type cron jobs were, with subjects never fetched.
+        now = timezone.now()
+        start_times = {
+            "agent_family": now - timedelta(minutes=20),
+            "agent_corporate_entity": now - timedelta(minutes=15),
+            "agent_person": now - timedelta(minutes=10),
+            "resource": now - timedelta(minutes=5),
+            "archival_object": now}
+        for object_type, start_time in start_times.items():
+            run = FetchRun.objects.create(
+                status=FetchRun.FINISHED, source=FetchRun.ARCHIVESSPACE,
+                object_type=object_type, object_status="deleted", end_time=start_time + timedelta(minutes=1))
+            FetchRun.objects.filter(pk=run.pk).update(start_time=start_time)
+        self.assertEqual(
+            consumer.get_checkpoint(), int(start_times["agent_family"].timestamp()),
+            "Expected the earliest deleted run to be used before the first cycle")
 
     @patch("fetcher.fetchers.BaseDataFetcher.instantiate_clients")
     def test_client_exception(self, mock_clients):
@@ -0,0 +1,174 @@
+"""Per-record trace spans for fetch runs.
+
+Spans are keyed by the source URI of the record being processed, which is
+inherited by spans nested within them, including those started in executor
+threads once a span for the record has been opened there. Traces are exported
+in the Chrome trace event format, and can be opened in Perfetto
+(https://ui.perfetto.dev) or chrome://tracing.
+
+Tracing is off unless a Tracer has been activated, in which case `span` and
+`traced` return context managers and functions which do nothing.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+from .instrumentation import endpoint_family
+
+current_uri = ContextVar("current_uri", default=None)
+active_tracer = None
+
+
+class Tracer:
+    """Records spans from the event loop and executor threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.spans = []
+        self.thread_names = {}
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+
+    @contextmanager
+    def span(self, name, uri=None, overlapping=False, **args):
+        """Records a span for the duration of the block.
+
+        Args:
+            name (str): name of the span.
+            uri (str): source URI of the record being processed. If not given,
+                the URI of the enclosing span is used.
+            overlapping (bool): set for spans which may overlap others in the
+                same thread, such as coroutines awaiting executor tasks.
+            args: additional values to record with the span.
+        """
+        uri = uri or current_uri.get()
+        token = current_uri.set(uri)
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            args["error"] = str(e)
+            raise
+        finally:
+            current_uri.reset(token)
+            self.add_span(name, uri, start, time.perf_counter() - start, overlapping, args)
+
+    def add_span(self, name, uri, start, duration, overlapping=False, args=None, category="pisces"):
+        thread = threading.current_thread()
+        span = {
+            "name": name,
+            "category": category,
+            "uri": uri,
+            "start": start - self.origin,
+            "duration": duration,
+            "tid": thread.ident,
+            "overlapping": overlapping,
+            "args": args or {},
+        }
+        with self.lock:
+            self.spans.append(span)
+            self.thread_names.setdefault(thread.ident, thread.name)
+
+    def record_response(self, response, *args, **kwargs):
+        """Response hook which records each request as a span within the current record."""
+        elapsed = response.elapsed.total_seconds()
+        self.add_span(
+            "{} {}".format(response.request.method, endpoint_family(response.url)),
+            current_uri.get(), time.perf_counter() - elapsed, elapsed,
+            args={"url": response.url, "status": response.status_code}, category="http")
+        return response
+
+    def instrument_session(self, session):
+        """Adds a response hook to a requests Session."""
+        if self.record_response not in session.hooks["response"]:
+            session.hooks["response"].append(self.record_response)
+
+    def trace_events(self):
+        """Returns spans as a list of Chrome trace events.
+
+        Overlapping spans are written as async events, which are drawn on
+        their own tracks, and all others as complete events.
+        """
+        with self.lock:
+            spans = list(self.spans)
+            thread_names = dict(self.thread_names)
+        events = [
+            {"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}}
+            for tid, name in thread_names.items()]
+        for idx, span in enumerate(spans):
+            event = {
+                "name": span["name"],
+                "cat": span["category"],
+                "pid": self.pid,
+                "tid": span["tid"],
+                "ts": round(span["start"] * 1000000, 3),
+                "args": {**span["args"], "uri": span["uri"]} if span["uri"] else span["args"],
+            }
+            if span["overlapping"]:
+                events.append({**event, "ph": "b", "id": idx})
+                events.append({
+                    **event, "ph": "e", "id": idx, "args": {},
+                    "ts": round((span["start"] + span["duration"]) * 1000000, 3)})
+            else:
+                events.append({**event, "ph": "X", "dur": round(span["duration"] * 1000000, 3)})
+        return events
+
+    def save(self, directory, filename):
+        """Saves the trace as JSON in the Chrome trace event format."""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, filename)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.trace_events(), "displayTimeUnit": "ms"}, f)
+        return path
+
+    def slowest(self, top_n, name="record", nested_n=5):
+        """Returns the slowest spans with a name, along with the slowest spans nested in each.
+
+        Returns:
+            list: dicts with uri, seconds and spans keys, where spans lists the
+                name and seconds of nested spans with the same URI.
+        """
+        with self.lock:
+            spans = list(self.spans)
+        nested = defaultdict(list)
+        for span in spans:
+            if span["uri"] and span["name"] != name:
+                nested[span["uri"]].append(span)
+        results = []
+        for span in sorted((s for s in spans if s["name"] == name), key=lambda s: s["duration"], reverse=True)[:top_n]:
+            results.append({
+                "uri": span["uri"],
+                "seconds": round(span["duration"], 6),
+                "spans": [
+                    {"name": s["name"], "seconds": round(s["duration"], 6)}
+                    for s in sorted(nested[span["uri"]], key=lambda s: s["duration"], reverse=True)[:nested_n]],
+            })
+        return results
+
+
+def activate(tracer):
+    """Sets the tracer to which spans are recorded, or turns tracing off if tracer is None."""
+    global active_tracer
+    active_tracer = tracer
+
+
+def span(name, uri=None, **args):
+    """Returns a context manager which records a span if tracing is active."""
+    if active_tracer is None:
+        return nullcontext()
+    return active_tracer.span(name, uri, **args)
+
+
+def traced(func):
+    """Decorates a function or method so that its calls are recorded as spans."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with span(func.__qualname__):
+            return func(*args, **kwargs)
+    return wrapper
@@ -1,10 +1,19 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 
+from django.db import connection
+from django.db.models import (Avg, Count, DurationField, ExpressionWrapper, F,
+                              IntegerField, OuterRef, Subquery, Sum)
+from django.db.models.functions import Coalesce, Trunc
+from django.utils import timezone
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 
-from .models import FetchRun
+from transformer.helpers import parse_datetime_param
+
+from .aggregates import Percentile
+from .models import FetchRun, FetchRunError
 from .serializers import FetchRunListSerializer, FetchRunSerializer
 
 
@@ -17,7 +26,14 @@ class FetchRunViewSet(ModelViewSet):
         Return paginated data about all FetchRun objects.
     """
     model = FetchRun
-    queryset = FetchRun.objects.all().order_by("-start_time")
+    STATS_BUCKETS = ["hour", "day", "week", "month"]
+    STATS_DEFAULT_DAYS = 30
+
+    def get_queryset(self):
+        queryset = FetchRun.objects.annotate(num_errors=Count("fetchrunerror")).order_by("-start_time")
+        if self.action == "retrieve":
+            queryset = queryset.prefetch_related("fetchrunerror_set")
+        return queryset
 
     def get_serializer_class(self):
         if self.action not in ["create", "retrieve", "update", "partial_update", "destroy"]:
@@ -34,13 +50,14 @@ class FetchRunViewSet(ModelViewSet):
         return Response(serializer.data)
 
     def get_action_queryset(self, request, object_type, status, source):
+        queryset = self.get_queryset()
         if object_type:
-            queryset = FetchRun.objects.filter(object_type=object_type)
+            queryset = queryset.filter(object_type=object_type)
         if source is not None:
-            queryset = FetchRun.objects.filter(source=source)
+            queryset = queryset.filter(source=source)
         if status is not None:
-            queryset = FetchRun.objects.filter(status=status)
-        return queryset.order_by("-start_time")
+            queryset = queryset.filter(status=status)
+        return queryset
 
     @action(detail=False)
     def archivesspace(self, request):
@@ -48,8 +65,7 @@ class FetchRunViewSet(ModelViewSet):
 
     @action(detail=False)
     def cartographer(self, request):
-        if self.cartographer_client:
-            return self.get_action_response(request, source=FetchRun.CARTOGRAPHER)
+        return self.get_action_response(request, source=FetchRun.CARTOGRAPHER)
 
     @action(detail=False)
     def archival_objects(self, request):
@@ -87,6 +103,60 @@ class FetchRunViewSet(ModelViewSet):
     def errored(self, request):
         return self.get_action_response(request, status=FetchRun.ERRORED)
 
+    @action(detail=False)
+    def stats(self, request):
+        """Returns aggregate statistics for FetchRuns started within a window.
+
+        Runs are grouped by time bucket (hour, day, week or month), source,
+        object type and status. The window defaults to the last STATS_DEFAULT_DAYS
+        days and can be set using start and end parameters. The 95th
+        percentile of elapsed time is only calculated on PostgreSQL. Runs
+        without errors are kept for FETCH_RUN_RETENTION_DAYS, so windows
+        which start earlier only include the latest run for each object type
+        and runs with errors.
+        """
+        bucket = request.GET.get("bucket", "day")
+        if bucket not in self.STATS_BUCKETS:
+            raise ValidationError({"bucket": "Expected one of {}".format(", ".join(self.STATS_BUCKETS))})
+        end = parse_datetime_param(request.GET["end"], "end") if request.GET.get("end") else timezone.now()
+        start = parse_datetime_param(request.GET["start"], "start") if request.GET.get("start") else end - timedelta(days=self.STATS_DEFAULT_DAYS)
+        queryset = FetchRun.objects.filter(start_time__gte=start, start_time__lt=end)
+        for field in ["source", "object_type", "status"]:
+            if request.GET.get(field):
+                queryset = queryset.filter(**{field: request.GET[field]})
+
+        elapsed = ExpressionWrapper(F("end_time") - F("start_time"), output_field=DurationField())
+        run_errors = FetchRunError.objects.filter(run=OuterRef("pk")).values("run").annotate(count=Count("pk")).values("count")
+        aggregates = {
+            "runs": Count("pk"),
+            "mean_elapsed": Avg(elapsed),
+            "processed": Coalesce(Sum("processed"), 0),
+            "errors": Coalesce(Sum(Subquery(run_errors, output_field=IntegerField())), 0),
+        }
+        if connection.vendor == "postgresql":
+            aggregates["p95_elapsed"] = Percentile(elapsed, 0.95, output_field=DurationField())
+        rows = queryset.annotate(
+            bucket=Trunc("start_time", bucket)
+        ).values("bucket", "source", "object_type", "status").annotate(
+            **aggregates).order_by("bucket", "source", "object_type", "status")
+
+        results = []
+        for row in rows:
+            p95_elapsed = row.get("p95_elapsed")
+            results.append({
+                "bucket": row["bucket"],
+                "source": FetchRun.SOURCE_CHOICES[int(row["source"])][1],
+                "object_type": row["object_type"],
+                "status": FetchRun.STATUS_CHOICES[int(row["status"])][1],
+                "runs": row["runs"],
+                "mean_elapsed": row["mean_elapsed"].total_seconds() if row["mean_elapsed"] is not None else None,
+                "p95_elapsed": p95_elapsed.total_seconds() if p95_elapsed is not None else None,
+                "processed": row["processed"],
+                "errors": row["errors"],
+                "error_rate": row["errors"] / row["processed"] if row["processed"] else None,
+            })
+        return Response({"start": start, "end": end, "bucket": bucket, "results": results})
+
     @action(detail=False, methods=['post'])
     def update_time(self, request):
         now = datetime.now()
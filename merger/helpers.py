@@ -1,6 +1,7 @@
 import re
 
 from fetcher.helpers import instantiate_aspace, list_chunks
+from fetcher.tracing import traced
 from pisces import settings
 
 
@@ -122,6 +123,7 @@ class ArchivesSpaceHelper:
     def __init__(self, aspace):
         self.aspace = aspace if aspace else instantiate_aspace(settings.ARCHIVESSPACE)
 
+    @traced
     def has_children(self, uri):
         """Checks whether an archival object has children using the tree/node endpoint.
         Checks the child_count attribute and if the value is greater than 0, return true, otherwise return False."""
@@ -133,14 +135,17 @@ class ArchivesSpaceHelper:
         tree_node = self.aspace.client.get(f"{resource_uri}/tree/node?node_uri={obj['uri']}").json()
         return True if tree_node['child_count'] > 0 else False
 
+    @traced
     def tree_root(self, resource_uri):
         """Gets a resource tree starting at the root."""
         return self.aspace.client.get(f"{resource_uri}/tree/root").json()
 
+    @traced
     def tree_node(self, resource_uri, node_uri):
         """Gets a resource tree starting at a node."""
         return self.aspace.client.get(f"{resource_uri}/tree/node?node_uri={node_uri}").json()
 
+    @traced
     def objects_within(self, uri_list):
         """Gets the number of objects which have a URI in their ancestors array."""
         count = 0
@@ -154,6 +159,7 @@ class ArchivesSpaceHelper:
                 raise Exception(f"Error fetching child counts for URI {result.url}: {e}")
         return count
 
+    @traced
     def objects_before(self, target_node, initial_node, resource_uri, parent_uri=None):
         """Gets a count of previous archival objects in a resource."""
         count = 0
@@ -1,5 +1,8 @@
 from requests.exceptions import ConnectionError
 
+from fetcher.instrumentation import count_calls, count_session_calls
+from fetcher.tracing import span
+
 from .helpers import (ArchivesSpaceHelper, MissingArchivalObjectError,
                       add_group, closest_creators, closest_parent_value,
                       combine_references, handle_cartographer_reference,
@@ -19,17 +22,22 @@ class BaseMerger:
             self.cartographer_client = False
         except Exception as e:
             raise MergeError(e)
+        for client in [self.aspace_helper.aspace.client, clients.get("cartographer")]:
+            count_session_calls(getattr(client, "session", None))
+        self.calls = None
 
     def merge(self, object_type, object):
         """Main merge function.
 
         Fetches and merges additional data from secondary data sources, then
-        delivers merged data to the configured URL."""
+        delivers merged data to the configured URL. Requests made to do so are
+        counted by endpoint family in `calls`."""
         try:
             identifier = self.get_identifier(object)
-            target_object_type = self.get_target_object_type(object)
-            additional_data = self.get_additional_data(object, target_object_type)
-            return self.combine_data(object, additional_data), target_object_type
+            with span("{}.merge".format(type(self).__name__), uri=identifier), count_calls() as self.calls:
+                target_object_type = self.get_target_object_type(object)
+                additional_data = self.get_additional_data(object, target_object_type)
+                return self.combine_data(object, additional_data), target_object_type
         except MissingArchivalObjectError:
             pass
         except ConnectionError as e:
@@ -1,12 +1,15 @@
 import json
 import os
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
+import requests
 import vcr
 from django.test import TestCase
 from rest_framework.test import APIRequestFactory
 
+from fetcher.fakes import FakeSourceServer, SyntheticRepository
 from fetcher.fetchers import BaseDataFetcher
+from fetcher.instrumentation import CallBudgetExceeded, RunStats, call_budget
 
 from .mergers import (AgentMerger, ArchivalObjectMerger, ArrangementMapMerger,
                       ResourceMerger, SubjectMerger)
@@ -32,6 +35,21 @@ object_types = [
     ("arrangement_map_component", ArrangementMapMerger, ["resource"])
 ]
 
+# Maximum number of requests made to merge a record of each object type, with
+# get_position mocked.
+merge_call_budgets = {
+    "agent_corporate_entity": 0,
+    "agent_family": 0,
+    "agent_person": 0,
+    "archival_object": {
+        "GET /repositories/:id/archival_objects/:id": 1,
+        "GET /repositories/:id/resources/:id/tree/node": 1,
+    },
+    "resource": 0,
+    "subject": 0,
+    "arrangement_map_component": 2,
+}
+
 
 class MergerTest(TestCase):
     """Tests Merger."""
@@ -54,7 +72,8 @@ class MergerTest(TestCase):
                 for f in os.listdir(os.path.join("fixtures", "merger", source_object_type)):
                     with open(os.path.join("fixtures", "merger", source_object_type, f), "r") as json_file:
                         source = json.load(json_file)
-                        merged, t = merger(clients).merge(source_object_type, source)
+                        with call_budget(merge_call_budgets[source_object_type]):
+                            merged, t = merger(clients).merge(source_object_type, source)
                         # with open(os.path.join("fixtures", "transformer", t, "{}.json".format(merged["uri"].split("/")[-1])), "w") as df:
                         #     json.dump(merged, df, indent=4, sort_keys=True)
                         self.assertNotEqual(
@@ -123,6 +142,46 @@ class MergerTest(TestCase):
                     self.not_empty(obj.get("type")),
                     "Type field of {} in {} is empty".format(obj.get("ref"), merged.get("uri")))
 
+    def test_merge_calls(self):
+        """Asserts that requests made by merges are counted and checked against budgets."""
+        repository = SyntheticRepository(size=40, depth=3, breadth=3)
+        server = FakeSourceServer(("127.0.0.1", 0), repository).start()
+        self.addCleanup(server.stop)
+
+        class Client:
+            session = requests.Session()
+
+            def get(self, path, params=None):
+                return self.session.get("{}/{}".format(server.url, path.lstrip("/")), params=params)
+
+        clients = {"aspace": Mock(client=Client())}
+        merger = ArchivalObjectMerger(clients)
+        merger.merge("archival_object", repository.archival_object(13))
+        self.assertEqual(merger.calls["GET /repositories/:id/archival_objects/:id"], 1)
+        self.assertEqual(merger.calls["GET /repositories/:id/resources/:id/tree/root"], 1)
+        self.assertEqual(merger.calls["GET /repositories/:id/resources/:id/tree/node"], 3)
+        self.assertEqual(sum(merger.calls.values()), server.request_count())
+
+        with patch("merger.mergers.ArchivalObjectMerger.get_position") as mock_position:
+            mock_position.return_value = 1
+            with call_budget(merge_call_budgets["archival_object"]) as calls:
+                ArchivalObjectMerger(clients).merge("archival_object", repository.archival_object(13))
+            self.assertEqual(sum(calls.values()), 2)
+            with self.assertRaises(CallBudgetExceeded):
+                with call_budget({"GET /repositories/:id/archival_objects/:id": 1}):
+                    ArchivalObjectMerger(clients).merge("archival_object", repository.archival_object(13))
+        with self.assertRaises(CallBudgetExceeded):
+            with call_budget(2):
+                ArchivalObjectMerger(clients).merge("archival_object", repository.archival_object(13))
+
+        stats = RunStats()
+        stats.add_merge_calls(merger.calls)
+        stats.add_merge_calls(calls)
+        summary = stats.summary()["merge_calls"]
+        self.assertEqual(summary["records"], 2)
+        self.assertEqual(summary["total"], sum(merger.calls.values()) + 2)
+        self.assertEqual(summary["endpoints"]["GET /repositories/:id/archival_objects/:id"], 2)
+
     def test_parse_instances(self):
         with merger_vcr.use_cassette("archival_object-merge.json"):
             clients = BaseDataFetcher().instantiate_clients()
@@ -0,0 +1,83 @@
+"""Prometheus metrics for the fetch pipeline and API.
+
+Metrics are recorded in-process with prometheus_client. When
+PROMETHEUS_MULTIPROC_DIR is set, each process writes its samples to that
+directory and the metrics view aggregates them, so that metrics from all
+WSGI and cron processes are exposed by any one of them.
+"""
+
+import os
+
+from django.db.models import Count
+from django.http import HttpResponse
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+from prometheus_client.core import GaugeMetricFamily
+
+from fetcher.instrumentation import endpoint_family
+from transformer.models import DataObject
+
+RECORDS_PROCESSED = Counter(
+    "pisces_records_processed_total",
+    "Records handled by fetch runs.",
+    ["source", "object_type", "outcome"])
+MERGE_SECONDS = Histogram(
+    "pisces_merge_seconds",
+    "Time taken to merge a record.",
+    ["object_type"])
+TRANSFORM_SECONDS = Histogram(
+    "pisces_transform_seconds",
+    "Time taken to transform, validate and save a record.",
+    ["object_type"])
+UPSTREAM_REQUEST_SECONDS = Histogram(
+    "pisces_upstream_request_seconds",
+    "Latency of requests to ArchivesSpace and Cartographer.",
+    ["service", "endpoint"])
+UPSTREAM_REQUESTS = Counter(
+    "pisces_upstream_requests_total",
+    "Requests to ArchivesSpace and Cartographer by response status code.",
+    ["service", "endpoint", "status"])
+INDEX_ACKNOWLEDGEMENTS = Counter(
+    "pisces_index_acknowledgements_total",
+    "DataObjects acknowledged by indexers as indexed or deleted.",
+    ["action"])
+
+
+def response_hook(service):
+    """Returns a requests response hook which observes upstream requests to a service."""
+    def observe(response, *args, **kwargs):
+        endpoint = "{} {}".format(response.request.method, endpoint_family(response.url))
+        UPSTREAM_REQUEST_SECONDS.labels(service, endpoint).observe(response.elapsed.total_seconds())
+        UPSTREAM_REQUESTS.labels(service, endpoint, str(response.status_code)).inc()
+        return response
+    return observe
+
+
+class BacklogCollector:
+    """Reports counts of unindexed and online pending DataObjects when scraped."""
+
+    def collect(self):
+        backlog = GaugeMetricFamily(
+            "pisces_dataobject_backlog",
+            "DataObjects waiting to be indexed or for online assets.",
+            labels=["state", "object_type"])
+        for state, queryset in [
+                ("unindexed", DataObject.objects.filter(indexed=False)),
+                ("online_pending", DataObject.objects.filter(online_pending=True))]:
+            counts = dict(queryset.order_by().values_list("object_type").annotate(count=Count("pk")))
+            for object_type, _ in DataObject.TYPE_CHOICES:
+                backlog.add_metric([state, object_type], counts.get(object_type, 0))
+        yield backlog
+
+
+def metrics_view(request):
+    """Exposes metrics in the Prometheus text format."""
+    registry = CollectorRegistry()
+    registry.register(BacklogCollector())
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.MultiProcessCollector(registry)
+        output = generate_latest(registry)
+    else:
+        output = generate_latest(REGISTRY) + generate_latest(registry)
+    return HttpResponse(output, content_type=CONTENT_TYPE_LATEST)
@@ -136,12 +136,7 @@ REST_FRAMEWORK = {
 
 # Django cron settings
 CRON_CLASSES = [
-    "fetcher.cron.DeletedArchivesSpaceArchivalObjects",
-    "fetcher.cron.DeletedArchivesSpaceFamilies",
-    "fetcher.cron.DeletedArchivesSpaceOrganizations",
-    "fetcher.cron.DeletedArchivesSpacePeople",
-    "fetcher.cron.DeletedArchivesSpaceResources",
-    "fetcher.cron.DeletedArchivesSpaceSubjects",
+    "fetcher.cron.DeletedArchivesSpaceRecords",
     "fetcher.cron.UpdatedArchivesSpaceArchivalObjects",
     "fetcher.cron.UpdatedArchivesSpaceFamilies",
     "fetcher.cron.UpdatedArchivesSpaceOrganizations",
@@ -169,7 +164,13 @@ CARTOGRAPHER = {
 }
 
 CHUNK_SIZE = config.CHUNK_SIZE
+FETCH_RUN_RETENTION_DAYS = getattr(config, 'FETCH_RUN_RETENTION_DAYS', 30)
+FETCH_MAX_IN_FLIGHT = getattr(config, 'FETCH_MAX_IN_FLIGHT', CHUNK_SIZE)
+FETCH_MEMORY_CEILING_MB = getattr(config, 'FETCH_MEMORY_CEILING_MB', None)
 INDEX_DELETE_URL = config.INDEX_DELETE_URL
+DELETE_CHUNK_SIZE = getattr(config, 'DELETE_CHUNK_SIZE', 500)
+DELETE_RETRIES = getattr(config, 'DELETE_RETRIES', 3)
+DELETE_BACKOFF = getattr(config, 'DELETE_BACKOFF', 1)
 
 # Email settings
 EMAIL_HOST = config.EMAIL_HOST
@@ -195,4 +196,30 @@ PHOTOGRAPH_REFS = config.PHOTOGRAPH_REFS
 # Base URL for online assets
 ASSET_BASEURL = config.ASSET_BASEURL
 
+# Online asset availability checks
+ASSET_CACHE_TTL = getattr(config, 'ASSET_CACHE_TTL', 3600)
+ASSET_NEGATIVE_CACHE_TTL = getattr(config, 'ASSET_NEGATIVE_CACHE_TTL', 600)
+ASSET_CACHE_MAX_SIZE = getattr(config, 'ASSET_CACHE_MAX_SIZE', 100000)
+ASSET_CHECK_WORKERS = getattr(config, 'ASSET_CHECK_WORKERS', 10)
+ONLINE_ASSET_SWEEP_SIZE = getattr(config, 'ONLINE_ASSET_SWEEP_SIZE', 10000)
+OBJECTS_PAGE_SIZE = getattr(config, 'OBJECTS_PAGE_SIZE', 200)
+OBJECTS_MAX_PAGE_SIZE = getattr(config, 'OBJECTS_MAX_PAGE_SIZE', 1000)
+EXPORT_CHUNK_SIZE = getattr(config, 'EXPORT_CHUNK_SIZE', 2000)
+INDEX_COMPLETE_CHUNK_SIZE = getattr(config, 'INDEX_COMPLETE_CHUNK_SIZE', 1000)
+CLAIM_TTL = getattr(config, 'CLAIM_TTL', 600)
+CHANGES_SETTLE_SECONDS = getattr(config, 'CHANGES_SETTLE_SECONDS', 5)
+CHANGES_RETENTION_DAYS = getattr(config, 'CHANGES_RETENTION_DAYS', 30)
+CHANGES_CLEANUP_BATCH_SIZE = getattr(config, 'CHANGES_CLEANUP_BATCH_SIZE', 10000)
+BATCH_MAX_SIZE = getattr(config, 'BATCH_MAX_SIZE', 1000)
+FETCH_PROFILE_JOBS = getattr(config, 'FETCH_PROFILE_JOBS', [])
+FETCH_PROFILE_DIR = getattr(config, 'FETCH_PROFILE_DIR', os.path.join(BASE_DIR, 'profiles'))
+FETCH_PROFILE_TOP_N = getattr(config, 'FETCH_PROFILE_TOP_N', 25)
+FETCH_TRACE_JOBS = getattr(config, 'FETCH_TRACE_JOBS', [])
+FETCH_TRACE_DIR = getattr(config, 'FETCH_TRACE_DIR', os.path.join(BASE_DIR, 'traces'))
+FETCH_TRACE_SLOWEST = getattr(config, 'FETCH_TRACE_SLOWEST', 10)
+PROMETHEUS_MULTIPROC_DIR = getattr(config, 'PROMETHEUS_MULTIPROC_DIR', None)
+if PROMETHEUS_MULTIPROC_DIR:
+    # Must be set before prometheus_client is imported.
+    os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', PROMETHEUS_MULTIPROC_DIR)
+
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
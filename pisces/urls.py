@@ -19,13 +19,16 @@ from django.urls import include, path, re_path
 from rest_framework.schemas import get_schema_view
 
 from fetcher.views import FetchRunViewSet
-from transformer.views import DataObjectUpdateByIdView, DataObjectViewSet
+from transformer.views import (DataObjectChangeViewSet,
+                               DataObjectUpdateByIdView, DataObjectViewSet)
 
+from .metrics import metrics_view
 from .routers import PiscesRouter
 
 router = PiscesRouter()
 router.register(r'fetches', FetchRunViewSet, 'fetchrun')
 router.register(r'objects', DataObjectViewSet, 'dataobject')
+router.register(r'changes', DataObjectChangeViewSet, 'dataobjectchange')
 
 schema_view = get_schema_view(
     title="Pisces API",
@@ -37,6 +40,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     re_path(r'^index-complete/$', DataObjectUpdateByIdView.as_view(), name='index-action-complete'),
     path('status/', PingView.as_view(), name='ping'),
+    path('metrics/', metrics_view, name='metrics'),
     path('schema/', schema_view, name='schema'),
     path('', include(router.urls)),
 ]
@@ -0,0 +1,156 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from fetcher.helpers import identifier_from_uri
+
+
+def asset_url(identifier):
+    """Returns the URL at which an online asset for an identifier is expected."""
+    return "{}/pdfs/{}".format(settings.ASSET_BASEURL.rstrip("/"), identifier)
+
+
+def has_digital_instance(instances):
+    """Returns a boolean indicating whether a list of source instances contains
+    a digital object instance.
+
+    Handles both odin resources and dicts, so it can be used before and during
+    mapping.
+    """
+    for instance in instances:
+        instance_type = instance.get("instance_type") if isinstance(instance, dict) else instance.instance_type
+        if instance_type == "digital_object":
+            return True
+    return False
+
+
+class OnlineAssetChecker:
+    """Checks whether online assets are available.
+
+    HEAD requests are sent from a single executor through a pooled session, so
+    no more than ASSET_CHECK_WORKERS checks are in flight at once however many
+    callers there are, and each has a pooled connection to reuse. Positive
+    results are cached for ASSET_CACHE_TTL seconds, and negative results for
+    ASSET_NEGATIVE_CACHE_TTL seconds.
+    """
+
+    def __init__(self):
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._session = None
+        self._executor = None
+
+    @property
+    def session(self):
+        with self._lock:
+            if not self._session:
+                adapter = HTTPAdapter(pool_maxsize=settings.ASSET_CHECK_WORKERS)
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._session = session
+            return self._session
+
+    @property
+    def executor(self):
+        with self._lock:
+            if not self._executor:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=settings.ASSET_CHECK_WORKERS, thread_name_prefix="asset-check")
+            return self._executor
+
+    def probe(self, identifier):
+        """Sends a HEAD request for an asset and caches the result."""
+        available = self.session.head(asset_url(identifier)).status_code == 200
+        self.store(identifier, available)
+        return available
+
+    def store(self, identifier, available):
+        """Caches the availability of an asset."""
+        ttl = settings.ASSET_CACHE_TTL if available else settings.ASSET_NEGATIVE_CACHE_TTL
+        with self._lock:
+            if len(self._cache) >= settings.ASSET_CACHE_MAX_SIZE:
+                self._purge()
+            self._cache[identifier] = (available, time.monotonic() + ttl)
+
+    def cached(self, identifier):
+        """Returns a cached result, or None if there is no current result."""
+        with self._lock:
+            entry = self._cache.get(identifier)
+        if entry and entry[1] > time.monotonic():
+            return entry[0]
+        return None
+
+    def is_available(self, identifier):
+        """Returns a boolean indicating whether an asset is available online.
+
+        Cached results are used where present, so this is a local lookup for
+        identifiers which have already been checked by `check_many`. On a
+        cache miss, for example when a record is transformed without having
+        been prefetched, the asset is checked synchronously.
+        """
+        available = self.cached(identifier)
+        return self.probe(identifier) if available is None else available
+
+    def check_many(self, identifiers, refresh=False):
+        """Concurrently checks availability of assets for a list of identifiers.
+
+        Args:
+            identifiers (list): asset identifiers to check.
+            refresh (bool): if True, cached results are ignored.
+
+        Returns:
+            dict: availability keyed by identifier. Identifiers which could not
+                be checked because of request errors are omitted.
+        """
+        results = {}
+        to_probe = []
+        for identifier in set(identifiers):
+            available = None if refresh else self.cached(identifier)
+            if available is None:
+                to_probe.append(identifier)
+            else:
+                results[identifier] = available
+        if to_probe:
+            for identifier, available in zip(to_probe, self.executor.map(self._safe_probe, to_probe)):
+                if available is not None:
+                    results[identifier] = available
+        return results
+
+    def clear(self):
+        with self._lock:
+            self._cache = {}
+
+    def _safe_probe(self, identifier):
+        try:
+            return self.probe(identifier)
+        except requests.exceptions.RequestException as e:
+            print("Unable to check online asset for {}: {}".format(identifier, e))
+            return None
+
+    def _purge(self):
+        """Removes expired entries, clearing the cache entirely if it is still full."""
+        now = time.monotonic()
+        self._cache = {k: v for k, v in self._cache.items() if v[1] > now}
+        if len(self._cache) >= settings.ASSET_CACHE_MAX_SIZE:
+            self._cache = {}
+
+
+asset_checker = OnlineAssetChecker()
+
+
+def prefetch_online_assets(records):
+    """Checks online assets for a batch of source records ahead of transformation.
+
+    Only archival objects with digital object instances are checked, since
+    those are the only records whose `online` field depends on an asset: both
+    mappings which call `has_online_asset` map archival objects.
+    """
+    identifiers = [
+        identifier_from_uri(record["uri"]) for record in records
+        if record.get("jsonmodel_type") == "archival_object" and has_digital_instance(record.get("instances", []))]
+    return asset_checker.check_many(identifiers)
@@ -0,0 +1,235 @@
+import gc
+import itertools
+import json
+import os
+import platform
+import resource
+import time
+import timeit
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from subprocess import CalledProcessError, check_output
+
+from django.conf import settings
+from django.utils import timezone
+
+from fetcher.helpers import identifier_from_uri
+from merger.helpers import add_group, combine_references
+
+from .assets import asset_checker, has_digital_instance
+from .text import cached_parse_tags, parse_tags, strip_tags
+from .transformers import Transformer, TransformError
+
+FIXTURE_DIR = os.path.join(settings.BASE_DIR, "fixtures")
+TRANSFORMER_OBJECT_TYPES = [
+    "agent_corporate_entity", "agent_family", "agent_person", "archival_object",
+    "archival_object_collection", "resource", "subject"]
+MERGER_OBJECT_TYPES = [
+    "agent_corporate_entity", "agent_family", "agent_person", "archival_object",
+    "arrangement_map_component", "resource", "subject"]
+# Merger fixtures of these types can be merged without network access.
+OFFLINE_MERGE_TYPES = [
+    "agent_corporate_entity", "agent_family", "agent_person", "resource", "subject"]
+STAGES = ["decode", "map", "serialize", "strip", "validate", "persist"]
+TEXT_SAMPLES = {
+    "plain_title": "Series 3: Correspondence, 1932-1947",
+    "markup_title": "<title render=\"italic\">The Rockefeller Foundation</title> Annual Report",
+    "entity_title": "Grants &amp; Fellowships",
+    "invalid_markup": "Letters <emph>from Paris, 1920",
+    "plain_note": " ".join(["The collection contains correspondence, reports and photographs."] * 20),
+    "markup_note": " ".join(["The <emph render=\"bold\">collection</emph> contains <extref href=\"https://example.com\">reports</extref>."] * 20),
+}
+
+
+class StageTimer:
+    """Accumulates elapsed time for named stages.
+
+    Instances can be passed to a Transformer as its `timer`.
+    """
+
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    @contextmanager
+    def __call__(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.totals[stage] += time.perf_counter() - start
+            self.counts[stage] += 1
+
+    def summary(self):
+        return {
+            stage: {
+                "seconds": round(self.totals[stage], 6),
+                "mean_ms": round(self.totals[stage] / self.counts[stage] * 1000, 6) if self.counts[stage] else 0}
+            for stage in STAGES}
+
+
+class BenchmarkTransformer(Transformer):
+    """Transformer which does not write to the database."""
+
+    def save_validated(self, data, online_pending):
+        pass
+
+
+def prepare_merger_fixture(object_type, data):
+    """Merges a merger fixture without making any requests.
+
+    Returns None for object types which cannot be merged without fetching data
+    from ArchivesSpace or Cartographer.
+    """
+    if object_type not in OFFLINE_MERGE_TYPES:
+        return None
+    if object_type == "resource":
+        data["ancestors"] = []
+        data["position"] = 0
+    return combine_references(add_group(data, None))
+
+
+def load_fixtures(object_types=None):
+    """Loads transformer fixtures and offline-mergeable merger fixtures.
+
+    Args:
+        object_types (list): optional list of object types to load.
+
+    Returns:
+        tuple: a dict of source records keyed by object type, and a dict of
+            counts of merger fixtures which could not be loaded.
+    """
+    corpus = defaultdict(list)
+    skipped = defaultdict(int)
+    for fixture_type, fixture_object_types in [
+            ("transformer", TRANSFORMER_OBJECT_TYPES),
+            ("merger", MERGER_OBJECT_TYPES)]:
+        for object_type in fixture_object_types:
+            target_type = "resource" if object_type == "arrangement_map_component" else object_type
+            if object_types and target_type not in object_types:
+                continue
+            fixture_dir = os.path.join(FIXTURE_DIR, fixture_type, object_type)
+            for f in sorted(os.listdir(fixture_dir)):
+                with open(os.path.join(fixture_dir, f), "r") as json_file:
+                    data = json.load(json_file)
+                if fixture_type == "merger":
+                    data = prepare_merger_fixture(object_type, data)
+                    if not data:
+                        skipped[object_type] += 1
+                        continue
+                corpus[target_type].append(data)
+    return corpus, skipped
+
+
+def seed_online_assets(records):
+    """Caches online asset checks as unavailable so mapping makes no requests."""
+    for record in records:
+        if record.get("uri") and has_digital_instance(record.get("instances", [])):
+            asset_checker.store(identifier_from_uri(record["uri"]), False)
+
+
+def benchmark_object_type(object_type, records, corpus_size):
+    """Transforms a corpus of records of a single object type.
+
+    The corpus is built by repeating records until it contains corpus_size
+    records. Peak Python heap usage is measured in a separate pass over each
+    record once, so that tracing does not distort timings.
+    """
+    seed_online_assets(records)
+    timer = StageTimer()
+    transformer = BenchmarkTransformer(timer=timer)
+    errors = 0
+    gc.collect()
+    start = time.perf_counter()
+    for record in itertools.islice(itertools.cycle(records), corpus_size):
+        try:
+            transformer.run(object_type, record)
+        except TransformError:
+            errors += 1
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    untimed = BenchmarkTransformer()
+    for record in records:
+        try:
+            untimed.run(object_type, record)
+        except TransformError:
+            pass
+    _, peak_heap = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "fixtures": len(records),
+        "records": corpus_size,
+        "errors": errors,
+        "seconds": round(elapsed, 6),
+        "records_per_second": round(corpus_size / elapsed, 3) if elapsed else None,
+        "stages": timer.summary(),
+        "peak_heap_bytes": peak_heap,
+    }
+
+
+def git_revision():
+    try:
+        return check_output(["git", "rev-parse", "HEAD"], cwd=settings.BASE_DIR).decode("utf-8").strip()
+    except (CalledProcessError, OSError):
+        return None
+
+
+def run_transformer_benchmark(corpus_size, object_types=None):
+    """Benchmarks Transformer.run for each object type in isolation.
+
+    Args:
+        corpus_size (int): number of records to transform for each object type.
+        object_types (list): optional list of object types to benchmark.
+
+    Returns:
+        dict: machine-readable results.
+    """
+    corpus, skipped = load_fixtures(object_types)
+    results = {}
+    for object_type in sorted(corpus):
+        results[object_type] = benchmark_object_type(object_type, corpus[object_type], corpus_size)
+    return {
+        "metadata": {
+            "corpus_size": corpus_size,
+            "python": platform.python_version(),
+            "revision": git_revision(),
+            "timestamp": timezone.now().isoformat(),
+        },
+        "object_types": results,
+        "skipped_fixtures": dict(skipped),
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def run_text_benchmark(iterations):
+    """Compares strip_tags with parsing every string, for a set of sample strings.
+
+    Args:
+        iterations (int): number of calls timed for each sample.
+
+    Returns:
+        dict: machine-readable results, with times in microseconds per call.
+    """
+    results = {}
+    for name, sample in TEXT_SAMPLES.items():
+        cached_parse_tags.cache_clear()
+        parsed = timeit.timeit(lambda: parse_tags(sample), number=iterations) / iterations * 1e6
+        stripped = timeit.timeit(lambda: strip_tags(sample), number=iterations) / iterations * 1e6
+        results[name] = {
+            "length": len(sample),
+            "parse_us": round(parsed, 3),
+            "strip_tags_us": round(stripped, 3),
+            "speedup": round(parsed / stripped, 2) if stripped else None,
+        }
+    return {
+        "metadata": {
+            "iterations": iterations,
+            "python": platform.python_version(),
+            "revision": git_revision(),
+            "timestamp": timezone.now().isoformat(),
+        },
+        "samples": results,
+    }
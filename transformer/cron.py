@@ -1,23 +1,95 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
 from django_cron import CronJobBase, Schedule
 
-from .mappings import has_online_asset
-from .models import DataObject
+from .assets import asset_checker
+from .models import DataObject, DataObjectChange
 
 
 class CheckMissingOnlineAssets(CronJobBase):
+    """Checks whether online assets have been added for pending objects.
+
+    Each run checks a slice of at most ONLINE_ASSET_SWEEP_SIZE objects, starting
+    with those which were checked least recently. Objects which have been
+    pending for a long time are checked less often, according to
+    BACKOFF_SCHEDULE.
+    """
     code = "transformer.online_assets"
     RUN_EVERY_MINS = 0
     schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
+    # Pairs of (days pending, minimum days between checks). Objects pending
+    # for longer than the last entry are checked every MAX_CHECK_INTERVAL days.
+    BACKOFF_SCHEDULE = ((7, 0), (30, 7))
+    MAX_CHECK_INTERVAL = 30
 
     def do(self):
         print("Checking for recently added assets at {}".format(datetime.now()))
-        for object in DataObject.objects.filter(object_type__in=["collection", "object"], online_pending=True).iterator():
-            if has_online_asset(object.es_id):
-                object.data["online"] = True
-                object.online_pending = False
-                object.indexed = False
-                object.save()
-                print("Online assets discovered for {}".format(object.es_id))
+        now = timezone.now()
+        es_ids = list(self.get_due_objects(now).values_list("es_id", flat=True)[:settings.ONLINE_ASSET_SWEEP_SIZE])
+        results = asset_checker.check_many(es_ids, refresh=True)
+        available = [es_id for es_id, online in results.items() if online]
+        updated = []
+        for object in DataObject.objects.filter(es_id__in=available).iterator():
+            object.data["online"] = True
+            object.content_hash = DataObject.hash_data(object.data)
+            object.online_pending = False
+            object.online_pending_since = None
+            object.online_checked = now
+            object.indexed = False
+            object.last_modified = now
+            updated.append(object)
+            print("Online assets discovered for {}".format(object.es_id))
+        with transaction.atomic():
+            DataObject.objects.bulk_update(
+                updated,
+                ["data", "content_hash", "online_pending", "online_pending_since", "online_checked", "indexed", "last_modified"],
+                batch_size=500)
+            DataObjectChange.record(DataObjectChange.UPDATED, [(obj.es_id, obj.object_type) for obj in updated])
+        DataObject.objects.filter(
+            es_id__in=[es_id for es_id, online in results.items() if not online]).update(online_checked=now)
+        print("{} objects checked, {} with online assets".format(len(results), len(updated)))
         print("Finished checking for recently added assets at {}\n".format(datetime.now()))
+
+    def get_due_objects(self, now):
+        """Returns pending objects which are due to be checked, least recently checked first."""
+        due = Q(online_checked__isnull=True) | Q(online_pending_since__isnull=True)
+        for days_pending, interval in self.BACKOFF_SCHEDULE:
+            due |= Q(
+                online_pending_since__gt=now - timedelta(days=days_pending),
+                online_checked__lte=now - timedelta(days=interval))
+        due |= Q(online_checked__lte=now - timedelta(days=self.MAX_CHECK_INTERVAL))
+        return DataObject.objects.filter(
+            due, object_type__in=["collection", "object"], online_pending=True
+        ).order_by(F("online_checked").asc(nulls_first=True))
+
+
+class CleanUpChanges(CronJobBase):
+    """Deletes DataObjectChanges older than CHANGES_RETENTION_DAYS.
+
+    The most recent change is always kept, so the feed's last sequence number
+    is never lost. Rows are deleted by sequence number in batches of
+    CHANGES_CLEANUP_BATCH_SIZE to keep transactions short.
+    """
+    code = "transformer.cleanup_changes"
+    RUN_EVERY_MINS = 0
+    schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
+
+    def do(self):
+        print("Cleaning up DataObject changes at {}".format(datetime.now()))
+        cutoff = timezone.now() - timedelta(days=settings.CHANGES_RETENTION_DAYS)
+        latest = DataObjectChange.objects.order_by("-sequence").values_list("sequence", flat=True).first()
+        expired = DataObjectChange.objects.filter(
+            timestamp__lt=cutoff, sequence__lt=latest or 0).order_by("-sequence").values_list("sequence", flat=True).first()
+        deleted = 0
+        while expired:
+            batch = list(DataObjectChange.objects.filter(sequence__lte=expired).order_by("sequence").values_list(
+                "sequence", flat=True)[:settings.CHANGES_CLEANUP_BATCH_SIZE])
+            if not batch:
+                break
+            deleted += DataObjectChange.objects.filter(sequence__lte=batch[-1]).delete()[0]
+        print("{} DataObject changes older than {} deleted".format(deleted, cutoff))
+        return deleted
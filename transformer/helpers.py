@@ -0,0 +1,154 @@
+import hashlib
+import json
+import zlib
+from datetime import datetime
+from datetime import timezone as dt_timezone
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+
+from .models import DataObject
+
+# Approximate size in characters of each chunk written to a streaming response.
+EXPORT_BUFFER_SIZE = 64 * 1024
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Renders data as a single line of newline-delimited JSON.
+
+    Streaming responses bypass renderers, so this is only used for errors and
+    to allow clients to request application/x-ndjson.
+    """
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return (json.dumps(data, cls=DjangoJSONEncoder) + "\n").encode(self.charset)
+
+
+class IdentifierListParser(BaseParser):
+    """Parses a plain text body containing one identifier per line.
+
+    Identifiers are returned as a generator which reads the request body line
+    by line, so large lists are never held in memory at once.
+    """
+    media_type = "text/plain"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get("encoding", "utf-8")
+        return {"identifiers": (line.decode(encoding).strip() for line in stream if line.strip())}
+
+
+def parse_datetime_param(value, name):
+    """Parses a query parameter containing an ISO 8601 datetime or a UTC timestamp.
+
+    Args:
+        value (str): the parameter value.
+        name (str): the parameter name, used in error messages.
+
+    Returns:
+        datetime: a timezone-aware datetime.
+    """
+    try:
+        return datetime.fromtimestamp(float(value), tz=dt_timezone.utc)
+    except (OverflowError, ValueError):
+        pass
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        parsed = None
+    if not parsed:
+        raise ValidationError({name: "Expected an ISO 8601 datetime or a timestamp, got {}".format(value)})
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+def buffer_chunks(strings, size=EXPORT_BUFFER_SIZE):
+    """Combines an iterable of strings into chunks of roughly size characters."""
+    buffer = []
+    buffered = 0
+    for string in strings:
+        buffer.append(string)
+        buffered += len(string)
+        if buffered >= size:
+            yield "".join(buffer)
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def ndjson_chunks(queryset, chunk_size):
+    """Yields DataObjects in a queryset as newline-delimited JSON.
+
+    Rows are read from a server-side cursor in batches of chunk_size and lines
+    are combined into chunks of roughly EXPORT_BUFFER_SIZE characters.
+    """
+    encoder = DjangoJSONEncoder(separators=(",", ":"))
+    return buffer_chunks(
+        encoder.encode(obj) + "\n" for obj in queryset.values(*DataObject.SERIALIZED_FIELDS).iterator(chunk_size=chunk_size))
+
+
+def batch_chunks(queryset, requested, chunk_size):
+    """Yields a JSON object listing DataObjects in a queryset and missing identifiers.
+
+    Objects are streamed as they are read from the database. `requested`
+    maps each es_id to the identifier or URI which was submitted for it, and
+    submitted values which did not match an object are listed once all
+    objects have been written.
+    """
+    encoder = DjangoJSONEncoder(separators=(",", ":"))
+    found = set()
+
+    def strings():
+        yield '{"results":['
+        for idx, obj in enumerate(queryset.values(*DataObject.SERIALIZED_FIELDS).iterator(chunk_size=chunk_size)):
+            found.add(obj["es_id"])
+            yield ("," if idx else "") + encoder.encode(obj)
+        yield '],"missing":{}}}'.format(encoder.encode([submitted for es_id, submitted in requested.items() if es_id not in found]))
+
+    return buffer_chunks(strings())
+
+
+def gzip_chunks(chunks):
+    """Compresses an iterable of strings into a gzip stream."""
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk.encode("utf-8"))
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def data_etag(data):
+    """Returns a strong entity tag for data which can be serialized as JSON."""
+    serialized = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True, separators=(",", ":"))
+    return '"{}"'.format(hashlib.sha256(serialized.encode("utf-8")).hexdigest())
+
+
+def set_validators(response, etag, last_modified=None):
+    """Sets ETag and, if a last_modified datetime is given, Last-Modified headers."""
+    response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified.timestamp())
+    return response
+
+
+def conditional_response(request, etag, last_modified=None):
+    """Returns a 304 or 412 response if the request's preconditions call for one.
+
+    Returns None if a full response should be sent.
+    """
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(last_modified.timestamp()) if last_modified else None)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
@@ -0,0 +1,43 @@
+from functools import lru_cache
+
+from iso639 import languages
+
+from pisces import settings
+
+from .resources.configs import NOTE_TYPE_CHOICES, NOTE_TYPE_CHOICES_TRANSFORM
+
+
+def choices_index(choices):
+    """Returns a dict of choice labels keyed by value.
+
+    Where a value appears more than once, the first label is kept.
+    """
+    index = {}
+    for value, label in choices:
+        index.setdefault(value, label)
+    return index
+
+
+NOTE_TYPE_TITLES = choices_index(NOTE_TYPE_CHOICES)
+NOTE_TYPES_TRANSFORM = frozenset(NOTE_TYPE_CHOICES_TRANSFORM)
+AGENT_REFERENCE_TYPES = {
+    "agent_corporate_entity": "organization",
+    "agent_person": "person",
+    "agent_family": "family"
+}
+FORMAT_REFS = (
+    (frozenset(settings.MOVING_IMAGE_REFS), "moving image"),
+    (frozenset(settings.AUDIO_REFS), "audio"),
+    (frozenset(settings.PHOTOGRAPH_REFS), "photographs"),
+)
+
+
+@lru_cache(maxsize=None)
+def language_name(code):
+    """Returns the name of a language identified by an ISO 639-2/B code."""
+    return languages.get(part2b=code).name
+
+
+def formats_for_refs(refs):
+    """Returns the formats matched by a set of subject refs, in configured order."""
+    return [format for format_refs, format in FORMAT_REFS if not format_refs.isdisjoint(refs)]
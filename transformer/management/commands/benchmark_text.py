@@ -0,0 +1,18 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from transformer.benchmarks import run_text_benchmark
+
+
+class Command(BaseCommand):
+    help = "Benchmarks stripping tags from sample titles and notes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--iterations", type=int, default=10000,
+            help="Number of calls timed for each sample string.")
+
+    def handle(self, *args, **options):
+        results = run_text_benchmark(options["iterations"])
+        self.stdout.write(json.dumps(results, indent=2, sort_keys=True))
@@ -0,0 +1,29 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from transformer.benchmarks import (TRANSFORMER_OBJECT_TYPES,
+                                    run_transformer_benchmark)
+
+
+class Command(BaseCommand):
+    help = "Benchmarks transformation of fixture data, without writing to the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--size", type=int, default=1000,
+            help="Number of records to transform for each object type.")
+        parser.add_argument(
+            "--object-type", action="append", dest="object_types", choices=TRANSFORMER_OBJECT_TYPES,
+            help="Object type to benchmark. Can be repeated, defaults to all object types.")
+        parser.add_argument(
+            "--output", help="Path of a file to write JSON results to, defaults to stdout.")
+
+    def handle(self, *args, **options):
+        results = run_transformer_benchmark(options["size"], options["object_types"])
+        output = json.dumps(results, indent=2, sort_keys=True)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
@@ -1,15 +1,12 @@
 import json
-import re
-import xml.etree.ElementTree as ET
 
 import odin
-import requests
-from iso639 import languages
 
 from fetcher.helpers import identifier_from_uri
-from pisces import settings
 
-from .resources.configs import NOTE_TYPE_CHOICES, NOTE_TYPE_CHOICES_TRANSFORM
+from .assets import asset_checker, has_digital_instance
+from .lookups import (AGENT_REFERENCE_TYPES, NOTE_TYPE_TITLES,
+                      NOTE_TYPES_TRANSFORM, formats_for_refs, language_name)
 from .resources.rac import (Agent, AgentReference, Collection, Date, Extent,
                             ExternalIdentifier, Group, Language, Note, Object,
                             RecordReference, Subnote, Term, TermReference)
@@ -19,6 +16,7 @@ from .resources.source import (SourceAgentCorporateEntity, SourceAgentFamily,
                                SourceGroup, SourceLinkedAgent, SourceNote,
                                SourceRef, SourceResource, SourceStructuredDate,
                                SourceSubject)
+from .text import strip_tags
 
 
 def convert_dates(value):
@@ -38,37 +36,20 @@ def convert_dates(value):
 
 
 def has_online_asset(identifier):
-    req = requests.head("{}/pdfs/{}".format(settings.ASSET_BASEURL.rstrip("/"), identifier))
-    return True if req.status_code == 200 else False
+    return asset_checker.is_available(identifier)
 
 
 def has_online_instance(instances, uri):
-    try:
-        digital_instances = [v for v in instances if v.instance_type == "digital_object"]
-    except AttributeError:
-        digital_instances = [v for v in instances if v["instance_type"] == "digital_object"]
-    if len(digital_instances):
+    if has_digital_instance(instances):
         if has_online_asset(identifier_from_uri(uri)):
             return True
     return False
 
 
-def strip_tags(user_string):
-    """Strips XML and HTML tags from a string."""
-    try:
-        xmldoc = ET.fromstring(f'<xml>{user_string}</xml>')
-        textcontent = ''.join(xmldoc.itertext())
-    except ET.ParseError:
-        tagregxp = re.compile(r'<[/\w][^>]+>')
-        textcontent = tagregxp.sub('', user_string)
-    return textcontent
-
-
 def transform_language(value, lang_materials):
     langz = []
     if value:
-        lang_data = languages.get(part2b=value)
-        langz.append(Language(expression=lang_data.name, identifier=value))
+        langz.append(Language(expression=language_name(value), identifier=value))
     elif lang_materials:
         for lang in [lng for lng in lang_materials if lng.language_and_script]:
             langz += transform_language(lang.language_and_script.language, None)
@@ -81,14 +62,7 @@ def transform_formats(instances, subjects, ancestors):
         if a.subjects:
             ancestor_subjects += a.subjects
     combined_subjects = subjects + ancestor_subjects
-    formats = ["documents"]
-    for refs, format in [
-            (settings.MOVING_IMAGE_REFS, "moving image"),
-            (settings.AUDIO_REFS, "audio"),
-            (settings.PHOTOGRAPH_REFS, "photographs")]:
-        if len([s for s in combined_subjects if s.ref in refs]):
-            formats.append(format)
-    return formats
+    return ["documents"] + formats_for_refs({s.ref for s in combined_subjects})
 
 
 def transform_group(value, prefix):
@@ -158,12 +132,7 @@ class SourceLinkedAgentToAgentReference(odin.Mapping):
 
     @odin.map_field(from_field="type", to_field="type")
     def type(self, value):
-        AGENT_MAP = {
-            "agent_corporate_entity": "organization",
-            "agent_person": "person",
-            "agent_family": "family"
-        }
-        return AGENT_MAP[value]
+        return AGENT_REFERENCE_TYPES[value]
 
     @odin.map_field(from_field="title", to_field="title")
     def title(self, value):
@@ -281,9 +250,9 @@ class SourceNoteToNote(odin.Mapping):
         if self.source.label:
             title = self.source.label
         elif value:
-            title = [v[1] for v in NOTE_TYPE_CHOICES if v[0] == value][0]
+            title = NOTE_TYPE_TITLES[value]
         else:
-            title = [v[1] for v in NOTE_TYPE_CHOICES if v[0] == self.source.jsonmodel_type.split("note_")[1]][0]
+            title = NOTE_TYPE_TITLES[self.source.jsonmodel_type.split("note_")[1]]
         return title
 
     @odin.map_field(from_field="type", to_field="type")
@@ -357,7 +326,7 @@ class SourceResourceToCollection(odin.Mapping):
 
     @odin.map_list_field(from_field="notes", to_field="notes", to_list=True)
     def notes(self, value):
-        return SourceNoteToNote.apply([v for v in value if (v.publish and v.type in NOTE_TYPE_CHOICES_TRANSFORM)])
+        return SourceNoteToNote.apply([v for v in value if (v.publish and v.type in NOTE_TYPES_TRANSFORM)])
 
     @odin.map_list_field(from_field="dates", to_field="dates")
     def dates(self, value):
@@ -415,7 +384,7 @@ class SourceArchivalObjectToCollection(odin.Mapping):
 
     @odin.map_list_field(from_field="notes", to_field="notes", to_list=True)
     def notes(self, value):
-        return SourceNoteToNote.apply([v for v in value if (v.publish and v.type in NOTE_TYPE_CHOICES_TRANSFORM)])
+        return SourceNoteToNote.apply([v for v in value if (v.publish and v.type in NOTE_TYPES_TRANSFORM)])
 
     @odin.map_field
     def title(self, value):
@@ -480,7 +449,7 @@ class SourceArchivalObjectToObject(odin.Mapping):
 
     @odin.map_list_field(from_field="notes", to_field="notes", to_list=True)
     def notes(self, value):
-        return SourceNoteToNote.apply([v for v in value if (v.publish and v.type in NOTE_TYPE_CHOICES_TRANSFORM)])
+        return SourceNoteToNote.apply([v for v in value if (v.publish and v.type in NOTE_TYPES_TRANSFORM)])
 
     @odin.map_list_field(from_field="dates", to_field="dates")
     def dates(self, value):
@@ -591,7 +560,7 @@ class SourceAgentCorporateEntityToAgent(odin.Mapping):
 
     @odin.map_list_field(from_field="notes", to_field="notes", to_list=True)
     def notes(self, value):
-        return SourceNoteToNote.apply([v for v in value if (v.publish and v.jsonmodel_type.split("_")[-1] in NOTE_TYPE_CHOICES_TRANSFORM)])
+        return SourceNoteToNote.apply([v for v in value if (v.publish and v.jsonmodel_type.split("_")[-1] in NOTE_TYPES_TRANSFORM)])
 
     @odin.map_list_field(from_field="dates_of_existence", to_field="dates")
     def dates(self, value):
@@ -656,7 +625,7 @@ class SourceAgentFamilyToAgent(odin.Mapping):
 
     @odin.map_list_field(from_field="notes", to_field="notes", to_list=True)
     def notes(self, value):
-        return SourceNoteToNote.apply([v for v in value if (v.publish and v.jsonmodel_type.split("_")[-1] in NOTE_TYPE_CHOICES_TRANSFORM)])
+        return SourceNoteToNote.apply([v for v in value if (v.publish and v.jsonmodel_type.split("_")[-1] in NOTE_TYPES_TRANSFORM)])
 
     @odin.map_list_field(from_field="dates_of_existence", to_field="dates")
     def dates(self, value):
@@ -731,7 +700,7 @@ class SourceAgentPersonToAgent(odin.Mapping):
 
     @odin.map_list_field(from_field="notes", to_field="notes", to_list=True)
     def notes(self, value):
-        return SourceNoteToNote.apply([v for v in value if (v.publish and v.jsonmodel_type.split("_")[-1] in NOTE_TYPE_CHOICES_TRANSFORM)])
+        return SourceNoteToNote.apply([v for v in value if (v.publish and v.jsonmodel_type.split("_")[-1] in NOTE_TYPES_TRANSFORM)])
 
     @odin.map_list_field(from_field="dates_of_existence", to_field="dates")
     def dates(self, value):
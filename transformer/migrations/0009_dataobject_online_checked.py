@@ -0,0 +1,31 @@
+# Generated by Django 4.0.9 on 2026-10-19 15:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    def set_online_pending_since(apps, schema_editor):
+        DataObject = apps.get_model('transformer', 'DataObject')
+        DataObject.objects.filter(online_pending=True).update(online_pending_since=models.F('last_modified'))
+
+    def reverse_set_online_pending_since(apps, schema_editor):
+        pass
+
+    dependencies = [
+        ('transformer', '0008_alter_dataobject_data'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataobject',
+            name='online_checked',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='dataobject',
+            name='online_pending_since',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(set_online_pending_since, reverse_set_online_pending_since),
+    ]
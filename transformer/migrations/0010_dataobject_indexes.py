@@ -0,0 +1,29 @@
+# Generated by Django 4.0.9 on 2026-10-19 19:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transformer', '0009_dataobject_online_checked'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dataobject',
+            index=models.Index(condition=models.Q(('indexed', False)), fields=['object_type', 'last_modified', 'es_id'], name='dataobject_unindexed_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dataobject',
+            index=models.Index(condition=models.Q(('indexed', False)), fields=['last_modified', 'es_id'], name='dataobject_unindexed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dataobject',
+            index=models.Index(fields=['object_type', 'last_modified', 'es_id'], name='dataobject_type_modified_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dataobject',
+            index=models.Index(condition=models.Q(('online_pending', True)), fields=['online_checked'], name='dataobject_pending_checked_idx'),
+        ),
+    ]
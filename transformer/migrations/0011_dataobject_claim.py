@@ -0,0 +1,23 @@
+# Generated by Django 4.0.9 on 2026-10-19 19:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transformer', '0010_dataobject_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataobject',
+            name='claim_expires',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='dataobject',
+            name='claimed_by',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
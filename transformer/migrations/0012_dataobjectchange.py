@@ -0,0 +1,23 @@
+# Generated by Django 4.0.9 on 2026-10-19 19:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transformer', '0011_dataobject_claim'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataObjectChange',
+            fields=[
+                ('sequence', models.BigAutoField(primary_key=True, serialize=False)),
+                ('es_id', models.CharField(max_length=255)),
+                ('object_type', models.CharField(choices=[('agent', 'Agent'), ('collection', 'Collection'), ('object', 'Object'), ('term', 'Term')], max_length=255)),
+                ('action', models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('deleted', 'Deleted')], max_length=100)),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
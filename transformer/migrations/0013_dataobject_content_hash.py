@@ -0,0 +1,37 @@
+# Generated by Django 4.0.9 on 2026-10-19 19:57
+
+import hashlib
+import json
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    def set_content_hash(apps, schema_editor):
+        DataObject = apps.get_model('transformer', 'DataObject')
+        updated = []
+        for obj in DataObject.objects.only('es_id', 'data').iterator(chunk_size=500):
+            serialized = json.dumps(obj.data, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+            obj.content_hash = hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+            updated.append(obj)
+            if len(updated) >= 500:
+                DataObject.objects.bulk_update(updated, ['content_hash'])
+                updated = []
+        DataObject.objects.bulk_update(updated, ['content_hash'])
+
+    def reverse_set_content_hash(apps, schema_editor):
+        pass
+
+    dependencies = [
+        ('transformer', '0012_dataobjectchange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataobject',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.RunPython(set_content_hash, reverse_set_content_hash),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.0.9 on 2026-10-19 20:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transformer', '0013_dataobject_content_hash'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='dataobject',
+            name='dataobject_pending_checked_idx',
+        ),
+        migrations.AddIndex(
+            model_name='dataobject',
+            index=models.Index(models.OrderBy(models.F('online_checked'), nulls_first=True), condition=models.Q(('online_pending', True)), name='dataobject_pending_checked_idx'),
+        ),
+    ]
@@ -1,4 +1,8 @@
+import hashlib
+import json
+
 from django.db import models
+from django.db.models import F, Q
 
 
 class DataObject(models.Model):
@@ -8,10 +12,85 @@ class DataObject(models.Model):
         ('object', 'Object'),
         ('term', 'Term'),
     )
+    # Fields included in serialized DataObjects. Others, such as claims and
+    # online asset check times, are internal and do not change the representation.
+    SERIALIZED_FIELDS = ("es_id", "object_type", "data", "indexed", "online_pending", "created", "last_modified")
     es_id = models.CharField(primary_key=True, max_length=255)
     object_type = models.CharField(max_length=255, choices=TYPE_CHOICES)
     data = models.JSONField()
     indexed = models.BooleanField(default=False)
     online_pending = models.BooleanField(default=False)
+    online_pending_since = models.DateTimeField(blank=True, null=True)
+    online_checked = models.DateTimeField(blank=True, null=True)
+    claimed_by = models.CharField(max_length=255, blank=True, null=True)
+    claim_expires = models.DateTimeField(blank=True, null=True)
+    content_hash = models.CharField(max_length=64, blank=True)
     created = models.DateTimeField(auto_now_add=True)
     last_modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["object_type", "last_modified", "es_id"],
+                name="dataobject_unindexed_type_idx",
+                condition=Q(indexed=False)),
+            models.Index(
+                fields=["last_modified", "es_id"],
+                name="dataobject_unindexed_idx",
+                condition=Q(indexed=False)),
+            models.Index(
+                fields=["object_type", "last_modified", "es_id"],
+                name="dataobject_type_modified_idx"),
+            models.Index(
+                F("online_checked").asc(nulls_first=True),
+                name="dataobject_pending_checked_idx",
+                condition=Q(online_pending=True)),
+        ]
+
+    @staticmethod
+    def hash_data(data):
+        """Returns a SHA-256 hash of a canonical JSON serialization of data."""
+        serialized = json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+    @property
+    def etag(self):
+        """A strong entity tag, which changes when any serialized field changes.
+
+        The data field itself is represented by content_hash, so it does not
+        need to be loaded.
+        """
+        values = [self.content_hash] + [str(getattr(self, field)) for field in self.SERIALIZED_FIELDS if field != "data"]
+        return '"{}"'.format(hashlib.sha256("|".join(values).encode("utf-8")).hexdigest())
+
+    def save(self, *args, **kwargs):
+        self.content_hash = self.hash_data(self.data)
+        super().save(*args, **kwargs)
+
+
+class DataObjectChange(models.Model):
+    """A create, update or delete of a DataObject.
+
+    Sequence numbers increase with each change, so consumers can follow
+    changes by requesting those after the last sequence number they have seen.
+    """
+    CREATED = "created"
+    UPDATED = "updated"
+    DELETED = "deleted"
+    ACTION_CHOICES = (
+        (CREATED, "Created"),
+        (UPDATED, "Updated"),
+        (DELETED, "Deleted"),
+    )
+    sequence = models.BigAutoField(primary_key=True)
+    es_id = models.CharField(max_length=255)
+    object_type = models.CharField(max_length=255, choices=DataObject.TYPE_CHOICES)
+    action = models.CharField(max_length=100, choices=ACTION_CHOICES)
+    timestamp = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def record(cls, action, objects):
+        """Records the same change to a list of (es_id, object_type) tuples."""
+        return cls.objects.bulk_create(
+            [cls(es_id=es_id, object_type=object_type, action=action) for es_id, object_type in objects],
+            batch_size=500)
@@ -0,0 +1,215 @@
+import json
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import connections
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def get_page_size(request, page_size_query_param):
+    """Returns the requested page size, bounded by OBJECTS_MAX_PAGE_SIZE."""
+    try:
+        page_size = int(request.query_params[page_size_query_param])
+        if page_size > 0:
+            return min(page_size, settings.OBJECTS_MAX_PAGE_SIZE)
+    except (KeyError, ValueError):
+        pass
+    return settings.OBJECTS_PAGE_SIZE
+
+
+def estimated_count(queryset):
+    """Returns the planner's row estimate for a queryset on PostgreSQL, otherwise an exact count."""
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return queryset.count()
+    sql, params = queryset.order_by().values("pk").query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN (FORMAT JSON) {}".format(sql), params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]["Plan Rows"]
+
+
+class KeysetPagination(BasePagination):
+    """Paginates DataObjects by last_modified and es_id.
+
+    Pages after the first are selected by the position of the last object on
+    the previous page rather than by an offset, so fetching a page costs the
+    same regardless of how deep it is, and objects do not shift between pages
+    when others are marked as indexed during a drain.
+
+    Responses keep the shape of page number responses. `count` is the
+    planner's estimate of the number of matching objects on PostgreSQL, and
+    `previous` is always null since pages can only be followed forwards.
+    """
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    ordering = ("last_modified", "es_id")
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.count = estimated_count(queryset)
+        position = self.decode_cursor(request)
+        if position:
+            last_modified, es_id = position
+            queryset = queryset.filter(last_modified__gte=last_modified).exclude(
+                last_modified=last_modified, es_id__lte=es_id)
+        results = list(queryset.order_by(*self.ordering)[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ("count", self.count),
+            ("next", self.get_next_link()),
+            ("previous", None),
+            ("results", data)
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "count": {"type": "integer"},
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        return get_page_size(request, self.page_size_query_param)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, self.encode_cursor(last))
+
+    def encode_cursor(self, obj):
+        position = "{}|{}".format(obj.last_modified.isoformat(), obj.es_id)
+        return b64encode(position.encode("utf-8"), altchars=b"-_").decode("ascii")
+
+    def decode_cursor(self, request):
+        """Returns the (last_modified, es_id) position encoded in a cursor, if any."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            last_modified, es_id = b64decode(encoded.encode("ascii"), altchars=b"-_").decode("utf-8").split("|", 1)
+            last_modified = parse_datetime(last_modified)
+        except (TypeError, ValueError, UnicodeError):
+            raise ValidationError({self.cursor_query_param: self.invalid_cursor_message})
+        if not last_modified:
+            raise ValidationError({self.cursor_query_param: self.invalid_cursor_message})
+        return last_modified, es_id
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "The pagination cursor value. Pass an empty cursor to start keyset pagination.",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": self.page_size_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Number of results to return per page.",
+                "schema": {"type": "integer"},
+            },
+        ]
+
+
+class DataObjectPagination(PageNumberPagination):
+    """Paginates DataObjects by page number, or by keyset if a cursor is requested.
+
+    Page number pagination is kept as the default so existing consumers are
+    unaffected. Consumers opt in to KeysetPagination by passing a `cursor`
+    parameter, which may be empty for the first page.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = KeysetPagination() if KeysetPagination.cursor_query_param in request.query_params else None
+        if self.keyset:
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_schema_operation_parameters(self, view):
+        return super().get_schema_operation_parameters(view) + KeysetPagination().get_schema_operation_parameters(view)
+
+
+class SequencePagination(BasePagination):
+    """Paginates DataObjectChanges by sequence number.
+
+    The next link is returned even when there are no further changes, so that
+    consumers can poll it to follow the feed.
+    """
+    since_query_param = "since"
+    page_size_query_param = "page_size"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        try:
+            self.since = int(request.query_params.get(self.since_query_param, 0))
+        except ValueError:
+            raise ValidationError({self.since_query_param: "Expected a sequence number."})
+        self.page = list(
+            queryset.filter(sequence__gt=self.since).order_by("sequence")[:get_page_size(request, self.page_size_query_param)])
+        return self.page
+
+    def get_last_sequence(self):
+        return self.page[-1].sequence if self.page else self.since
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ("last_sequence", self.get_last_sequence()),
+            ("next", replace_query_param(
+                self.request.build_absolute_uri(), self.since_query_param, self.get_last_sequence())),
+            ("results", data)
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "last_sequence": {"type": "integer"},
+                "next": {"type": "string", "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                "name": self.since_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Return changes with sequence numbers greater than this value.",
+                "schema": {"type": "integer"},
+            },
+            {
+                "name": self.page_size_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Number of results to return per page.",
+                "schema": {"type": "integer"},
+            },
+        ]
@@ -1,15 +1,27 @@
 from rest_framework import serializers
 
-from .models import DataObject
+from .models import DataObject, DataObjectChange
 
 
 class DataObjectSerializer(serializers.ModelSerializer):
     class Meta:
         model = DataObject
-        fields = '__all__'
+        fields = DataObject.SERIALIZED_FIELDS
+
+
+class ClaimedDataObjectSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DataObject
+        fields = DataObject.SERIALIZED_FIELDS + ("claimed_by", "claim_expires")
 
 
 class DataObjectListSerializer(serializers.ModelSerializer):
     class Meta:
         model = DataObject
         fields = ('es_id', 'object_type')
+
+
+class DataObjectChangeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DataObjectChange
+        fields = '__all__'
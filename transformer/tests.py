@@ -1,20 +1,36 @@
+import gzip
 import json
 import os
 import random
-from unittest.mock import patch
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import Mock, patch
+from urllib.parse import quote
 
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APIRequestFactory
 
 from fetcher.helpers import identifier_from_uri
 
-from .cron import CheckMissingOnlineAssets
-from .mappings import has_online_instance, strip_tags
-from .models import DataObject
-from .resources.configs import NOTE_TYPE_CHOICES_TRANSFORM
+from .assets import asset_checker, prefetch_online_assets
+from .cron import CheckMissingOnlineAssets, CleanUpChanges
+from .lookups import FORMAT_REFS, NOTE_TYPE_TITLES, formats_for_refs
+from .mappings import has_online_instance
+from .models import DataObject, DataObjectChange
+from .resources.configs import NOTE_TYPE_CHOICES, NOTE_TYPE_CHOICES_TRANSFORM
+from .text import parse_tags, strip_tags
 from .transformers import Transformer
-from .views import DataObjectUpdateByIdView, DataObjectViewSet
+from .views import (DataObjectChangeViewSet, DataObjectUpdateByIdView,
+                    DataObjectViewSet)
 
 object_types = ["agent_corporate_entity", "agent_family", "agent_person",
                 "archival_object", "resource", "subject",
@@ -198,10 +214,239 @@ class TransformerTest(TestCase):
                     len(DataObject.objects.filter(object_type=object_type)),
                     final_count, "{} {} objects were expected but {} found".format(
                         final_count, object_type, len(DataObject.objects.filter(object_type=object_type))))
+                self.assertEqual(
+                    response.data["detail"],
+                    "1 objects {}.".format("marked as indexed" if action == "indexed" else "deleted"))
+
+        objects = list(DataObject.objects.filter(object_type="agent")[:3])
+        DataObject.objects.filter(es_id__in=[obj.es_id for obj in objects]).update(indexed=False)
+        request = client.post(
+            "{}?action=indexed".format(reverse("index-action-complete")),
+            data="\n".join([obj.es_id for obj in objects] + ["missing"]) + "\n",
+            content_type="text/plain")
+        with self.settings(INDEX_COMPLETE_CHUNK_SIZE=2):
+            response = DataObjectUpdateByIdView.as_view()(request)
+        self.assertEqual(response.status_code, 200, "Update by ID error: {}".format(response.data))
+        self.assertEqual(response.data["detail"], "3 objects marked as indexed.")
+        self.assertEqual(DataObject.objects.filter(es_id__in=[obj.es_id for obj in objects], indexed=True).count(), 3)
+
+    def changes(self):
+        """Ensures that creates, updates and deletes can be followed in sequence."""
+        destroyed = random.choice(DataObject.objects.all()).es_id
+        response = DataObjectViewSet.as_view({"delete": "destroy"})(
+            APIRequestFactory().delete(reverse("dataobject-detail", args=[destroyed])), pk=destroyed)
+        self.assertEqual(response.status_code, 204)
+
+        view = DataObjectChangeViewSet.as_view({"get": "list"})
+        url = "{}?page_size=5".format(reverse("dataobjectchange-list"))
+        response = view(APIRequestFactory().get(url))
+        self.assertEqual(response.data["results"], [], "Unsettled changes were returned.")
+
+        changes = []
+        with self.settings(CHANGES_SETTLE_SECONDS=0):
+            while True:
+                response = view(APIRequestFactory().get(url))
+                self.assertEqual(response.status_code, 200)
+                if not response.data["results"]:
+                    break
+                changes += response.data["results"]
+                url = response.data["next"]
+            self.assertEqual(response.data["last_sequence"], DataObjectChange.objects.latest("sequence").sequence)
+        sequences = [change["sequence"] for change in changes]
+        self.assertEqual(sequences, sorted(set(sequences)))
+        self.assertEqual(len(changes), DataObjectChange.objects.count())
+        created = set(change["es_id"] for change in changes if change["action"] == DataObjectChange.CREATED)
+        deleted = set(change["es_id"] for change in changes if change["action"] == DataObjectChange.DELETED)
+        self.assertEqual(len(deleted), 5)
+        self.assertIn(destroyed, deleted, "Delete through the API was not recorded.")
+        self.assertEqual(created - deleted, set(DataObject.objects.values_list("es_id", flat=True)))
+
+        response = view(APIRequestFactory().get("{}?since=latest".format(reverse("dataobjectchange-list"))))
+        self.assertEqual(response.status_code, 400)
+
+    def conditional_requests(self):
+        """Ensures that unchanged DataObjects and pages are not sent again."""
+        obj = random.choice(DataObject.objects.all())
+        self.assertEqual(obj.content_hash, DataObject.hash_data(obj.data))
+        view = DataObjectViewSet.as_view({"get": "retrieve"})
+        url = reverse("dataobject-detail", args=[obj.es_id])
+        response = view(APIRequestFactory().get(url), pk=obj.es_id)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        last_modified = response["Last-Modified"]
+        with self.assertNumQueries(1):
+            response = view(APIRequestFactory().get(url, HTTP_IF_NONE_MATCH=etag), pk=obj.es_id)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        response = view(APIRequestFactory().get(url, HTTP_IF_MODIFIED_SINCE=last_modified), pk=obj.es_id)
+        self.assertEqual(response.status_code, 304)
+
+        obj.data["title"] = "{} (revised)".format(obj.data["title"])
+        obj.save()
+        response = view(APIRequestFactory().get(url, HTTP_IF_NONE_MATCH=etag), pk=obj.es_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.data["data"]["title"], obj.data["title"])
+        new_etag = response["ETag"]
+        DataObject.objects.filter(es_id=obj.es_id).update(
+            claimed_by="indexer", claim_expires=timezone.now(), online_checked=timezone.now())
+        response = view(APIRequestFactory().get(url, HTTP_IF_NONE_MATCH=new_etag), pk=obj.es_id)
+        self.assertEqual(response.status_code, 304, "ETag changed when only internal fields changed.")
+
+        DataObject.objects.filter(es_id=obj.es_id).update(indexed=False)
+        last_modified = DataObject.objects.get(es_id=obj.es_id).last_modified
+        self.acknowledge([obj.es_id], "indexer")
+        response = view(APIRequestFactory().get(url, HTTP_IF_NONE_MATCH=new_etag), pk=obj.es_id)
+        self.assertEqual(response.status_code, 200, "ETag did not change when indexed changed.")
+        self.assertTrue(response.data["indexed"])
+        self.assertEqual(
+            DataObject.objects.get(es_id=obj.es_id).last_modified, last_modified,
+            "Acknowledgement changed last_modified.")
+
+        view = DataObjectViewSet.as_view({"get": "agents"})
+        url = "{}?clean=true".format(reverse("dataobject-list"))
+        etag = view(APIRequestFactory().get(url))["ETag"]
+        self.assertEqual(view(APIRequestFactory().get(url, HTTP_IF_NONE_MATCH=etag)).status_code, 304)
+        DataObject.objects.filter(object_type="agent").first().delete()
+        self.assertEqual(view(APIRequestFactory().get(url, HTTP_IF_NONE_MATCH=etag)).status_code, 200)
+
+    def export(self):
+        """Ensures that DataObjects are streamed as newline-delimited JSON."""
+        view = DataObjectViewSet.as_view({"get": "export"})
+        url = reverse("dataobject-export")
+        for params, expected in [
+                ("", DataObject.objects.filter(indexed=False)),
+                ("?clean=true", DataObject.objects.all()),
+                ("?object_type=agent", DataObject.objects.filter(object_type="agent", indexed=False)),
+                ("?clean=true&modified_since={}".format(timezone.now().timestamp()), DataObject.objects.none()),
+                ("?clean=true&modified_before={}".format(quote((timezone.now() + timedelta(days=1)).isoformat())), DataObject.objects.all())]:
+            response = view(APIRequestFactory().get(url + params))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["Content-Type"], "application/x-ndjson")
+            lines = b"".join(response.streaming_content).decode("utf-8").splitlines()
+            exported = [json.loads(line) for line in lines]
+            self.assertEqual(
+                [obj["es_id"] for obj in exported],
+                list(expected.order_by("last_modified", "es_id").values_list("es_id", flat=True)), params)
+            for obj in exported:
+                self.assertTrue(isinstance(obj["data"], dict))
+
+        response = view(APIRequestFactory().get(url + "?clean=true", HTTP_ACCEPT_ENCODING="gzip, deflate"))
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        lines = gzip.decompress(b"".join(response.streaming_content)).decode("utf-8").splitlines()
+        self.assertEqual(len(lines), DataObject.objects.count())
+
+        for params in ["?object_type=foo", "?modified_since=yesterday"]:
+            response = view(APIRequestFactory().get(url + params))
+            self.assertEqual(response.status_code, 400)
+
+    def batch(self):
+        """Ensures that DataObjects can be retrieved by identifier or source URI."""
+        view = DataObjectViewSet.as_view({"post": "batch"})
+        url = reverse("dataobject-batch")
+        objects = list(DataObject.objects.all()[:3])
+        uri = "/repositories/2/resources/12345"
+        DataObject.objects.create(es_id=identifier_from_uri(uri), object_type="collection", data={"uri": uri})
+        request = APIRequestFactory().post(
+            url, {"identifiers": [obj.es_id for obj in objects] + ["missing"], "uris": [uri, "/subjects/0"]}, format="json")
+        with self.assertNumQueries(1):
+            response = view(request)
+            content = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            set(obj["es_id"] for obj in content["results"]),
+            set([obj.es_id for obj in objects] + [identifier_from_uri(uri)]))
+        self.assertEqual(content["missing"], ["missing", "/subjects/0"])
+        DataObject.objects.filter(es_id=identifier_from_uri(uri)).delete()
+
+        for data in [{}, {"identifiers": "abc"}, {"identifiers": ["a", "b"]}, {"identifiers": [{}]}, {"uris": [1]}, ["a"]]:
+            with self.settings(BATCH_MAX_SIZE=1):
+                response = view(APIRequestFactory().post(url, data, format="json"))
+            self.assertEqual(response.status_code, 400)
+
+    def claim(self):
+        """Ensures that claims lease disjoint batches which are released on acknowledgement."""
+        DataObject.objects.update(indexed=False, claimed_by=None, claim_expires=None)
+        view = DataObjectViewSet.as_view({"post": "claim"})
+        url = reverse("dataobject-claim")
+        first = view(APIRequestFactory().post(url, {"consumer": "first", "limit": 3}, format="json"))
+        self.assertEqual(first.status_code, 200)
+        first_ids = [obj["es_id"] for obj in first.data["results"]]
+        self.assertEqual(len(first_ids), 3)
+        with self.settings(OBJECTS_MAX_PAGE_SIZE=DataObject.objects.count()):
+            second = view(APIRequestFactory().post(url, {"consumer": "second", "limit": DataObject.objects.count()}, format="json"))
+        second_ids = [obj["es_id"] for obj in second.data["results"]]
+        self.assertFalse(set(first_ids) & set(second_ids), "Leased objects were claimed twice.")
+        self.assertEqual(len(first_ids) + len(second_ids), DataObject.objects.count())
+
+        DataObject.objects.filter(es_id__in=first_ids[1:]).update(claim_expires=timezone.now() - timedelta(seconds=1))
+        response = self.acknowledge(first_ids[:1], None)
+        self.assertEqual(response.data["not_acknowledged"], first_ids[:1], "A lease was released without its consumer.")
+        self.assertFalse(DataObject.objects.get(es_id=first_ids[0]).indexed)
+        response = self.acknowledge(first_ids[:1], "first")
+        self.assertEqual(response.data["not_acknowledged"], [])
+        released = DataObject.objects.get(es_id=first_ids[0])
+        self.assertEqual((released.indexed, released.claimed_by, released.claim_expires), (True, None, None))
+        third = view(APIRequestFactory().post(url, {"consumer": "third", "limit": 100}, format="json"))
+        self.assertEqual(
+            set(obj["es_id"] for obj in third.data["results"]), set(first_ids[1:]),
+            "Only objects with expired leases should have been claimable.")
+        self.assertTrue(all(obj["claimed_by"] == "third" for obj in third.data["results"]))
+
+        response = self.acknowledge(first_ids[1:], "first")
+        self.assertEqual(response.data["detail"], "0 objects marked as indexed.")
+        self.assertEqual(sorted(response.data["not_acknowledged"]), sorted(first_ids[1:]))
+        self.assertEqual(
+            DataObject.objects.filter(es_id__in=first_ids[1:], claimed_by="third", indexed=False).count(),
+            len(first_ids[1:]), "An expired consumer released a lease held by another consumer.")
+        response = self.acknowledge(first_ids[1:], "third")
+        self.assertEqual(response.data["detail"], "{} objects marked as indexed.".format(len(first_ids[1:])))
 
-    @patch("requests.head")
+        for data in [{}, {"consumer": "first", "limit": "all"}, {"consumer": "first", "ttl": 0}]:
+            response = view(APIRequestFactory().post(url, data, format="json"))
+            self.assertEqual(response.status_code, 400)
+        DataObject.objects.update(claimed_by=None, claim_expires=None)
+
+    def acknowledge(self, identifiers, consumer):
+        data = {"identifiers": identifiers, "action": "indexed"}
+        if consumer:
+            data["consumer"] = consumer
+        response = DataObjectUpdateByIdView.as_view()(
+            APIRequestFactory().post(reverse("index-action-complete"), data, format="json"))
+        self.assertEqual(response.status_code, 200, "Update by ID error: {}".format(response.data))
+        return response
+
+    def pagination(self):
+        """Ensures that objects are returned once each by keyset pagination, even when indexed mid-drain."""
+        DataObject.objects.update(indexed=False, last_modified=timezone.now())
+        expected = list(DataObject.objects.order_by("es_id").values_list("es_id", flat=True))
+        view = DataObjectViewSet.as_view({"get": "list"})
+        response = view(APIRequestFactory().get("{}?page_size=3".format(reverse("dataobject-list"))))
+        self.assertEqual(list(response.data), ["count", "next", "previous", "results"])
+        self.assertFalse("cursor" in (response.data["next"] or ""), "Expected page number pagination by default.")
+
+        url = "{}?cursor=&page_size=3".format(reverse("dataobject-list"))
+        seen = []
+        while url:
+            response = view(APIRequestFactory().get(url))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(list(response.data), ["count", "next", "previous", "results"])
+            self.assertEqual(response.data["count"], len(expected) - len(seen))
+            self.assertTrue(len(response.data["results"]) <= 3)
+            page_ids = [obj["es_id"] for obj in response.data["results"]]
+            seen += page_ids
+            DataObject.objects.filter(es_id__in=page_ids).update(indexed=True)
+            url = response.data["next"]
+        self.assertEqual(seen, expected)
+
+        response = view(APIRequestFactory().get("{}?cursor=invalid".format(reverse("dataobject-list"))))
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue("cursor" in response.data)
+
+    @patch("transformer.assets.requests.Session.head")
     def online_instance(self, mock_head):
         """Ensure that only objects with online assets are marked as online"""
+        asset_checker.clear()
         mock_head.return_value.status_code = 200
         for fixture, expected in [
                 ("no_online_instances.json", False),
@@ -212,6 +457,7 @@ class TransformerTest(TestCase):
                 output = has_online_instance(instances, "/repositories/2/archival_objects/4")
                 self.assertEqual(output, expected)
 
+        asset_checker.clear()
         mock_head.return_value.status_code = 404
         for fixture in ["no_online_instances.json", "online_instance.json", "multiple_instances.json"]:
             with open(os.path.join("fixtures", "transformer", "online_instance", fixture), "r") as json_file:
@@ -232,9 +478,10 @@ class TransformerTest(TestCase):
             output = Transformer().get_online_pending(instances, online)
             self.assertEqual(output, expected)
 
-    @patch("requests.head")
+    @patch("transformer.assets.requests.Session.head")
     def update_online_instances(self, mock_head):
         """Ensure that CheckMissingOnlineAssets cron correctly updates data."""
+        asset_checker.clear()
         mock_head.return_value.status_code = 200
         updated = random.choice(DataObject.objects.filter(object_type__in=["collection", "object"]))
         updated.data["online"] = False
@@ -245,13 +492,161 @@ class TransformerTest(TestCase):
         self.assertEqual(updated.data["online"], True)
         self.assertEqual(updated.indexed, False)
         self.assertEqual(updated.online_pending, False)
+        self.assertEqual(updated.online_pending_since, None)
+
+    def online_asset_backoff(self):
+        """Ensure CheckMissingOnlineAssets backs off objects which have been pending for a long time."""
+        now = timezone.now()
+        pending = random.choice(DataObject.objects.filter(object_type__in=["collection", "object"]))
+        DataObject.objects.filter(online_pending=True).update(online_pending=False)
+        for pending_days, checked_days, expected in [
+                (1, 0, True),
+                (10, 1, False),
+                (10, 8, True),
+                (60, 8, False),
+                (60, 31, True)]:
+            DataObject.objects.filter(es_id=pending.es_id).update(
+                online_pending=True,
+                online_pending_since=now - timedelta(days=pending_days),
+                online_checked=now - timedelta(days=checked_days))
+            due = CheckMissingOnlineAssets().get_due_objects(now)
+            self.assertEqual(due.filter(es_id=pending.es_id).exists(), expected)
 
     def test_transformer(self):
         self.mappings()
         self.views()
+        self.changes()
+        self.conditional_requests()
+        self.export()
+        self.batch()
+        self.claim()
+        self.pagination()
         self.online_instance()
         self.online_pending()
         self.update_online_instances()
+        self.online_asset_backoff()
+
+    @patch("transformer.assets.requests.Session.head")
+    def test_asset_checker(self, mock_head):
+        """Ensure online asset checks are batched and cached."""
+        asset_checker.clear()
+        mock_head.return_value.status_code = 200
+        with open(os.path.join("fixtures", "transformer", "online_instance", "online_instance.json"), "r") as json_file:
+            instances = json.load(json_file)
+        records = [
+            {"uri": "/repositories/2/archival_objects/{}".format(i), "jsonmodel_type": "archival_object", "instances": instances}
+            for i in range(5)]
+        records.append({"uri": "/repositories/2/resources/1", "jsonmodel_type": "resource", "instances": instances})
+        results = prefetch_online_assets(records)
+        self.assertEqual(len(results), 5)
+        self.assertEqual(mock_head.call_count, 5)
+        for record in records[:5]:
+            self.assertTrue(has_online_instance(record["instances"], record["uri"]))
+        self.assertEqual(mock_head.call_count, 5, "Cached results were not used.")
+
+        mock_head.return_value.status_code = 404
+        results = asset_checker.check_many([identifier_from_uri(r["uri"]) for r in records[:5]], refresh=True)
+        self.assertFalse(any(results.values()))
+        self.assertEqual(mock_head.call_count, 10)
+
+        in_flight = {"current": 0, "max": 0}
+        lock = threading.Lock()
+
+        def head(url):
+            with lock:
+                in_flight["current"] += 1
+                in_flight["max"] = max(in_flight["max"], in_flight["current"])
+            time.sleep(0.005)
+            with lock:
+                in_flight["current"] -= 1
+            return Mock(status_code=200)
+
+        mock_head.side_effect = head
+        with ThreadPoolExecutor(max_workers=4) as callers:
+            list(callers.map(
+                lambda page: asset_checker.check_many(["{}-{}".format(page, i) for i in range(10)]), range(4)))
+        self.assertEqual(mock_head.call_count, 50)
+        self.assertLessEqual(
+            in_flight["max"], settings.ASSET_CHECK_WORKERS,
+            "Expected concurrent callers to share one executor sized to the connection pool.")
+        self.assertIs(asset_checker.executor, asset_checker.executor)
+
+    def test_cleanup_changes(self):
+        """Ensures that expired changes are deleted in batches, keeping recent changes and the latest change."""
+        DataObjectChange.record(DataObjectChange.UPDATED, [("old-{}".format(i), "agent") for i in range(5)])
+        DataObjectChange.record(DataObjectChange.CREATED, [("new-{}".format(i), "agent") for i in range(3)])
+        DataObjectChange.objects.filter(es_id__startswith="old").update(timestamp=timezone.now() - timedelta(days=31))
+        with self.settings(CHANGES_RETENTION_DAYS=30, CHANGES_CLEANUP_BATCH_SIZE=2):
+            self.assertEqual(CleanUpChanges().do(), 5)
+        self.assertEqual(
+            sorted(DataObjectChange.objects.values_list("es_id", flat=True)), ["new-0", "new-1", "new-2"])
+
+        DataObjectChange.objects.update(timestamp=timezone.now() - timedelta(days=31))
+        latest = DataObjectChange.objects.order_by("sequence").last()
+        with self.settings(CHANGES_RETENTION_DAYS=30):
+            self.assertEqual(CleanUpChanges().do(), 2)
+        self.assertEqual(list(DataObjectChange.objects.all()), [latest], "The latest change was not kept.")
+        DataObjectChange.objects.all().delete()
+        self.assertEqual(CleanUpChanges().do(), 0)
+
+    def test_benchmark(self):
+        """Ensure the transformer benchmark reports results without writing to the database."""
+        out = StringIO()
+        call_command("benchmark_transformer", size=2, object_types=["subject", "resource"], stdout=out)
+        results = json.loads(out.getvalue())
+        self.assertEqual(set(results["object_types"]), {"subject", "resource"})
+        for result in results["object_types"].values():
+            self.assertEqual(result["records"], 2)
+            self.assertEqual(result["errors"], 0)
+            self.assertEqual(
+                set(result["stages"]),
+                {"decode", "map", "serialize", "strip", "validate", "persist"})
+        self.assertEqual(DataObject.objects.count(), 0)
+
+    def test_lookups(self):
+        """Ensure precomputed lookups match the configured choices and refs."""
+        for value, _ in NOTE_TYPE_CHOICES:
+            self.assertEqual(NOTE_TYPE_TITLES[value], [v[1] for v in NOTE_TYPE_CHOICES if v[0] == value][0])
+        for refs, format in FORMAT_REFS:
+            for ref in refs:
+                self.assertIn(format, formats_for_refs({ref, "/subjects/0"}))
+        self.assertEqual(formats_for_refs(set()), [])
+
+    @skipUnless(connection.vendor == "postgresql", "Query plans are only checked on PostgreSQL")
+    def test_query_plans(self):
+        """Ensures that the planner picks the intended indexes for indexer and online asset queries.
+
+        The table is filled with enough objects for sequential scans to be
+        costed realistically: most objects are indexed, and there are more
+        pending objects than a sweep checks.
+        """
+        now = timezone.now()
+        object_types = ["agent", "collection", "object", "term"]
+        DataObject.objects.bulk_create([
+            DataObject(
+                es_id="plan-{}".format(i),
+                object_type=object_types[i % 4],
+                data={},
+                indexed=i % 20 != 0,
+                online_pending=i % 10 == 0,
+                online_pending_since=now - timedelta(days=i % 60) if i % 200 == 0 else None,
+                online_checked=now - timedelta(days=i % 45) if i % 300 == 0 else None)
+            for i in range(20000)], batch_size=2000)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE transformer_dataobject")
+        page_size = settings.OBJECTS_PAGE_SIZE
+        for queryset, index in [
+                (DataObject.objects.filter(object_type="agent", indexed=False).order_by("last_modified", "es_id")[:page_size],
+                 "dataobject_unindexed_type_idx"),
+                (DataObject.objects.filter(indexed=False).order_by("last_modified", "es_id")[:page_size],
+                 "dataobject_unindexed_idx"),
+                (DataObject.objects.filter(object_type="agent").order_by("last_modified", "es_id")[:page_size],
+                 "dataobject_type_modified_idx")]:
+            plan = queryset.explain()
+            self.assertIn(index, plan, "{} was not used: {}".format(index, plan))
+        plan = CheckMissingOnlineAssets().get_due_objects(now)[:100].explain()
+        self.assertIn("dataobject_pending_checked_idx", plan, "dataobject_pending_checked_idx was not used: {}".format(plan))
+        self.assertNotIn("Sort", plan, "Expected due objects to be returned in index order: {}".format(plan))
 
     def test_ping(self):
         response = self.client.get(reverse('ping'))
@@ -260,3 +655,5 @@ class TransformerTest(TestCase):
     def test_strip_tags(self):
         for input in ["<title>a collection</title>", "a <a href='https://example.com'>collection</a>", "a collection"]:
             self.assertEqual('a collection', strip_tags(input))
+        for input in ["a &amp; b", "a <emph>collection", "line\r\nbreak", "plain text", "<p>{}</p>".format("a" * 300)]:
+            self.assertEqual(parse_tags(input), strip_tags(input))
@@ -0,0 +1,39 @@
+import re
+import xml.etree.ElementTree as ET
+from functools import lru_cache
+
+TAG_PATTERN = re.compile(r'<[/\w][^>]+>')
+# Characters which XML parsing can remove or change.
+MARKUP_CHARACTERS = ("<", "&", "\r")
+MEMOIZE_MAX_LENGTH = 256
+
+
+def has_markup(user_string):
+    """Returns a boolean indicating whether a string needs to be parsed to remove tags."""
+    return not isinstance(user_string, str) or any(c in user_string for c in MARKUP_CHARACTERS)
+
+
+def parse_tags(user_string):
+    """Removes tags from a string by parsing it as XML, falling back to a regex."""
+    try:
+        xmldoc = ET.fromstring(f'<xml>{user_string}</xml>')
+        return ''.join(xmldoc.itertext())
+    except ET.ParseError:
+        return TAG_PATTERN.sub('', user_string)
+
+
+cached_parse_tags = lru_cache(maxsize=4096)(parse_tags)
+
+
+def strip_tags(user_string):
+    """Strips XML and HTML tags from a string.
+
+    Strings without markup are returned as-is without being parsed. Results
+    for short strings, such as titles repeated across many child records, are
+    memoized.
+    """
+    if not has_markup(user_string):
+        return user_string
+    if isinstance(user_string, str) and len(user_string) <= MEMOIZE_MAX_LENGTH:
+        return cached_parse_tags(user_string)
+    return parse_tags(user_string)
@@ -1,15 +1,20 @@
 import json
+from contextlib import nullcontext
 
+from django.db import transaction
+from django.utils import timezone
 from jsonschema.exceptions import ValidationError
 from odin.codecs import json_codec
 from rac_schemas import is_valid
 
+from fetcher.tracing import span, traced
+
 from .mappings import (SourceAgentCorporateEntityToAgent,
                        SourceAgentFamilyToAgent, SourceAgentPersonToAgent,
                        SourceArchivalObjectToCollection,
                        SourceArchivalObjectToObject,
                        SourceResourceToCollection, SourceSubjectToTerm)
-from .models import DataObject
+from .models import DataObject, DataObjectChange
 from .resources.source import (SourceAgentCorporateEntity, SourceAgentFamily,
                                SourceAgentPerson, SourceArchivalObject,
                                SourceResource, SourceSubject)
@@ -29,23 +34,40 @@ class Transformer:
     Args:
         object_type (str): the object type of the source data.
         data (dict): the source data to be transformed.
+        timer (callable): optional callable which takes a stage name and returns
+            a context manager used to time that stage.
     """
 
+    def __init__(self, timer=None):
+        self.timer = timer
+
     def run(self, object_type, data):
         try:
             self.identifier = data.get("uri")
-            from_resource, mapping, schema = self.get_mapping_classes(object_type)
-            transformed = self.get_transformed_object(data, from_resource, mapping)
-            online_pending = self.get_online_pending(
-                data.get("instances", []), transformed.get("online", False))
-            is_valid(transformed, schema)
-            self.save_validated(transformed, online_pending)
-            return transformed
+            with span("Transformer.run", uri=self.identifier, object_type=object_type):
+                from_resource, mapping, schema = self.get_mapping_classes(object_type)
+                transformed = self.get_transformed_object(data, from_resource, mapping)
+                online_pending = self.get_online_pending(
+                    data.get("instances", []), transformed.get("online", False))
+                with self.time("validate"):
+                    is_valid(transformed, schema)
+                with self.time("persist"):
+                    self.save_validated(transformed, online_pending)
+                return transformed
         except ValidationError as e:
             raise TransformError("Transformed data is invalid: {}".format(e))
         except Exception as e:
             raise TransformError("Error transforming {} {}: {}".format(object_type, self.identifier, str(e)))
 
+    def time(self, stage):
+        """Returns a context manager which times a stage of the transformation.
+
+        Args:
+            stage (str): name of the stage, one of `decode`, `map`, `serialize`,
+                `strip`, `validate` or `persist`.
+        """
+        return self.timer(stage) if self.timer else nullcontext()
+
     def get_mapping_classes(self, object_type):
         TYPE_MAP = {
             "agent_person": (SourceAgentPerson, SourceAgentPersonToAgent, "agent.json"),
@@ -73,9 +95,14 @@ class Transformer:
         return False
 
     def get_transformed_object(self, data, from_resource, mapping):
-        from_obj = json_codec.loads(json.dumps(data), resource=from_resource)
-        transformed = json.loads(json_codec.dumps(mapping.apply(from_obj)))
-        return self.remove_keys_from_dict(transformed)
+        with self.time("decode"):
+            from_obj = json_codec.loads(json.dumps(data), resource=from_resource)
+        with self.time("map"):
+            mapped = mapping.apply(from_obj)
+        with self.time("serialize"):
+            transformed = json.loads(json_codec.dumps(mapped))
+        with self.time("strip"):
+            return self.remove_keys_from_dict(transformed)
 
     def remove_keys_from_dict(self, data, target_key="$"):
         """Removes all matching keys from dict."""
@@ -93,18 +120,27 @@ class Transformer:
             return data
         return modified_dict
 
+    @traced
     def save_validated(self, data, online_pending):
         es_id = data["uri"].split("/")[-1]
-        try:
-            existing = DataObject.objects.get(es_id=es_id)
-            existing.data = data
-            existing.indexed = False
-            existing.online_pending = online_pending
-            existing.save()
-        except DataObject.DoesNotExist:
-            DataObject.objects.create(
-                es_id=es_id,
-                object_type=data["type"],
-                data=data,
-                indexed=False,
-                online_pending=online_pending)
+        with transaction.atomic():
+            try:
+                existing = DataObject.objects.get(es_id=es_id)
+                existing.data = data
+                existing.indexed = False
+                if not online_pending:
+                    existing.online_pending_since = None
+                elif not existing.online_pending:
+                    existing.online_pending_since = timezone.now()
+                existing.online_pending = online_pending
+                existing.save()
+                DataObjectChange.record(DataObjectChange.UPDATED, [(es_id, existing.object_type)])
+            except DataObject.DoesNotExist:
+                DataObject.objects.create(
+                    es_id=es_id,
+                    object_type=data["type"],
+                    data=data,
+                    indexed=False,
+                    online_pending=online_pending,
+                    online_pending_since=timezone.now() if online_pending else None)
+                DataObjectChange.record(DataObjectChange.CREATED, [(es_id, data["type"])])
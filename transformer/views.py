@@ -1,19 +1,47 @@
+from datetime import timedelta
+
 from asterism.views import BaseServiceView
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
-from rest_framework.viewsets import ModelViewSet
+from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
+
+from fetcher.helpers import identifier_from_uri, iter_chunks
+from pisces.metrics import INDEX_ACKNOWLEDGEMENTS
 
-from .models import DataObject
-from .serializers import DataObjectListSerializer, DataObjectSerializer
+from .helpers import (IdentifierListParser, NDJSONRenderer, batch_chunks,
+                      conditional_response, data_etag, gzip_chunks,
+                      ndjson_chunks, parse_datetime_param, set_validators)
+from .models import DataObject, DataObjectChange
+from .pagination import DataObjectPagination, SequencePagination
+from .serializers import (ClaimedDataObjectSerializer,
+                          DataObjectChangeSerializer, DataObjectListSerializer,
+                          DataObjectSerializer)
 
 
 class DataObjectViewSet(ModelViewSet):
+    """Lists and edits DataObjects.
+
+    Creates, updates and deletes are recorded as DataObjectChanges in the same
+    transaction, so they can be followed in the change feed.
+    """
     model = DataObject
+    pagination_class = DataObjectPagination
 
     def get_queryset(self):
-        queryset = DataObject.objects.all().order_by("last_modified")
+        queryset = DataObject.objects.all().order_by("last_modified", "es_id")
         if (self.request.GET.get("clean", "").lower() != "true") and (self.action == "list"):
-            queryset = queryset.exclude(indexed=True)
+            queryset = queryset.filter(indexed=False)
+        if self.action == "retrieve":
+            queryset = queryset.defer("data")
         return queryset
 
     def get_serializer_class(self):
@@ -21,19 +49,54 @@ class DataObjectViewSet(ModelViewSet):
             return DataObjectListSerializer
         return DataObjectSerializer
 
-    def get_action_response(self, request, object_type):
-        queryset = self.get_action_queryset(request, object_type)
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            instance = serializer.save()
+            DataObjectChange.record(DataObjectChange.CREATED, [(instance.es_id, instance.object_type)])
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            instance = serializer.save()
+            DataObjectChange.record(DataObjectChange.UPDATED, [(instance.es_id, instance.object_type)])
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            DataObjectChange.record(DataObjectChange.DELETED, [(instance.es_id, instance.object_type)])
+            instance.delete()
+
+    def retrieve(self, request, *args, **kwargs):
+        """Returns a DataObject, or a 304 response if the client's copy is current.
+
+        The object's data is only loaded if a full response is needed.
+        """
+        instance = self.get_object()
+        not_modified = conditional_response(request, instance.etag, instance.last_modified)
+        if not_modified:
+            return not_modified
+        serializer = self.get_serializer(instance)
+        return set_validators(Response(serializer.data), instance.etag, instance.last_modified)
+
+    def list(self, request, *args, **kwargs):
+        return self.get_list_response(request, self.filter_queryset(self.get_queryset()))
+
+    def get_list_response(self, request, queryset):
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+            response = self.get_paginated_response(serializer.data)
+        else:
+            serializer = self.get_serializer(queryset, many=True)
+            response = Response(serializer.data)
+        etag = data_etag(response.data)
+        return conditional_response(request, etag) or set_validators(response, etag)
+
+    def get_action_response(self, request, object_type):
+        return self.get_list_response(request, self.get_action_queryset(request, object_type))
 
     def get_action_queryset(self, request, object_type):
-        queryset = DataObject.objects.filter(object_type=object_type).order_by("last_modified")
+        queryset = DataObject.objects.filter(object_type=object_type).order_by("last_modified", "es_id")
         if (request.GET.get("clean", "").lower() != "true"):
-            queryset = queryset.exclude(indexed=True)
+            queryset = queryset.filter(indexed=False)
         return queryset
 
     @action(detail=False)
@@ -52,30 +115,176 @@ class DataObjectViewSet(ModelViewSet):
     def terms(self, request):
         return self.get_action_response(request, "term")
 
+    @action(detail=False, methods=["post"])
+    def claim(self, request):
+        """Leases a batch of unindexed DataObjects to a consumer.
+
+        Objects are leased for ttl seconds (CLAIM_TTL by default) and are not
+        returned by other claims until they are acknowledged via index-complete
+        or the lease expires. Rows locked by concurrent claims are skipped.
+        """
+        consumer = request.data.get("consumer")
+        if not consumer:
+            raise ValidationError({"consumer": "A consumer identifier is required."})
+        try:
+            limit = min(int(request.data.get("limit", settings.OBJECTS_PAGE_SIZE)), settings.OBJECTS_MAX_PAGE_SIZE)
+            ttl = int(request.data.get("ttl", settings.CLAIM_TTL))
+        except (TypeError, ValueError):
+            raise ValidationError("limit and ttl must be integers.")
+        if limit < 1 or ttl < 1:
+            raise ValidationError("limit and ttl must be positive.")
+        object_type = request.data.get("object_type")
+        now = timezone.now()
+        claim_expires = now + timedelta(seconds=ttl)
+        with transaction.atomic():
+            queryset = DataObject.objects.filter(
+                Q(claim_expires__isnull=True) | Q(claim_expires__lte=now), indexed=False)
+            if object_type:
+                queryset = queryset.filter(object_type=object_type)
+            es_ids = list(
+                queryset.order_by("last_modified", "es_id").select_for_update(skip_locked=True).values_list(
+                    "es_id", flat=True)[:limit])
+            DataObject.objects.filter(es_id__in=es_ids).update(claimed_by=consumer, claim_expires=claim_expires)
+        claimed = DataObject.objects.filter(es_id__in=es_ids).order_by("last_modified", "es_id")
+        return Response({
+            "claimed_by": consumer,
+            "claim_expires": claim_expires,
+            "results": ClaimedDataObjectSerializer(claimed, many=True).data})
+
+    @action(detail=False, methods=["post"])
+    def batch(self, request):
+        """Returns DataObjects matching a list of identifiers or source URIs.
+
+        Accepts `identifiers`, a list of es_ids, and `uris`, a list of source
+        record URIs, in total no more than BATCH_MAX_SIZE. Objects are streamed
+        in a JSON object as `results`, followed by a list of `missing`
+        identifiers and URIs, as they were submitted, for which no object was
+        found.
+        """
+        if not isinstance(request.data, dict):
+            raise ValidationError("Expected a JSON object with identifiers and/or uris.")
+        identifiers = request.data.get("identifiers", [])
+        uris = request.data.get("uris", [])
+        for name, values in [("identifiers", identifiers), ("uris", uris)]:
+            if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+                raise ValidationError({name: "Expected a list of strings."})
+        requested = {}
+        for es_id, submitted in [(i, i) for i in identifiers] + [(identifier_from_uri(uri), uri) for uri in uris]:
+            requested.setdefault(es_id, submitted)
+        if not requested:
+            raise ValidationError("No object identifiers were found.")
+        if len(requested) > settings.BATCH_MAX_SIZE:
+            raise ValidationError("At most {} objects can be requested at once.".format(settings.BATCH_MAX_SIZE))
+        queryset = DataObject.objects.filter(es_id__in=list(requested))
+        return StreamingHttpResponse(
+            batch_chunks(queryset, requested, settings.EXPORT_CHUNK_SIZE),
+            content_type="application/json")
+
+    def get_export_queryset(self, request):
+        object_type = request.GET.get("object_type")
+        if object_type:
+            if object_type not in [t[0] for t in DataObject.TYPE_CHOICES]:
+                raise ValidationError({"object_type": "Unrecognized object type {}".format(object_type)})
+            queryset = self.get_action_queryset(request, object_type)
+        else:
+            queryset = DataObject.objects.all().order_by("last_modified", "es_id")
+            if (request.GET.get("clean", "").lower() != "true"):
+                queryset = queryset.filter(indexed=False)
+        if request.GET.get("modified_since"):
+            queryset = queryset.filter(
+                last_modified__gte=parse_datetime_param(request.GET["modified_since"], "modified_since"))
+        if request.GET.get("modified_before"):
+            queryset = queryset.filter(
+                last_modified__lt=parse_datetime_param(request.GET["modified_before"], "modified_before"))
+        return queryset
+
+    @action(detail=False, renderer_classes=[NDJSONRenderer, JSONRenderer])
+    def export(self, request):
+        """Streams DataObjects as newline-delimited JSON.
+
+        Accepts the clean parameter, an object_type, and a last_modified range
+        using modified_since and modified_before. The stream is gzipped for
+        clients which accept it.
+        """
+        content = ndjson_chunks(self.get_export_queryset(request), settings.EXPORT_CHUNK_SIZE)
+        compress = "gzip" in request.META.get("HTTP_ACCEPT_ENCODING", "")
+        response = StreamingHttpResponse(
+            gzip_chunks(content) if compress else content,
+            content_type=NDJSONRenderer.media_type)
+        if compress:
+            response["Content-Encoding"] = "gzip"
+        patch_vary_headers(response, ("Accept-Encoding",))
+        return response
+
+
+class DataObjectChangeViewSet(ReadOnlyModelViewSet):
+    """Lists changes to DataObjects in sequence order.
+
+    Pass the last sequence number seen as `since` to get subsequent changes.
+    The most recent CHANGES_SETTLE_SECONDS of changes are withheld, so that
+    changes from transactions which commit out of sequence order are not
+    skipped. Changes older than CHANGES_RETENTION_DAYS are deleted by
+    CleanUpChanges, so consumers which fall further behind must re-sync.
+    """
+    model = DataObjectChange
+    serializer_class = DataObjectChangeSerializer
+    pagination_class = SequencePagination
+
+    def get_queryset(self):
+        queryset = DataObjectChange.objects.all().order_by("sequence")
+        if self.action == "list" and settings.CHANGES_SETTLE_SECONDS:
+            queryset = queryset.filter(
+                timestamp__lte=timezone.now() - timedelta(seconds=settings.CHANGES_SETTLE_SECONDS))
+        return queryset
+
 
 class DataObjectUpdateByIdView(BaseServiceView):
     """Updates DataObjects after they have been indexed.
 
-    Finds a DataObject by its es_id field and sets indexed to True.
+    Finds DataObjects by their es_id field and either sets indexed to True,
+    releasing any claim on them, or deletes them. Identifiers can be posted as
+    a JSON list, or as a plain text body with one identifier per line and the
+    action as a query parameter. Marking objects as indexed does not change
+    their last_modified time, which only tracks changes to their content.
+
+    Objects leased by a claim are only marked as indexed by the consumer which
+    holds the lease, passed as `consumer`, or once the lease has expired. The
+    es_ids of objects which were not marked as indexed because another
+    consumer holds their lease are returned as `not_acknowledged`.
     """
+    parser_classes = [JSONParser, IdentifierListParser]
+
+    def post(self, request, *args, **kwargs):
+        self.not_acknowledged = []
+        response = super().post(request, *args, **kwargs)
+        if response.status_code == 200 and isinstance(response.data, dict):
+            response.data["not_acknowledged"] = self.not_acknowledged
+        return response
 
     def get_service_response(self, request):
-        identifiers = request.data.get("identifiers")
-        action = request.data.get("action")
-        msg = "No object identifiers were found."
+        identifiers = request.data.get("identifiers") or []
+        action = request.data.get("action", request.query_params.get("action"))
+        consumer = request.data.get("consumer", request.query_params.get("consumer"))
         if action not in ["deleted", "indexed"]:
             raise Exception("Unrecognized action {}, expecting either `deleted` or `indexed`".format(action))
-        obj_list = DataObject.objects.filter(es_id__in=identifiers)
-        if action == "indexed":
-            for obj in obj_list:
-                obj.indexed = True
-            DataObject.objects.bulk_update(obj_list, ["indexed"])
-        else:
-            for obj in obj_list:
-                try:
-                    obj.delete()
-                except DataObject.DoesNotExist:
-                    pass
-        msg = "{} objects {}.".format(
-            len(obj_list), "marked as indexed." if action == "indexed" else "deleted")
-        return msg
+        received = 0
+        count = 0
+        for chunk in iter_chunks(identifiers, settings.INDEX_COMPLETE_CHUNK_SIZE):
+            received += len(chunk)
+            obj_list = DataObject.objects.filter(es_id__in=set(chunk))
+            if action == "indexed":
+                acknowledgeable = Q(claimed_by__isnull=True) | Q(claim_expires__lte=timezone.now())
+                if consumer:
+                    acknowledgeable |= Q(claimed_by=consumer)
+                self.not_acknowledged += list(obj_list.exclude(acknowledgeable).values_list("es_id", flat=True))
+                count += obj_list.filter(acknowledgeable).update(
+                    indexed=True, claimed_by=None, claim_expires=None)
+            else:
+                with transaction.atomic():
+                    deleted = list(obj_list.select_for_update().values_list("es_id", "object_type"))
+                    count += DataObject.objects.filter(es_id__in=[es_id for es_id, _ in deleted]).delete()[0]
+                    DataObjectChange.record(DataObjectChange.DELETED, deleted)
+        INDEX_ACKNOWLEDGEMENTS.labels(action).inc(count)
+        if not received:
+            return "No object identifiers were found."
+        return "{} objects {}.".format(count, "marked as indexed" if action == "indexed" else "deleted")